@@ -0,0 +1,220 @@
+import io
+import time
+import logging
+import threading
+import xml.etree.ElementTree as ET
+
+
+class _PendingLookup:
+    def __init__(self, oclc_number):
+        self.oclc_number = oclc_number
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class AvailabilityCoalescer:
+    """
+    Groups concurrent availability lookups so each SRU request serves every waiting scan.
+
+    - Scans for an OCLC number that is already being fetched wait for that request
+      instead of sending their own (e.g. several copies of one title scanned together).
+    - With a `window` > 0 the first caller waits that many seconds to collect other OCLC
+      numbers and fetches up to `max_batch` of them with one multi-number OR query.
+
+    `fetch(oclc_numbers)` must return the raw SRU response covering all given numbers.
+    """
+
+    def __init__(self, fetch, window=0.0, max_batch=10):
+        self.fetch = fetch
+        self.window = window
+        self.max_batch = max(1, max_batch)
+
+        self._lock = threading.Lock()
+        self._in_flight = {}  # oclc number -> _PendingLookup
+        self._open_batch = None  # batch still accepting numbers during the window
+
+        self.lookups = 0
+        self.requests = 0
+        self.coalesced = 0
+        self.batched = 0
+
+    def get(self, oclc_number):
+        """
+        Return the SRU response for `oclc_number`, sharing any request already in flight.
+        """
+        batch = None
+        with self._lock:
+            self.lookups += 1
+            entry = self._in_flight.get(oclc_number)
+            if entry is not None:
+                self.coalesced += 1
+            else:
+                entry = _PendingLookup(oclc_number)
+                self._in_flight[oclc_number] = entry
+                if self._open_batch is not None and len(self._open_batch) < self.max_batch:
+                    self._open_batch.append(entry)
+                    self.batched += 1
+                else:
+                    batch = [entry]
+                    if self.window > 0 and self.max_batch > 1:
+                        self._open_batch = batch
+
+        if batch is not None:
+            self._run_batch(batch)
+
+        entry.done.wait()
+        if entry.error is not None:
+            raise entry.error
+        return entry.result
+
+    def _run_batch(self, batch):
+        if self.window > 0 and self.max_batch > 1:
+            time.sleep(self.window)
+            with self._lock:
+                if self._open_batch is batch:
+                    self._open_batch = None
+
+        numbers = [entry.oclc_number for entry in batch]
+        if len(numbers) > 1:
+            logging.debug(f"Fetching availability for {len(numbers)} OCLC numbers in one request")
+        result = error = None
+        try:
+            with self._lock:
+                self.requests += 1
+            result = self.fetch(numbers)
+        except Exception as e:
+            error = e
+        finally:
+            with self._lock:
+                for entry in batch:
+                    self._in_flight.pop(entry.oclc_number, None)
+            for entry in batch:
+                entry.result = result
+                entry.error = error
+                entry.done.set()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "lookups": self.lookups,
+                "requests": self.requests,
+                "coalesced": self.coalesced,
+                "batched": self.batched,
+                "requests_saved": self.lookups - self.requests,
+            }
+
+
+CHECKED_OUT_REASONS = ("ON_LOAN", "OVERDUE", "LONG_OVERDUE")
+
+
+def index_availability(xml_response, barcodes):
+    """
+    Build a barcode -> circulation status index from an SRU availability response in one pass.
+
+    The response is streamed with iterparse; each holding is inspected when it has been
+    read completely and then cleared, so memory stays flat for records with thousands of
+    holdings. Parsing stops once every requested barcode has been found and the title and
+    author of its record have been read.
+
+    Returns (index, holdings_seen). Raises ET.ParseError on malformed XML.
+    """
+    if isinstance(xml_response, str):
+        xml_response = xml_response.encode("utf-8")
+    wanted = set(barcodes)
+    index = {}
+    holdings_seen = False
+    record_found = []  # statuses found in the current opacRecord, waiting for its bib fields
+    bib = None
+
+    def finish_record():
+        for status in record_found:
+            status["title"], status["author"] = bib or ("Unknown Title", "Unknown Author")
+            status["hasBibRecord"] = bib is not None
+        record_found.clear()
+
+    for _, elem in ET.iterparse(io.BytesIO(xml_response)):
+        tag = elem.tag
+        if tag == "holding":
+            holdings_seen = True
+            for circulation in elem.iter("circulation"):
+                # Element.iter runs in C; ElementPath lookups are only used for the matching item
+                item_id = next(circulation.iter("itemId"), None)
+                item_id = item_id.text if item_id is not None else None
+                if item_id in wanted and item_id not in index:
+                    status = _circulation_status(item_id, circulation)
+                    call_number = elem.find(".//callNumber")
+                    status["callNumber"] = call_number.text if call_number is not None else "N/A"
+                    index[item_id] = status
+                    record_found.append(status)
+            elem.clear()
+            if len(index) == len(wanted) and bib is not None:
+                finish_record()
+                break
+        elif tag == "bibliographicRecord":
+            bib = _bib_fields(elem)
+            elem.clear()
+        elif tag == "opacRecord":
+            finish_record()
+            bib = None
+            elem.clear()
+
+    return index, holdings_seen
+
+
+def _bib_fields(bibliographic_record):
+    title_field = bibliographic_record.find("record/datafield[@tag='245']/subfield[@code='a']")
+    title = title_field.text if title_field is not None else "Unknown Title"
+
+    author_field = bibliographic_record.find("record/datafield[@tag='100']/subfield[@code='a']")
+    if author_field is None:
+        author_field = bibliographic_record.find("record/datafield[@tag='700']/subfield[@code='a']")
+    author = author_field.text if author_field is not None else "Unknown Author"
+    return title, author
+
+
+def _circulation_status(item_id, circulation):
+    if circulation.find(".//availableNow[@value='1']") is not None:
+        status = "Available"
+        reason = None
+        availability_date = None
+    else:
+        status = "Unavailable"
+        reason = circulation.findtext(".//reasonUnavailable") or "No reason"
+        availability_date = circulation.findtext(".//availabilityDate") or "N/A"
+    return {
+        "barcode": item_id,
+        "title": "Unknown Title",
+        "author": "Unknown Author",
+        "callNumber": "N/A",
+        "status": status,
+        "availabilityDate": availability_date,
+        "reasonUnavailable": reason,
+        # Check if the item is currently checked out or overdue
+        "checkedOut": reason in CHECKED_OUT_REASONS,
+        # False when the response had no bibliographic record (e.g. a holdings-only schema)
+        "hasBibRecord": False,
+    }
+
+
+def parse_availability(xml_response, item_barcode, bib=None):
+    """
+    Extract the circulation state for one barcode from an SRU availability response.
+    If cached bibliographic fields are passed in `bib`, they replace the parsed title/author.
+    """
+    try:
+        index, holdings_seen = index_availability(xml_response, [item_barcode])
+        if not holdings_seen:
+            return {"error": "No holdings found in XML response."}
+        status = index.get(item_barcode)
+        if status is None:
+            return {"error": "Item barcode not found in holdings"}
+        if bib:
+            status["title"] = bib.get("title", "Unknown Title")
+            status["author"] = bib.get("author", "Unknown Author")
+        return status
+
+    except ET.ParseError as e:
+        return {"error": f"Failed to parse XML: {str(e)}"}
+    except Exception as e:
+        return {"error": f"Unexpected error: {str(e)}"}
@@ -0,0 +1,191 @@
+"""
+Benchmarks for the check-in pipeline. They do not need OCLC credentials.
+
+    python benchmark.py parse                 # SRU availability parser, 10 / 1k / 10k holdings
+    python benchmark.py parse --sizes 100 50000
+    python benchmark.py pipeline              # end to end against mock_oclc.py at 1 / 4 / 8 / 16 scans in flight
+    python benchmark.py pipeline --latency-ms 150 --jitter-ms 100 --error-rate 0.02 --throttle-rate 0.01
+    python benchmark.py pipeline --strategy optimistic --checked-out 0.9
+
+The pipeline benchmark keeps the caches and journal in a temporary directory, so the real
+ones are left untouched.
+"""
+import sys
+import time
+import random
+import logging
+import argparse
+import tempfile
+import tracemalloc
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+
+from availability import parse_availability
+from mock_oclc import MockCatalog, MockOCLCServer, build_sru_response, CREDENTIALS
+from holdings_index import build_index
+from pipeline import CheckInPipeline, HOLDINGS_INDEX_FILE
+
+
+def dom_parse_availability(xml_response, item_barcode):
+    """
+    The previous parser (ET.fromstring + nested findall), kept here as the benchmark baseline.
+    """
+    root = ET.fromstring(xml_response)
+    namespaces = {"srw": "http://www.loc.gov/zing/srw/"}
+    for holding in root.findall(".//srw:recordData/opacRecord/holdings/holding", namespaces):
+        for circulation in holding.findall(".//circulations/circulation"):
+            item_id = circulation.find(".//itemId")
+            if item_id is not None and item_id.text == item_barcode:
+                root.find(".//bibliographicRecord/record/datafield[@tag='245']/subfield[@code='a']")
+                root.find(".//bibliographicRecord/record/datafield[@tag='100']/subfield[@code='a']")
+                holding.find(".//callNumber")
+                return item_id.text
+    return None
+
+
+def time_call(func, *args, repeat=5):
+    """
+    Best wall time of `repeat` calls and the peak memory allocated during one call.
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - started)
+    tracemalloc.start()
+    func(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return best, peak
+
+
+def bench_parse(sizes, repeat):
+    print(f"{'holdings':>9} {'target':>7} {'size':>9} {'dom ms':>9} {'dom peak':>10} "
+          f"{'stream ms':>10} {'stream peak':>12}")
+    for size in sizes:
+        xml_bytes = build_sru_response(size).encode("utf-8")
+        for label, position in (("first", 0), ("middle", size // 2), ("last", size - 1)):
+            barcode = f"3900000{position:07d}"
+            assert parse_availability(xml_bytes, barcode)["barcode"] == barcode
+            dom_time, dom_peak = time_call(dom_parse_availability, xml_bytes, barcode, repeat=repeat)
+            stream_time, stream_peak = time_call(parse_availability, xml_bytes, barcode, repeat=repeat)
+            print(f"{size:>9} {label:>7} {len(xml_bytes) // 1024:>7}KB {dom_time * 1000:>9.2f} "
+                  f"{dom_peak // 1024:>8}KB {stream_time * 1000:>10.2f} {stream_peak // 1024:>10}KB")
+
+
+def percentile(samples, q):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(q * len(samples)))] if samples else 0.0
+
+
+def bench_pipeline(args):
+    catalog = MockCatalog(args.titles, args.copies, args.checked_out)
+    server = MockOCLCServer(
+        catalog, latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate, retry_after=args.retry_after,
+        quota=args.quota, compress=not args.no_compression, seed=1,
+    ).start()
+    config = dict(CREDENTIALS, **server.config(), checkin_strategy=args.strategy)
+    if args.rate_limit:
+        config["rate_limits"] = dict.fromkeys(("discovery", "availability", "ncip", "usages"), args.rate_limit)
+    config["adaptive_concurrency"] = not args.no_adaptive
+    logging.getLogger().setLevel(logging.WARNING)
+    scans = min(args.scans, len(catalog.barcodes))
+    # Random order, like real returns; copies of one title are rarely scanned back to back
+    barcodes = random.Random(7).sample(catalog.barcodes, scans)
+    print(f"Mock OCLC at {server.url}: {args.latency_ms:g}+{args.jitter_ms:g} ms latency, "
+          f"{args.error_rate:.1%} errors, {args.throttle_rate:.1%} throttled; {scans} scans per level, "
+          f"{args.strategy} strategy")
+    print(f"{'in flight':>9} {'scans/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+          f"{'errors':>7} {'queued':>7} {'requests':>9} {'retries':>8} {'throttled':>9} {'min limit':>9} {'KB/scan':>8}")
+    try:
+        for concurrency in args.concurrency:
+            catalog.reset()
+            server.requests.clear()
+            with tempfile.TemporaryDirectory() as work_dir:
+                if args.holdings_index:
+                    # As after --import-holdings: Discovery is never needed
+                    build_index(f"{work_dir}/{HOLDINGS_INDEX_FILE}", (
+                        (barcode, catalog.oclc_number(barcode), "") for barcode in catalog.barcodes
+                        ))
+                pipeline = CheckInPipeline(config, work_dir, pool_size=concurrency)
+                if args.warm_cache:
+                    # As on a station that has seen these titles before: only live state is fetched
+                    for barcode in barcodes:
+                        oclc_number = catalog.oclc_number(barcode)
+                        pipeline.oclc_cache.put(barcode, oclc_number)
+                        pipeline.bib_cache.put(oclc_number, {
+                            "title": "Cached title", "author": "Cached author", "callNumber": "PS3500 .C1",
+                        })
+
+                def run_one(barcode):
+                    started = time.perf_counter()
+                    outcome = pipeline.process(barcode)
+                    return time.perf_counter() - started, outcome
+
+                started = time.perf_counter()
+                with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                    results = list(executor.map(run_one, barcodes))
+                elapsed = time.perf_counter() - started
+
+                latencies = [latency for latency, _ in results]
+                errors = sum(1 for _, outcome in results if outcome["is_error"] or outcome["status"] is None)
+                queued = pipeline.journal.queued_count()
+                stats = [stage.stats() for stage in pipeline.stages.values() if stage.calls]
+                retries = sum(stage["retries"] for stage in stats)
+                throttled = sum(stage["throttled"] for stage in stats)
+                # Lowest adaptive concurrency limit any endpoint ended at
+                limit = min((stage["concurrency_limit"] or 0 for stage in stats), default=0)
+                kb_per_scan = pipeline.metrics.total("bytes_received_") / 1024 / scans
+                pipeline.close()
+            print(f"{concurrency:>9} {scans / elapsed:>8.1f} {percentile(latencies, 0.5) * 1000:>8.1f} "
+                  f"{percentile(latencies, 0.95) * 1000:>8.1f} {percentile(latencies, 0.99) * 1000:>8.1f} "
+                  f"{errors:>7} {queued:>7} {sum(server.requests.values()):>9} {retries:>8} {throttled:>9} {limit or '-':>9} {kb_per_scan:>8.2f}")
+    finally:
+        server.stop()
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Check-in pipeline micro-benchmarks")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    parse_cmd = commands.add_parser("parse", help="Benchmark the SRU availability parser")
+    parse_cmd.add_argument("--sizes", type=int, nargs="+", default=[10, 1000, 10000],
+                           help="Number of holdings in each synthetic response")
+    parse_cmd.add_argument("--repeat", type=int, default=5, help="Runs per measurement (best is reported)")
+
+    pipeline_cmd = commands.add_parser("pipeline", help="Benchmark whole scans against the mock OCLC server")
+    pipeline_cmd.add_argument("--scans", type=int, default=300, help="Barcodes scanned per concurrency level")
+    pipeline_cmd.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 8, 16],
+                              help="Numbers of scans in flight to compare")
+    pipeline_cmd.add_argument("--titles", type=int, default=1000, help="Bib records in the mock catalog")
+    pipeline_cmd.add_argument("--copies", type=int, default=3, help="Items per bib record")
+    pipeline_cmd.add_argument("--checked-out", type=float, default=0.5, help="Fraction of items on loan")
+    pipeline_cmd.add_argument("--latency-ms", type=float, default=50, help="Mock server latency per request")
+    pipeline_cmd.add_argument("--jitter-ms", type=float, default=20, help="Random extra latency, up to this much")
+    pipeline_cmd.add_argument("--error-rate", type=float, default=0.0, help="Fraction of HTTP 500 responses")
+    pipeline_cmd.add_argument("--throttle-rate", type=float, default=0.0, help="Fraction of HTTP 429 responses")
+    pipeline_cmd.add_argument("--warm-cache", action="store_true",
+                              help="Pre-fill the OCLC number and title caches for the scanned barcodes")
+    pipeline_cmd.add_argument("--holdings-index", action="store_true",
+                              help="Index every mock barcode first, as after --import-holdings")
+    pipeline_cmd.add_argument("--strategy", choices=["standard", "optimistic", "adaptive"], default="standard",
+                              help="Check-in strategy (see checkin_strategy in the README)")
+    pipeline_cmd.add_argument("--retry-after", type=int, default=1, help="Retry-After seconds sent with HTTP 429")
+    pipeline_cmd.add_argument("--quota", type=int, default=0,
+                              help="Mock requests per second per endpoint before HTTP 429 (0: no quota)")
+    pipeline_cmd.add_argument("--rate-limit", type=float, default=0,
+                              help="Client rate limit per endpoint in requests per second (0: unlimited)")
+    pipeline_cmd.add_argument("--no-compression", action="store_true", help="Mock server never gzips responses")
+    pipeline_cmd.add_argument("--no-adaptive", action="store_true", help="Disable the adaptive concurrency limit")
+
+    args = parser.parse_args(argv)
+    if args.command == "parse":
+        bench_parse(args.sizes, args.repeat)
+    elif args.command == "pipeline":
+        bench_pipeline(args)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
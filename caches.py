@@ -0,0 +1,148 @@
+import time
+import json
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+
+
+class PersistentCache:
+    """
+    Two-tier key/value cache: a small in-memory LRU in front of a bounded SQLite table.
+
+    Values are stored as JSON with an expiry time. A value of None is a negative entry
+    (for example "no holdings found") and normally uses the shorter `negative_ttl`.
+    When the table grows past `max_entries` the least recently used rows are evicted.
+    """
+
+    def __init__(self, db_path, table, ttl, negative_ttl=300, max_entries=100000, memory_entries=2000):
+        self.db_path = db_path
+        self.table = table
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self.memory_entries = memory_entries
+
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()  # key -> (value, expires_at)
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} ("
+            "key TEXT PRIMARY KEY, value TEXT, expires_at REAL, last_access REAL)"
+            )
+        self._conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_last_access ON {table} (last_access)")
+        self._conn.execute(f"DELETE FROM {table} WHERE expires_at <= ?", (time.time(),))
+        self._conn.commit()
+        self._disk_count = self._conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+        logging.debug(f"Cache '{table}' opened at {db_path} with {self._disk_count} entries")
+
+    def lookup(self, key):
+        """
+        Return (found, value). A found negative entry is returned as (True, None).
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if entry[1] > now:
+                    self._memory.move_to_end(key)
+                    self.memory_hits += 1
+                    if entry[0] is None:
+                        self.negative_hits += 1
+                    return True, entry[0]
+                del self._memory[key]
+
+            row = self._conn.execute(
+                f"SELECT value, expires_at FROM {self.table} WHERE key = ?", (key,)
+                ).fetchone()
+            if row is None or row[1] <= now:
+                if row is not None:
+                    self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+                    self._conn.commit()
+                    self._disk_count -= 1
+                self.misses += 1
+                return False, None
+
+            value = json.loads(row[0])
+            self._conn.execute(f"UPDATE {self.table} SET last_access = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self._remember(key, value, row[1])
+            self.disk_hits += 1
+            if value is None:
+                self.negative_hits += 1
+            return True, value
+
+    def put(self, key, value, ttl=None):
+        """
+        Store a value. Passing None stores a negative entry with `negative_ttl`.
+        """
+        if ttl is None:
+            ttl = self.negative_ttl if value is None else self.ttl
+        now = time.time()
+        expires_at = now + ttl
+        encoded = json.dumps(value)
+        with self._lock:
+            self._remember(key, value, expires_at)
+            cursor = self._conn.execute(
+                f"UPDATE {self.table} SET value = ?, expires_at = ?, last_access = ? WHERE key = ?",
+                (encoded, expires_at, now, key)
+                )
+            if cursor.rowcount == 0:
+                self._conn.execute(
+                    f"INSERT INTO {self.table} (key, value, expires_at, last_access) VALUES (?, ?, ?, ?)",
+                    (key, encoded, expires_at, now)
+                    )
+                self._disk_count += 1
+                if self._disk_count > self.max_entries:
+                    self._evict(self._disk_count - self.max_entries)
+            self._conn.commit()
+
+    def invalidate(self, key):
+        with self._lock:
+            self._memory.pop(key, None)
+            cursor = self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+            self._conn.commit()
+            self._disk_count -= cursor.rowcount
+
+    def _remember(self, key, value, expires_at):
+        self._memory[key] = (value, expires_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def _evict(self, count):
+        # Memory hits do not touch last_access, so this is an approximate LRU over the disk tier
+        cursor = self._conn.execute(
+            f"DELETE FROM {self.table} WHERE key IN "
+            f"(SELECT key FROM {self.table} ORDER BY last_access LIMIT ?)", (count,)
+            )
+        self._disk_count -= cursor.rowcount
+        self.evictions += cursor.rowcount
+
+    def stats(self):
+        with self._lock:
+            hits = self.memory_hits + self.disk_hits
+            lookups = hits + self.misses
+            return {
+                "entries": self._disk_count,
+                "memory_entries": len(self._memory),
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "negative_hits": self.negative_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": round(hits / lookups, 4) if lookups else 0.0,
+            }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -1,21 +1,29 @@
+import time
+STARTED_AT = time.perf_counter()  # Startup time is measured from here
 import os
 import sys
+import csv
 import json
+import atexit
 import logging
-import requests
-import ssl
-import time
-import http.client
-import urllib.parse
-import xml.etree.ElementTree as ET
-from logging.handlers import TimedRotatingFileHandler
-from requests.auth import HTTPBasicAuth
-from PyQt5.QtCore import Qt
-from PyQt5.QtGui import QFont, QColor, QPalette, QPixmap, QIcon
+import argparse
+import threading
+from datetime import datetime
+from contextlib import nullcontext
+from PyQt5.QtCore import Qt, QObject, QRunnable, QThreadPool, QTimer, pyqtSignal
+from PyQt5.QtGui import QFont, QColor, QPalette, QPixmap, QIcon, QKeySequence, QCursor
 from PyQt5.QtWidgets import (
     QApplication, QMainWindow, QVBoxLayout, QHBoxLayout, QWidget, QLineEdit,
-    QPushButton, QTableWidget, QTableWidgetItem, QMessageBox, QLabel, QHeaderView, QFrame
+    QPushButton, QTableView, QAbstractItemView, QLabel, QHeaderView, QFrame, QComboBox, QMenu, QShortcut
 )
+from log_setup import init_logging, configure_logging, pending_log_records
+from results_model import ResultRow, ResultsTableModel, StatusFilterProxyModel, PENDING_ACTION
+from notifications import NotificationModel, INFO, WARNING, CRITICAL
+from scan_history import ScanHistory, start_of_day
+from diagnostics import Diagnostics, DIAGNOSTICS_ENV
+from pipeline import CheckInPipeline, HISTORY_FILE, holdings_index_path
+# The OCLC client, resilience, holdings index and service modules (and with them requests,
+# ssl and certifi) are imported where they are first needed, once the window is showing
 
 # Define the log file path
 LOG_DIR = os.path.expanduser("~/.library_checkin")
@@ -23,25 +31,12 @@ if not os.path.exists(LOG_DIR):
     os.makedirs(LOG_DIR)
 
 LOG_FILE = os.path.join(LOG_DIR, "library_checkin.log")
+RESULTS_SPILL_FILE = os.path.join(LOG_DIR, "results_overflow.csv")
+HISTORY_DB = os.path.join(LOG_DIR, HISTORY_FILE)
+DIAGNOSTICS_DIR = os.path.join(LOG_DIR, "diagnostics")
 
-def init_logging():
-    logging.basicConfig(
-        level=logging.DEBUG,  # Set the desired logging level
-        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',  # Log format
-        handlers=[
-            TimedRotatingFileHandler(
-                LOG_FILE,  # File path
-                when="midnight",  # Rotate at midnight
-                interval=1,  # Rotate every day
-                backupCount=14,  # Keep logs for 14 days
-            ),
-            logging.StreamHandler()  # Also log to the console
-        ]
-    )
-    logging.info("Logging initialized. Log file: %s", LOG_FILE)
-
-# Call logging initialization early in the script
-init_logging()
+# Call logging initialization early in the script; config.json settings are applied once loaded
+init_logging(LOG_FILE)
 
 # Get the path to the directory containing the executable or script
 def resource_path(relative_path):
@@ -84,6 +79,70 @@ except json.JSONDecodeError:
     logging.error("Invalid JSON in config.json at: %s", config_path)
     sys.exit(1)
 
+configure_logging(config)
+
+# Opt-in profiler and memory tracking: CHECKIN_DIAGNOSTICS=1, "diagnostics": true or Ctrl+Shift+D
+diagnostics = Diagnostics(
+    DIAGNOSTICS_DIR, interval=config.get("diagnostics_interval", 900),
+    memory_frames=config.get("diagnostics_memory_frames", 10),
+    )
+diagnostics.register_counter("pending_log_records", pending_log_records)
+atexit.register(diagnostics.stop)
+
+
+def build_pipeline(pool_size):
+    """
+    The check-in pipeline with this station's settings, keeping its files in LOG_DIR.
+    """
+    return CheckInPipeline(config, LOG_DIR, pool_size=pool_size, diagnostics=diagnostics)
+
+
+class ScanSignals(QObject):
+    """
+    Signals used by scan workers to hand results back to the GUI thread.
+    """
+    preview = pyqtSignal(int, str, dict)  # scan id, barcode, cached bibliographic fields
+    result = pyqtSignal(int, str, dict, str, bool)  # scan id, barcode, status, action taken, is_error
+    warning = pyqtSignal(str, str)  # title, message
+    critical = pyqtSignal(str, str)  # title, message
+    finished = pyqtSignal(int, str)  # scan id, barcode
+    journal_progress = pyqtSignal(int)  # actions still queued for retry
+    pipeline_ready = pyqtSignal()  # the pipeline was built off the GUI thread
+    pipeline_failed = pyqtSignal(str)  # the pipeline could not be built; error message
+    diagnostics_written = pyqtSignal(str)  # bundle path, or "" if it could not be written
+
+
+class ScanWorker(QRunnable):
+    """
+    Runs the lookup -> availability -> check-in pipeline for one barcode on the thread pool.
+    """
+
+    def __init__(self, pipeline, scan_id, barcode, signals):
+        super().__init__()
+        self.pipeline = pipeline
+        self.scan_id = scan_id
+        self.barcode = barcode
+        self.signals = signals
+
+    def run(self):
+        try:
+            self.process()
+        finally:
+            self.signals.finished.emit(self.scan_id, self.barcode)
+
+    def process(self):
+        outcome = self.pipeline.process(
+            self.barcode, on_preview=lambda bib: self.signals.preview.emit(self.scan_id, self.barcode, bib)
+            )
+        if outcome["alert"]:
+            level, title, message = outcome["alert"]
+            signal = self.signals.critical if level == "critical" else self.signals.warning
+            signal.emit(title, message)
+        if outcome["status"] is not None:
+            self.signals.result.emit(
+                self.scan_id, self.barcode, outcome["status"], outcome["action"], outcome["is_error"]
+                )
+
 
 class BookCheckInApp(QMainWindow):
     def __init__(self):
@@ -91,7 +150,6 @@ class BookCheckInApp(QMainWindow):
         self.setWindowTitle("Book Check-In System")
         self.setGeometry(200, 200, 800, 600)
         self.setWindowIcon(QIcon(resource_path("app_icon.ico")))
-        self.token_info = None  # To store token and expiry time
 
         # Initialize attributes with default values
         self.barcode_input = None
@@ -99,9 +157,138 @@ class BookCheckInApp(QMainWindow):
         self.status_label = None
         self.results_table = None
         self.row_count_label = None
+        self.metrics_label = None
+        self.notifications_label = None
+        self.notifications_table = None
+
+        # Scans are queued on a bounded worker pool so the input field never blocks
+        max_concurrent_scans = max(1, int(config.get("max_concurrent_scans", 4)))
+        self.pending_scans = 0
+        self.next_scan_id = 0
+        self.preview_rows = {}  # scan id -> ResultRow showing cached fields while the scan runs
+        self.scan_pool = QThreadPool(self)
+        self.scan_pool.setMaxThreadCount(max_concurrent_scans)
+        # The pipeline (TLS context, caches, journal) is built in the background so the
+        # window appears right away; scans entered before it is ready wait in waiting_barcodes
+        self.pipeline = None
+        self.pipeline_error = None  # set if the pipeline could not be built; scans are then refused
+        self.waiting_barcodes = []
+        self.first_scan_started = None
+        self.closing = False
+        self.journal_label = None
+        self.scan_signals = ScanSignals()
+        self.scan_signals.preview.connect(self.show_preview)
+        self.scan_signals.result.connect(self.show_result)
+        self.scan_signals.warning.connect(self.show_warning)
+        self.scan_signals.critical.connect(self.show_critical)
+        self.scan_signals.finished.connect(self.scan_finished)
+        self.scan_signals.journal_progress.connect(self.update_journal_status)
+        self.scan_signals.pipeline_ready.connect(self.pipeline_ready)
+        self.scan_signals.pipeline_failed.connect(self.pipeline_failed)
+        self.scan_signals.diagnostics_written.connect(self.diagnostics_written)
+
+        # Results from workers are collected and inserted into the table in batches
+        self.results_model = ResultsTableModel(
+            max_rows=int(config.get("max_visible_rows", 0)), spill_path=RESULTS_SPILL_FILE, parent=self
+            )
+        self.pending_rows = []
+        self.row_flush_timer = QTimer(self)
+        self.row_flush_timer.setSingleShot(True)
+        self.row_flush_timer.setInterval(int(config.get("table_batch_interval_ms", 100)))
+        self.row_flush_timer.timeout.connect(self.flush_result_rows)
+
+        # Warnings and errors are listed next to the results instead of in modal dialogs,
+        # so scanning never has to stop for them
+        self.notifications = NotificationModel(max_items=int(config.get("max_notifications", 200)), parent=self)
+
+        self.pipeline_thread = threading.Thread(
+            target=self.load_pipeline, args=(max_concurrent_scans,), name="pipeline-init", daemon=True
+            )
+        self.pipeline_thread.start()
+        self.diagnostics_thread = None  # writes a diagnostics bundle (Ctrl+Shift+D)
 
         self.initUI()  # Build all UI components here
 
+        # Live latency / throughput summary in the footer
+        self.metrics_timer = QTimer(self)
+        self.metrics_timer.setInterval(int(config.get("metrics_refresh_ms", 2000)))
+        self.metrics_timer.timeout.connect(self.update_metrics_status)
+
+        # Hidden diagnostics menu for support staff
+        QShortcut(QKeySequence("Ctrl+Shift+D"), self, self.show_diagnostics_menu)
+        diagnostics.register_counter("table_rows", self.results_model.total_rows)
+        diagnostics.register_counter("table_rows_in_memory", self.results_model.rowCount)
+        diagnostics.register_counter("pending_table_rows", lambda: len(self.pending_rows))
+        diagnostics.register_counter("preview_rows", lambda: len(self.preview_rows))
+        diagnostics.register_counter("waiting_barcodes", lambda: len(self.waiting_barcodes))
+        diagnostics.register_counter("notifications", self.notifications.rowCount)
+
+    def load_pipeline(self, pool_size):
+        """
+        Runs on pipeline_thread: builds the pipeline, then pre-warms the token and connections.
+        """
+        started = time.perf_counter()
+        try:
+            if config.get("service_url"):
+                from service import ServiceClient
+
+                # Thin client: a shared check-in service does the OCLC work for every station
+                self.pipeline = ServiceClient(
+                    config["service_url"], api_key=config.get("service_api_key"),
+                    timeout=config.get("service_timeout", 60), pool_size=pool_size,
+                    )
+            else:
+                self.pipeline = build_pipeline(pool_size)
+        except Exception as e:
+            logging.error(f"Could not initialize the check-in pipeline: {e}")
+            self.scan_signals.pipeline_failed.emit(str(e))
+            return
+        logging.info(f"Check-in pipeline initialized in {(time.perf_counter() - started) * 1000:.0f} ms")
+        self.scan_signals.pipeline_ready.emit()
+        if config.get("prewarm_connections", True):
+            threading.Thread(target=self.pipeline.prewarm, name="prewarm", daemon=True).start()
+
+    def pipeline_ready(self):
+        if self.closing:
+            return  # closeEvent has already taken care of the waiting scans
+        logging.info(f"Ready to scan {(time.perf_counter() - STARTED_AT) * 1000:.0f} ms after start")
+        self.pipeline.start_replay(
+            on_progress=self.scan_signals.journal_progress.emit,
+            on_failure=lambda entry, error: self.scan_signals.critical.emit(
+                "Error", f"Queued {entry['action']} for {entry['barcode']} could not be sent.\n\nDetails:\n{error}"
+                ),
+            )
+        self.pipeline.start_metrics_export()
+        self.metrics_timer.start()
+        waiting, self.waiting_barcodes = self.waiting_barcodes, []
+        for barcode in waiting:
+            self.start_scan(barcode)
+
+    def pipeline_failed(self, error):
+        """
+        Without a pipeline nothing can be checked in: scans waiting for it, and every later
+        scan, get an error row instead of waiting forever.
+        """
+        self.pipeline_error = error
+        waiting, self.waiting_barcodes = self.waiting_barcodes, []
+        self.pending_scans -= len(waiting)
+        for barcode in waiting:
+            self.reject_scan(barcode)
+        if not waiting:
+            self.notify(CRITICAL, "Error", self.pipeline_error_message())
+        self.update_queue_status()
+
+    def pipeline_error_message(self):
+        return (f"Could not start the check-in service, so scans are not processed. Fix the problem "
+                f"and restart the application.\n\nDetails:\n{self.pipeline_error}")
+
+    def reject_scan(self, barcode):
+        logging.error(f"Barcode {barcode} not processed: the check-in pipeline could not be started.")
+        self.add_result_to_table(barcode, {
+            "status": "Error", "title": "Unknown", "author": "Unknown", "callNumber": "Unknown"
+            }, "None", is_error=True)
+        self.notify(CRITICAL, "Error", self.pipeline_error_message())
+
     def initUI(self):
         """
         Builds and lays out all UI elements in a refined, more modern style.
@@ -191,12 +378,26 @@ class BookCheckInApp(QMainWindow):
         self.status_label.setStyleSheet("color: #007BFF;")  # Blue text
         main_layout.addWidget(self.status_label)
 
+        # -- RESULTS FILTER --
+        filter_layout = QHBoxLayout()
+        filter_layout.addStretch(1)
+        filter_label = QLabel("Show:")
+        filter_label.setFont(QFont("Arial", 11))
+        filter_layout.addWidget(filter_label)
+        self.status_filter = QComboBox()
+        self.status_filter.addItems(list(StatusFilterProxyModel.FILTERS))
+        self.status_filter.currentTextChanged.connect(self.change_status_filter)
+        filter_layout.addWidget(self.status_filter)
+        main_layout.addLayout(filter_layout)
+
         # -- RESULTS TABLE --
-        self.results_table = QTableWidget()
-        self.results_table.setColumnCount(6)
-        self.results_table.setHorizontalHeaderLabels(
-            ["Barcode", "Title", "Author", "Call Number", "Status", "Action Taken"]
-        )
+        self.results_proxy = StatusFilterProxyModel(self)
+        self.results_proxy.setSourceModel(self.results_model)
+        self.results_table = QTableView()
+        self.results_table.setModel(self.results_proxy)
+        # Click a header to sort; until then rows stay in scan order
+        self.results_table.horizontalHeader().setSortIndicator(-1, Qt.AscendingOrder)
+        self.results_table.setSortingEnabled(True)
 
         # Bold the table header labels
         font_header = self.results_table.horizontalHeader().font()
@@ -224,436 +425,561 @@ class BookCheckInApp(QMainWindow):
 
         main_layout.addWidget(self.results_table)
 
-        # -- ROW COUNT LABEL --
+        # -- NOTIFICATIONS (hidden until the first one) --
+        self.notifications_frame = QFrame()
+        notifications_layout = QVBoxLayout(self.notifications_frame)
+        notifications_layout.setContentsMargins(0, 0, 0, 0)
+        notifications_layout.setSpacing(4)
+        notifications_header = QHBoxLayout()
+        self.notifications_label = QLabel("")
+        self.notifications_label.setFont(QFont("Arial", 11, QFont.Bold))
+        notifications_header.addWidget(self.notifications_label)
+        notifications_header.addStretch(1)
+        resolve_button = QPushButton("Mark resolved")
+        resolve_button.clicked.connect(self.resolve_notifications)
+        clear_button = QPushButton("Clear resolved")
+        clear_button.clicked.connect(self.clear_resolved_notifications)
+        for button in (resolve_button, clear_button):
+            button.setFont(QFont("Arial", 10))
+            button.setFocusPolicy(Qt.NoFocus)  # Clicking must not take focus from the barcode field
+            notifications_header.addWidget(button)
+        notifications_layout.addLayout(notifications_header)
+        self.notifications_table = QTableView()
+        self.notifications_table.setModel(self.notifications)
+        self.notifications_table.setFocusPolicy(Qt.NoFocus)
+        self.notifications_table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.notifications_table.setShowGrid(False)
+        self.notifications_table.verticalHeader().setVisible(False)
+        notifications_header_view = self.notifications_table.horizontalHeader()
+        notifications_header_view.setSectionResizeMode(QHeaderView.ResizeToContents)
+        notifications_header_view.setSectionResizeMode(2, QHeaderView.Stretch)
+        self.notifications_table.setMaximumHeight(140)
+        # Double-click a notification once it has been dealt with
+        self.notifications_table.doubleClicked.connect(lambda index: self.resolve_notifications([index.row()]))
+        notifications_layout.addWidget(self.notifications_table)
+        self.notifications_frame.setVisible(False)
+        main_layout.addWidget(self.notifications_frame)
+
+        # -- JOURNAL STATUS + METRICS SUMMARY + ROW COUNT LABEL --
+        footer_layout = QHBoxLayout()
+        self.journal_label = QLabel("")
+        self.journal_label.setFont(QFont("Arial", 11))
+        self.journal_label.setStyleSheet("color: #B8860B;")  # Amber text
+        footer_layout.addWidget(self.journal_label)
+        footer_layout.addStretch(1)
+        self.metrics_label = QLabel("")
+        self.metrics_label.setFont(QFont("Arial", 10))
+        self.metrics_label.setStyleSheet("color: #666666;")  # Gray text
+        footer_layout.addWidget(self.metrics_label)
+        footer_layout.addSpacing(16)
         self.row_count_label = QLabel("Total Books Scanned: 0")
         self.row_count_label.setFont(QFont("Arial", 11))
-        main_layout.addWidget(self.row_count_label, alignment=Qt.AlignRight)
+        footer_layout.addWidget(self.row_count_label)
+        main_layout.addLayout(footer_layout)
 
         # -- FINISH UP --
         self.setCentralWidget(container)
         self.setMinimumSize(900, 600)  # Comfortable window size
 
-    def get_access_token(self):
-        """
-        Fetch OAuth token required for API requests.
-        """
-        if self.token_info and "access_token" in self.token_info and self.token_info.get(
-                "expires_at", 0
-                ) > time.time():
-            return self.token_info["access_token"]
-
-        auth = HTTPBasicAuth(config["wskey"], config["secret"])
-        data = {"grant_type": "client_credentials", "scope": config["scope"]}
-        try:
-            logging.debug(f"Requesting access token: {config['oauth_server_token']}")
-            logging.debug(f"Request payload: {data}")
-            response = requests.post(
-                config["oauth_server_token"], auth=auth, data=data, timeout=10
-                )  # Set timeout to 10 seconds
-            logging.debug(f"Response status code: {response.status_code}")
-            logging.debug(f"Response headers: {response.headers}")
-            logging.debug(f"Response content: {response.text}")
-            response.raise_for_status()
-
-            token_data = response.json()
-            logging.debug(f"Fetched access token: {token_data}")
-
-            # Store token and expiry time
-            self.token_info = {
-                "access_token": token_data["access_token"],
-                "expires_at": time.time() + token_data.get("expires_in", 3600) - 60,
-                }
-            return self.token_info["access_token"]
-        except requests.Timeout:
-            logging.error("Timeout occurred while fetching OAuth token.")
-            raise
-        except requests.RequestException as e:
-            logging.error(f"Error during OAuth token request: {e}")
-            raise
-
     def process_barcode(self):
+        with diagnostics.scope("gui"):
+            self.queue_barcode()
+
+    def queue_barcode(self):
         barcode = self.barcode_input.text().strip()
         if not barcode:
-            QMessageBox.warning(self, "Error", "Please enter a barcode.")
+            self.notify(INFO, "Error", "Please enter a barcode.")
             logging.warning("No barcode entered.")
             self.barcode_input.setFocus()
             return
 
-        # Show processing message and clear input field
-        self.status_label.setText(f"Processing barcode {barcode}...")
+        # Queue the scan and clear the input field right away so the next scan is accepted
         self.barcode_input.clear()
         self.barcode_input.setFocus()  # Keep the input field active
+        if self.pipeline_error is not None:
+            self.reject_scan(barcode)
+            return
 
-        self.set_loading_state(True)
-        try:
-            logging.info(f"Processing barcode: {barcode}")
-
-            # Retry logic for OCLC lookup
-            max_retries = 2
-            for attempt in range(max_retries + 1):
-                try:
-                    # 1. Lookup OCLC number
-                    oclc_data = self.lookup_oclc_number(barcode)
-                    if 'error' in oclc_data:
-                        raise Exception(oclc_data['error'])
-
-                    oclc_number = oclc_data.get('oclcNumber')
-                    if not oclc_number:
-                        QMessageBox.warning(self, "Error", "No OCLC number found for this barcode.")
-                        return
-
-                    # 2. Check availability
-                    response_xml = self.check_availability(oclc_number)
-                    status = self.parse_availability(response_xml, barcode)
-                    if 'error' in status:
-                        raise Exception(status['error'])
-
-                    # 3. Handle special cases like TRANSIT
-                    if status.get('reasonUnavailable') == "TRANSIT":
-                        self.add_result_to_table(barcode, status, "None", is_error=True)
-                        return
-
-                    # 4. Take action
-                    if status.get('checkedOut'):
-                        action_response = self.check_in_item(barcode)
-                        status["status"] = action_response["status"]
-                        action_taken = action_response["action"]
-                    elif status.get('status') == "Available":
-                        self.non_loan_return(barcode)
-                        status["status"] = "In-Library Use"
-                        action_taken = "In-Library Use"
-                    else:
-                        QMessageBox.warning(
-                            self, "Warning",
-                            f"Item status: {status['status']}. {status.get('reasonUnavailable', '')}"
-                            )
-                        return
-
-                    # 5. Update table
-                    self.add_result_to_table(barcode, status, action_taken)
-                    break  # Break the retry loop on success
-
-                except Exception as e:
-                    logging.error(
-                        f"Error processing barcode {barcode} (attempt {attempt + 1}): {str(e)}"
-                        )
-                    if attempt < max_retries:
-                        logging.info("Retrying after failure...")
-                        self.token_info = None  # Invalidate the token to force a refresh
-                    else:
-                        QMessageBox.critical(
-                            self, "Error",
-                            f"An error occurred while processing {barcode}.\n\nDetails:\n{str(e)}"
-                            )
-                        self.add_result_to_table(
-                            barcode, {
-                                "status": "Error", "title": "Unknown", "author": "Unknown",
-                                "callNumber": "Unknown"
-                                }, "None", is_error=True
-                            )
-        finally:
+        logging.info(f"Queueing barcode: {barcode}")
+        self.pending_scans += 1
+        if self.first_scan_started is None:
+            self.first_scan_started = time.perf_counter()
+        if self.pipeline is None or self.waiting_barcodes:
+            self.waiting_barcodes.append(barcode)  # Started by pipeline_ready, in scan order
+        else:
+            self.start_scan(barcode)
+        self.update_queue_status()
+
+    def start_scan(self, barcode):
+        self.next_scan_id += 1
+        self.scan_pool.start(ScanWorker(self.pipeline, self.next_scan_id, barcode, self.scan_signals))
+
+    def scan_finished(self, scan_id, barcode):
+        logging.debug(f"Finished processing barcode: {barcode}")
+        if scan_id == 1:
+            now = time.perf_counter()
+            logging.info(f"First scan took {(now - self.first_scan_started) * 1000:.0f} ms "
+                         f"({(now - STARTED_AT) * 1000:.0f} ms after start)")
+        row = self.preview_rows.pop(scan_id, None)
+        if row is not None:
+            # The scan ended without a result (e.g. a warning was shown): mark the preview row
+            self.fill_row(row, barcode, {"status": "Not processed"}, "None", is_error=True)
+        self.pending_scans -= 1
+        self.update_queue_status()
+
+    def show_preview(self, scan_id, barcode, bib):
+        """
+        Adds a provisional row filled from the bibliographic cache; show_result completes it.
+        """
+        preview = dict(bib, status="Checking availability...")
+        self.preview_rows[scan_id] = self.add_result_to_table(barcode, preview, PENDING_ACTION)
+
+    def change_status_filter(self, name):
+        self.results_proxy.set_status_filter(name)
+        self.barcode_input.setFocus()
+
+    def show_result(self, scan_id, barcode, status, action_taken, is_error):
+        row = self.preview_rows.pop(scan_id, None)
+        if row is None:
+            self.add_result_to_table(barcode, status, action_taken, is_error)
+        else:
+            self.fill_row(row, barcode, status, action_taken, is_error)
+
+    def update_journal_status(self, queued_count):
+        if queued_count:
+            self.journal_label.setText(f"Waiting to send to OCLC: {queued_count} action(s)")
+        else:
+            self.journal_label.clear()
+
+    def update_metrics_status(self):
+        if self.pipeline.metrics.scans:
+            self.metrics_label.setText(self.pipeline.metrics.summary())
+
+    def update_queue_status(self):
+        if self.waiting_barcodes:
+            self.status_label.setText(f"Connecting to OCLC... {self.pending_scans} barcode(s) waiting")
+        elif self.pending_scans > 0:
+            self.status_label.setText(f"Processing {self.pending_scans} barcode(s)...")
+        else:
             self.status_label.clear()  # Clear the status message
-            self.set_loading_state(False)
-            self.barcode_input.setFocus()
 
-    def set_loading_state(self, is_loading):
-        self.barcode_input.setEnabled(not is_loading)
-        self.process_button.setEnabled(not is_loading)
-        self.process_button.setText("Processing..." if is_loading else "Process Check-In")
+    def show_warning(self, title, message):
+        self.notify(WARNING, title, message)
+
+    def show_critical(self, title, message):
+        self.notify(CRITICAL, title, message)
 
-    def lookup_oclc_number(self, barcode):
+    def notify(self, severity, title, message):
         """
-        Lookup OCLC number using the barcode via the Discovery API.
+        Lists a notification in the panel below the results; scanning carries on meanwhile.
         """
-        try:
-            url = f"{config['discovery_api_url']}/search/my-holdings"
-            headers = {
-                "Authorization": f"Bearer {self.get_access_token()}", "Accept": "application/json",
-                }
-            logging.debug(f"Requesting OCLC lookup: {url}")
-            logging.debug(f"Request headers: {headers}")
-            response = requests.get(f"{url}?barcode={barcode}", headers=headers, timeout=10)
-            logging.debug(f"Response status code: {response.status_code}")
-            logging.debug(f"Response headers: {response.headers}")
-            logging.debug(f"Response content: {response.text}")
-            response.raise_for_status()
-
-            data = response.json()
-            if data.get("numberOfHoldings", 0) == 0:
-                return {"error": "No holdings found for this barcode."}
-
-            holding = data["detailedHoldings"][0]
-            return {
-                "barcode": barcode, "oclcNumber": holding.get("oclcNumber", "Unknown OCLC Number"),
-                }
-        except requests.Timeout:
-            logging.error("Timeout occurred during OCLC lookup.")
-            raise Exception("The request to OCLC timed out. Please try again.")
-        except requests.RequestException as e:
-            logging.error(f"Error during OCLC lookup: {e}")
-            return {"error": str(e)}
-
-    def check_availability(self, oclc_number):
+        self.notifications.notify(severity, title, message)
+        self.notifications_table.scrollToTop()
+        self.notifications_frame.setVisible(True)
+        self.update_notifications_status()
+        self.barcode_input.setFocus()
+
+    def resolve_notifications(self, rows=None):
+        if rows is None:
+            rows = [index.row() for index in self.notifications_table.selectionModel().selectedRows()]
+        self.notifications.resolve(rows)
+        self.notifications_table.clearSelection()
+        self.update_notifications_status()
+        self.barcode_input.setFocus()
+
+    def clear_resolved_notifications(self):
+        self.notifications.clear_resolved()
+        self.notifications_frame.setVisible(self.notifications.rowCount() > 0)
+        self.update_notifications_status()
+        self.barcode_input.setFocus()
+
+    def update_notifications_status(self):
+        open_count = self.notifications.open_count()
+        self.notifications_label.setText(f"Needs attention: {open_count}" if open_count else "Notifications")
+        self.notifications_label.setStyleSheet("color: #FF0000;" if open_count else "color: #666666;")
+
+    def show_diagnostics_menu(self):
+        menu = QMenu(self)
+        if diagnostics.running:
+            menu.addAction("Stop diagnostics", diagnostics.stop)
+        else:
+            menu.addAction("Start diagnostics", diagnostics.start)
+        menu.addAction("Dump diagnostics bundle", self.dump_diagnostics)
+        menu.exec_(QCursor.pos())
+        self.barcode_input.setFocus()
+
+    def dump_diagnostics(self):
         """
-        Check availability for an item using OCLC's Availability API.
+        Write the bundle on a worker thread: the memory report and garbage collection take
+        seconds, during which the GUI thread would not take scans.
         """
-        host = "worldcat.org"
-        path = (f"/circ/availability/sru/service?x-registryId="
-                f"{config['institution_id']}&query=no:{urllib.parse.quote(oclc_number)}")
-        headers = {
-            "Authorization": f"Bearer {self.get_access_token()}", "Accept": "*/*"
-            }
-
-        context = ssl.create_default_context()
-        context.check_hostname = True
-        context.verify_mode = ssl.CERT_REQUIRED
-
-        conn = None
-        try:
-            logging.debug(f"Connecting to host: {host}")
-            logging.debug(f"Request path: {path}")
-            logging.debug(f"Request headers: {headers}")
-            conn = http.client.HTTPSConnection(host, context=context, timeout=10)
-            conn.request("GET", path, headers=headers)
-            response = conn.getresponse()
-            response_data = response.read().decode("utf-8")
-
-            logging.debug(f"Response status: {response.status}")
-            logging.debug(f"Response headers: {response.getheaders()}")
-            logging.debug(f"Response body: {response_data}")
-
-            if response.status == 200:
-                return response_data
-            else:
-                raise Exception(f"HTTP {response.status}: {response_data}")
-
-        except http.client.HTTPException as e:
-            logging.error(f"HTTP error during availability check: {e}")
-            raise
-        except Exception as e:
-            logging.error(f"Unexpected error during availability check: {str(e)}")
-            raise
-        finally:
-            if conn:
-                conn.close()
-
-    @staticmethod
-    def parse_availability(xml_response, item_barcode):
-        try:
-            root = ET.fromstring(xml_response)
-            namespaces = {"srw": "http://www.loc.gov/zing/srw/"}
-
-            holdings = root.findall(".//srw:recordData/opacRecord/holdings/holding", namespaces)
-            if not holdings:
-                return {"error": "No holdings found in XML response."}
-
-            for holding in holdings:
-                circulations = holding.findall(".//circulations/circulation")
-                for circulation in circulations:
-                    item_id = circulation.find(".//itemId")
-                    if item_id is not None and item_id.text == item_barcode:
-                        available_now = circulation.find(".//availableNow[@value='1']")
-                        availability_date = circulation.find(".//availabilityDate")
-                        reason_unavailable = circulation.find(".//reasonUnavailable")
-
-                        if available_now is not None:
-                            status = "Available"
-                            reason = None
-                            availability_date_text = None
-                        else:
-                            status = "Unavailable"
-                            reason = reason_unavailable.text if reason_unavailable is not None else "No reason"
-                            availability_date_text = availability_date.text if availability_date is not None else "N/A"
-
-                        # Check if the item is currently checked out or overdue
-                        is_checked_out = (reason in ["ON_LOAN", "OVERDUE",
-                                                     "LONG_OVERDUE"]) if status == "Unavailable" else False
-
-                        # Extract bibliographic info
-                        title_field = root.find(".//bibliographicRecord/record/datafield[@tag='245']/subfield[@code='a']")
-                        title = title_field.text if title_field is not None else "Unknown Title"
-
-                        author_field = root.find(".//bibliographicRecord/record/datafield[@tag='100']/subfield[@code='a']")
-                        if author_field is None:
-                            author_field = root.find(".//bibliographicRecord/record/datafield[@tag='700']/subfield[@code='a']")
-                        author = author_field.text if author_field is not None else "Unknown Author"
-
-                        call_number_field = holding.find(".//callNumber")
-                        call_number = call_number_field.text if call_number_field is not None else "N/A"
-
-                        return {
-                            "barcode": item_id.text,
-                            "title": title,
-                            "author": author,
-                            "callNumber": call_number,
-                            "status": status,
-                            "availabilityDate": availability_date_text if status == "Unavailable" else None,
-                            "reasonUnavailable": reason if status == "Unavailable" else None,
-                            "checkedOut": is_checked_out,
-                        }
-
-            return {"error": "Item barcode not found in holdings"}
-
-        except ET.ParseError as e:
-            return {"error": f"Failed to parse XML: {str(e)}"}
-        except Exception as e:
-            return {"error": f"Unexpected error: {str(e)}"}
+        if self.diagnostics_thread is not None and self.diagnostics_thread.is_alive():
+            self.notify(INFO, "Diagnostics", "The diagnostics bundle is still being written.")
+            return
+        self.diagnostics_thread = threading.Thread(
+            target=self.write_diagnostics_bundle, args=(diagnostics_extras(self.pipeline),),
+            name="diagnostics", daemon=True
+            )
+        self.diagnostics_thread.start()
 
-    @staticmethod
-    def fetch_ncip_access_token():
+    def write_diagnostics_bundle(self, extras):
         try:
-            auth = HTTPBasicAuth(config["wskey"], config["secret"])
-            headers = {"Content-Type": "application/x-www-form-urlencoded"}
-            data = {"grant_type": "client_credentials", "scope": config["scope"]}
-
-            response = requests.post(config["oauth_server_token"], headers=headers, auth=auth, data=data, timeout=10)
-            response.raise_for_status()
-
-            token_data = response.json()
-            logging.debug(f"NCIP Access Token Response: {token_data}")
-            return token_data.get("access_token")
-
-        except requests.RequestException as e:
-            logging.error(f"Error fetching NCIP access token: {e}")
-            raise
-
-    def check_in_item(self, barcode):
+            path = diagnostics.dump_bundle(extra=extras, log_file=LOG_FILE)
+        except OSError as e:
+            logging.error(f"Could not write the diagnostics bundle: {e}")
+            path = None
+        self.scan_signals.diagnostics_written.emit(path or "")
+
+    def diagnostics_written(self, path):
+        if path:
+            self.notify(INFO, "Diagnostics", f"Diagnostics bundle written to {path}")
+        else:
+            self.notify(WARNING, "Diagnostics", "Could not write the diagnostics bundle; see the log.")
+
+    def closeEvent(self, event):
         """
-        Attempt to check in the item via the NCIP API.
+        Let queued and in-flight scans finish before the window closes so no check-in is lost.
         """
-        ncip_request = f"""<?xml version="1.0" encoding="UTF-8"?>
-        <NCIPMessage xmlns="http://www.niso.org/2008/ncip" xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"
-            xmlns:ncip="http://www.niso.org/2008/ncip"
-            xsi:schemaLocation="http://www.niso.org/2008/ncip http://www.niso.org/schemas/ncip/v2_01/ncip_v2_01.xsd"
-            ncip:version="http://www.niso.org/schemas/ncip/v2_01/ncip_v2_01.xsd">
-            <CheckInItem>
-                <InitiationHeader>
-                    <FromAgencyId>
-                        <AgencyId ncip:Scheme="http://oclc.org/ncip/schemes/agencyid.scm">{config['registry_id']}</AgencyId>
-                    </FromAgencyId>
-                    <ToAgencyId>
-                        <AgencyId>{config['registry_id']}</AgencyId>
-                    </ToAgencyId>
-                    <ApplicationProfileType ncip:Scheme="http://oclc.org/ncip/schemes/application-profile/platform.scm">Version 2011</ApplicationProfileType>
-                </InitiationHeader>
-                <ItemId>
-                    <AgencyId>{config['institution_id']}</AgencyId>
-                    <ItemIdentifierValue>{barcode}</ItemIdentifierValue>
-                </ItemId>
-            </CheckInItem>
-        </NCIPMessage>"""
-
-        token = self.fetch_ncip_access_token()
-        headers = {
-            "Authorization": f"Bearer {token}",
-            "Content-Type": "application/xml"
-        }
-
-        logging.debug(f"NCIP Check-In Request: {ncip_request}")
-        logging.debug(f"Request headers: {headers}")
-        response = requests.post(config["ncip_api_url"], headers=headers, data=ncip_request)
-        logging.debug(f"Response status code: {response.status_code}")
-        logging.debug(f"Response headers: {response.headers}")
-        logging.debug(f"Response content: {response.text}")
-        response.raise_for_status()
-
-        root = ET.fromstring(response.text)
-        namespaces = {"ns1": "http://www.niso.org/2008/ncip"}
-
-        problem = root.find(".//ns1:Problem", namespaces)
-        if problem is not None:
-            problem_type = problem.find(".//ns1:ProblemType", namespaces)
-            problem_detail = problem.find(".//ns1:ProblemDetail", namespaces)
-            problem_message = (
-                f"Problem Type: {problem_type.text if problem_type is not None else 'Unknown'}, "
-                f"Detail: {problem_detail.text if problem_detail is not None else 'No detail'}"
-            )
-            raise Exception(f"Check-in failed with problem: {problem_message}")
-
-        routing_instructions = root.find(".//ns1:RoutingInstructions", namespaces)
-        routing_status = routing_instructions.text if routing_instructions is not None else "Unknown"
+        if self.pending_scans:
+            logging.info(f"Waiting for {self.pending_scans} pending scan(s) before exit.")
+        self.closing = True
+        self.pipeline_thread.join()
+        # Scans entered while the pipeline was still starting up
+        waiting, self.waiting_barcodes = self.waiting_barcodes, []
+        if self.pipeline is not None:
+            for barcode in waiting:
+                self.start_scan(barcode)
+        elif waiting:
+            logging.error(f"Exiting without processing {len(waiting)} scanned barcode(s), as the check-in "
+                          f"pipeline could not be started: {', '.join(waiting)}")
+        self.scan_pool.waitForDone()
+        self.metrics_timer.stop()
+        self.flush_result_rows()
+        for item in self.notifications.open_items():
+            logging.warning(f"Unresolved at exit ({item.count}x): {item.text()}")
+        if self.pipeline is not None:
+            self.pipeline.close()
+        super().closeEvent(event)
 
-        return {"status": routing_status, "action": "Checked In"}
-
-    def non_loan_return(self, barcode):
+    def add_result_to_table(self, barcode, status, action_taken, is_error=False, extra_details=None):
         """
-        Mark item as non-loan return.
+        Queues a new row for the results table with the processed data. Rows are inserted
+        in batches by flush_result_rows, which also updates the 'Total Books Scanned' label.
+        Returns the new ResultRow.
         """
-        try:
-            url = f"https://{config['institution_id']}.share.worldcat.org/circ/items/{barcode}/routings/usages"
-            payload = {
-                "location": f"https://{config['institution_id']}.share.worldcat.org/circ/branches/{config['registry_id']}"
-                }
-            headers = {
-                "Authorization": f"Bearer {self.get_access_token()}",
-                "Content-Type": "application/json"
-                }
-
-            logging.debug(f"Non-loan return request URL: {url}")
-            logging.debug(f"Request payload: {json.dumps(payload, indent=2)}")
-            logging.debug(f"Request headers: {headers}")
-
-            response = requests.post(url, headers=headers, json=payload)
-
-            logging.debug(f"Response status code: {response.status_code}")
-            logging.debug(f"Response headers: {response.headers}")
-            logging.debug(f"Response content: {response.text}")
-
-            response.raise_for_status()
-
-            response_data = response.json()
-            logging.info(
-                f"Non-loan return completed successfully for barcode {barcode}. Response: {response_data}"
-                )
+        with self.gui_timer("add_result_to_table"):
+            row = ResultRow(barcode, status, action_taken, is_error)
+            self.pending_rows.append(row)
+            if not self.row_flush_timer.isActive():
+                self.row_flush_timer.start()
+        return row
+
+    def flush_result_rows(self):
+        rows, self.pending_rows = self.pending_rows, []
+        if rows:
+            # The batched model insert is where the table cost actually lands
+            with self.gui_timer("flush_result_rows"), diagnostics.scope("gui"):
+                self.results_model.add_rows(rows)
 
-            return {"success": True, "data": response_data}
-        except requests.Timeout:
-            logging.error(f"Timeout occurred while marking non-loan return for barcode {barcode}.")
-            raise
-        except requests.RequestException as e:
-            logging.error(f"Error during non-loan return for barcode {barcode}: {e}")
-            raise
-        except Exception as e:
-            logging.error(f"Unexpected error in non-loan return for barcode {barcode}: {e}")
-            raise
+        # Update the "Total Books Scanned" label
+        total_count = self.results_model.total_rows()
+        self.row_count_label.setText(f"Total Books Scanned: {total_count}")
 
-    def add_result_to_table(self, barcode, status, action_taken, is_error=False, extra_details=None):
+    def gui_timer(self, name):
         """
-        Adds a new row to the results table with the processed data.
-        Also updates the 'Total Books Scanned' label and optionally highlights errors.
+        Times a GUI step in the pipeline's metrics; there are none without a pipeline.
         """
-        row_position = self.results_table.rowCount()
-        self.results_table.insertRow(row_position)
-
-        # Determine the displayable status
-        status_text = status.get("reasonUnavailable", status.get("status", "Unknown"))
-
-        self.results_table.setItem(row_position, 0, QTableWidgetItem(barcode))
-        self.results_table.setItem(row_position, 1, QTableWidgetItem(status.get("title", "Unknown")))
-        self.results_table.setItem(row_position, 2, QTableWidgetItem(status.get("author", "Unknown")))
-        self.results_table.setItem(row_position, 3, QTableWidgetItem(status.get("callNumber", "N/A")))
-        self.results_table.setItem(row_position, 4, QTableWidgetItem(status_text))
-        self.results_table.setItem(row_position, 5, QTableWidgetItem(action_taken))
-
-        if extra_details:
-            # If you ever add a 7th column for details, you could set it here
-            pass
-
-        # Highlight error rows in red
-        if is_error:
-            for col in range(self.results_table.columnCount()):
-                item = self.results_table.item(row_position, col)
-                if item:
-                    item.setForeground(QColor(255, 0, 0))
+        return self.pipeline.metrics.time(name) if self.pipeline is not None else nullcontext()
 
-        # Update the "Total Books Scanned" label
-        total_count = self.results_table.rowCount()
-        self.row_count_label.setText(f"Total Books Scanned: {total_count}")
+    def fill_row(self, row, barcode, status, action_taken, is_error=False):
+        """
+        Writes the processed data into an existing results row.
+        """
+        row.barcode = barcode
+        row.set_status(status, action_taken, is_error)
+        self.results_model.row_changed(row)
+
+
+def diagnostics_extras(pipeline):
+    """
+    Metrics and settings (without credentials) for a diagnostics bundle.
+    """
+    secrets = ("wskey", "secret", "service_api_key")
+    settings = {key: "[REDACTED]" if key in secrets else value for key, value in config.items()}
+    extras = {"config.json": json.dumps(settings, indent=2)}
+    if pipeline is not None:
+        extras["metrics.json"] = json.dumps(pipeline.metrics.snapshot(), indent=2)
+    return extras
+
+
+BATCH_FIELDS = [
+    "line", "barcode", "title", "author", "callNumber", "status", "action", "is_error", "message",
+    "elapsed_ms",
+]
+
+
+def read_batch_checkpoint(out_path):
+    """
+    Returns the input line numbers already recorded in a previous run's results file.
+    """
+    if not os.path.exists(out_path):
+        return set()
+    with open(out_path, "r", newline="", encoding="utf-8") as f:
+        return {int(row["line"]) for row in csv.DictReader(f) if row.get("line", "").isdigit()}
+
+
+def run_batch(batch_path, out_path, concurrency, resume=True):
+    """
+    Headless check-in of a file of barcodes (one per line) without starting a QApplication.
+
+    Runs the same pipeline as the GUI with at most `concurrency` scans in flight, appends
+    each result to the CSV at `out_path` as soon as it completes, and skips lines already
+    present in that file so an interrupted run can be resumed.
+    """
+    # Only needed in batch mode, so not imported at startup
+    from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+    with open(batch_path, "r", encoding="utf-8") as f:
+        items = [(number, line.strip()) for number, line in enumerate(f, 1) if line.strip()]
+
+    done = read_batch_checkpoint(out_path) if resume else set()
+    todo = [(number, barcode) for number, barcode in items if number not in done]
+    print(f"Batch {batch_path}: {len(items)} barcodes, {len(items) - len(todo)} already done, "
+          f"{len(todo)} to process with concurrency {concurrency}.")
+
+    pipeline = build_pipeline(concurrency)
+    pipeline.start_replay()
+    pipeline.start_metrics_export()
+    write_header = not (resume and os.path.exists(out_path))
+    processed = errors = 0
+    started = time.time()
+
+    def run_one(barcode):
+        scan_started = time.time()
+        outcome = pipeline.process(barcode)
+        outcome["elapsed_ms"] = round((time.time() - scan_started) * 1000)
+        return outcome
+
+    with open(out_path, "w" if write_header else "a", newline="", encoding="utf-8") as out_file:
+        writer = csv.DictWriter(out_file, fieldnames=BATCH_FIELDS)
+        if write_header:
+            writer.writeheader()
+
+        def record(number, outcome):
+            nonlocal processed, errors
+            status = outcome["status"] or {}
+            is_error = outcome["is_error"] or outcome["status"] is None
+            message = (outcome["error"] or (outcome["alert"][2] if outcome["alert"] else "")).replace("\n", " ")
+            if outcome["duplicate"]:
+                message = f"Duplicate scan ({outcome['duplicate']}) {message}".strip()
+            writer.writerow({
+                "line": number,
+                "barcode": outcome["barcode"],
+                "title": status.get("title", ""),
+                "author": status.get("author", ""),
+                "callNumber": status.get("callNumber", ""),
+                "status": status.get("reasonUnavailable") or status.get("status", "Not processed"),
+                "action": outcome["action"],
+                "is_error": int(is_error),
+                "message": message,
+                "elapsed_ms": outcome["elapsed_ms"],
+            })
+            out_file.flush()
+            processed += 1
+            errors += int(is_error)
+            print(f"[{processed}/{len(todo)}] {outcome['barcode']}: "
+                  f"{'ERROR ' + message if is_error else outcome['action']}")
+
+        executor = ThreadPoolExecutor(max_workers=concurrency)
+        in_flight = {}
+        pending = iter(todo)
+        try:
+            while True:
+                # Keep the executor queue bounded to the concurrency limit
+                for number, barcode in pending:
+                    in_flight[executor.submit(run_one, barcode)] = number
+                    if len(in_flight) >= concurrency:
+                        break
+                if not in_flight:
+                    break
+
+                completed, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in completed:
+                    record(in_flight.pop(future), future.result())
+        except KeyboardInterrupt:
+            # Scans already sent to OCLC are recorded so a resumed run does not repeat them
+            print("Interrupted; finishing in-flight scans. Re-run the same command to resume.")
+            executor.shutdown(wait=True, cancel_futures=True)
+            for future, number in in_flight.items():
+                if not future.cancelled():
+                    record(number, future.result())
+        finally:
+            executor.shutdown(wait=True)
+            queued = pipeline.journal.queued_count()
+            stages = pipeline.metrics.snapshot()["stages"]
+            limits = {name: stage.stats() for name, stage in pipeline.stages.items()}
+            pipeline.close()
+
+    elapsed = time.time() - started
+    rate = processed / elapsed if elapsed > 0 else 0.0
+    print(f"Processed {processed} barcodes ({errors} errors) in {elapsed:.1f}s "
+          f"- {rate:.2f} scans/s, {rate * 60:.0f} scans/min. Results: {out_path}")
+    for name, stage in stages.items():
+        print(f"  {name:<22} n={stage['count']:<6} errors={stage['errors']:<4} "
+              f"p50={stage['p50_ms']:.0f}ms p95={stage['p95_ms']:.0f}ms p99={stage['p99_ms']:.0f}ms")
+    for name, stats in limits.items():
+        if stats["calls"]:
+            print(f"  {name:<22} concurrency limit={stats['concurrency_limit']} throttled={stats['throttled']} "
+                  f"rate-limit waits={stats['rate_limit_waits']} ({stats['rate_limit_wait_s']:.1f}s)")
+    if queued:
+        print(f"{queued} action(s) are queued in the journal and will be sent on the next run.")
+    return 1 if errors else 0
+
+
+def run_history(barcode=None, errors_only=False, since=None, export_path=None, limit=50):
+    """
+    Print (or export to CSV) scans from the scan history without opening the window.
+    `since` is a YYYY-MM-DD date; errors default to today's.
+    """
+    if since:
+        since = datetime.strptime(since, "%Y-%m-%d").timestamp()
+    elif errors_only and not barcode:
+        since = start_of_day()
+    history = ScanHistory(HISTORY_DB, retention_days=config.get("history_retention_days", 365))
+    try:
+        filters = {"barcode": barcode, "since": since, "errors_only": errors_only}
+        if export_path:
+            count = history.export_csv(export_path, **filters)
+            print(f"Exported {count} scan(s) to {export_path}")
+            return 0
+        scans = history.search(limit=limit, **filters)
+        for scan in scans:
+            scanned_at = datetime.fromtimestamp(scan["scanned_at"]).strftime("%Y-%m-%d %H:%M:%S")
+            detail = scan["error"] or scan["status"] or ""
+            print(f"{scanned_at}  {scan['barcode']:<16} {scan['action'] or '':<28} {detail}  "
+                  f"[{scan['station']}, {scan['duration_ms'] or 0:.0f} ms]")
+        if not scans:
+            print("No matching scans in the history.")
+        return 0
+    finally:
+        history.close()
+
+
+def run_import_holdings(export_paths, merge=True, **columns):
+    """
+    Build (or update) the holdings index from WMS item exports and report its size and speed.
+    """
+    from holdings_index import HoldingsIndex, import_exports
+
+    index_path = holdings_index_path(config, LOG_DIR)
+    started = time.perf_counter()
+    try:
+        count = import_exports(index_path, export_paths, merge=merge, **columns)
+    except (OSError, ValueError, UnicodeDecodeError) as e:
+        print(f"Import failed: {e}")
+        logging.error(f"Holdings import from {export_paths} failed: {e}")
+        return 1
+    elapsed = time.perf_counter() - started
+
+    index = HoldingsIndex(index_path)
+    try:
+        barcodes = index.sample(1000)
+        lookup_started = time.perf_counter()
+        for barcode in barcodes:
+            index.lookup(barcode)
+        per_lookup = (time.perf_counter() - lookup_started) / max(1, len(barcodes))
+        size = index.stats()["size_bytes"]
+    finally:
+        index.close()
+    print(f"Indexed {count} items in {elapsed:.1f}s: {index.file} ({size / 1048576:.1f} MiB), "
+          f"{per_lookup * 1e6:.1f} µs per lookup")
+    logging.info(f"Holdings index {index_path} built with {count} items from {export_paths}")
+    return 0
+
+
+def run_service(host, port):
+    """
+    Run the shared check-in service for all stations at a desk until interrupted.
+    """
+    from service import CheckInService
+
+    max_concurrent_scans = int(config.get("service_max_concurrent_scans", 16))
+    pipeline = build_pipeline(max_concurrent_scans)
+    server = CheckInService(
+        pipeline, host, port, api_key=config.get("service_api_key"), max_concurrent_scans=max_concurrent_scans
+        )
+    pipeline.start_replay()
+    pipeline.start_metrics_export()
+    threading.Thread(target=pipeline.prewarm, name="prewarm", daemon=True).start()
+    print(f"Check-in service listening on http://{host}:{server.server_address[1]} - press Ctrl+C to stop.")
+    logging.info(f"Check-in service listening on {host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("Stopping the check-in service.")
+    finally:
+        server.server_close()
+        pipeline.close()
+    return 0
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="OCLC WMS Book Check-In")
+    parser.add_argument("--batch", metavar="BARCODES_FILE",
+                        help="Check in every barcode in this file (one per line) without opening the window")
+    parser.add_argument("--out", metavar="RESULTS_CSV",
+                        help="Where batch results are written (default: <BARCODES_FILE>.results.csv)")
+    parser.add_argument("--concurrency", type=int, default=int(config.get("max_concurrent_scans", 4)),
+                        help="Maximum number of barcodes processed at the same time")
+    parser.add_argument("--no-resume", action="store_true",
+                        help="Start the batch from scratch instead of skipping lines already in the results file")
+    parser.add_argument("--serve", action="store_true",
+                        help="Run the shared check-in service that other stations connect to with service_url")
+    parser.add_argument("--host", default=config.get("service_host", "127.0.0.1"),
+                        help="Address the service listens on (use 0.0.0.0 to accept other stations)")
+    parser.add_argument("--port", type=int, default=int(config.get("service_port", 8765)),
+                        help="Port the service listens on")
+    parser.add_argument("--history", nargs="?", const="", metavar="BARCODE",
+                        help="Show recent scans from the scan history, or only those of BARCODE")
+    parser.add_argument("--errors", action="store_true",
+                        help="With --history or --export-history: only failed scans (default: today's)")
+    parser.add_argument("--since", metavar="YYYY-MM-DD", help="With --history or --export-history: from this date")
+    parser.add_argument("--export-history", metavar="HISTORY_CSV", help="Export the scan history to a CSV file")
+    parser.add_argument("--import-holdings", nargs="+", metavar="EXPORT",
+                        help="Add WMS item exports (CSV or TSV) to the local holdings index")
+    parser.add_argument("--replace-holdings", action="store_true",
+                        help="With --import-holdings: rebuild the index from these exports only")
+    parser.add_argument("--barcode-column", help="With --import-holdings: name of the barcode column")
+    parser.add_argument("--oclc-column", help="With --import-holdings: name of the OCLC number column")
+    parser.add_argument("--call-number-column", help="With --import-holdings: name of the call number column")
+    # Unknown arguments are left for Qt (e.g. -style)
+    return parser.parse_known_args(argv)[0]
 
 
 if __name__ == "__main__":
+    args = parse_args(sys.argv[1:])
+    if os.environ.get(DIAGNOSTICS_ENV, "0") not in ("", "0") or config.get("diagnostics", False):
+        diagnostics.start()
+    if args.serve:
+        sys.exit(run_service(args.host, args.port))
+    if args.import_holdings:
+        sys.exit(run_import_holdings(
+            args.import_holdings, merge=not args.replace_holdings, barcode_column=args.barcode_column,
+            oclc_column=args.oclc_column, call_number_column=args.call_number_column,
+            ))
+    if args.history is not None or args.export_history:
+        sys.exit(run_history(args.history or None, args.errors, args.since, args.export_history))
+    if args.batch:
+        sys.exit(run_batch(
+            args.batch, args.out or f"{args.batch}.results.csv", max(1, args.concurrency),
+            resume=not args.no_resume
+            ))
+
     app = QApplication(sys.argv)
     app.setWindowIcon(QIcon(resource_path("app_icon.ico")))
     window = BookCheckInApp()
     window.show()
+    QTimer.singleShot(0, lambda: logging.info(
+        f"Window shown {(time.perf_counter() - STARTED_AT) * 1000:.0f} ms after start"
+        ))
     sys.exit(app.exec_())
@@ -0,0 +1,338 @@
+import gc
+import io
+import os
+import sys
+import json
+import time
+import logging
+import threading
+from collections import Counter
+from contextlib import contextmanager
+
+# Environment variable that switches diagnostics on at start-up
+DIAGNOSTICS_ENV = "CHECKIN_DIAGNOSTICS"
+
+
+class SamplingProfiler(threading.Thread):
+    """
+    Low-overhead statistical profiler. Every `interval` seconds it records the Python stack
+    of each thread that is inside a `scope()`, so only the code paths of interest (scans,
+    GUI updates) are sampled, from any number of threads at once.
+    """
+
+    def __init__(self, interval=0.005):
+        super().__init__(name="diagnostics-profiler", daemon=True)
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._scopes = {}  # thread id -> stack of scope names
+        self.stacks = Counter()  # "scope;outer;...;inner" -> samples
+        self.samples = 0
+        self._stop_event = threading.Event()
+
+    @contextmanager
+    def scope(self, name):
+        thread_id = threading.get_ident()
+        with self._lock:
+            self._scopes.setdefault(thread_id, []).append(name)
+        try:
+            yield
+        finally:
+            with self._lock:
+                names = self._scopes[thread_id]
+                names.pop()
+                if not names:
+                    del self._scopes[thread_id]
+
+    def run(self):
+        own_id = threading.get_ident()
+        while not self._stop_event.wait(self.interval):
+            frames = sys._current_frames()
+            with self._lock:
+                for thread_id, names in self._scopes.items():
+                    frame = frames.get(thread_id)
+                    if frame is None or thread_id == own_id:
+                        continue
+                    stack = []
+                    while frame is not None:
+                        code = frame.f_code
+                        stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                        frame = frame.f_back
+                    stack.append(names[-1])
+                    self.stacks[";".join(reversed(stack))] += 1
+                    self.samples += 1
+            del frames
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+    def folded(self):
+        """
+        The samples as folded stacks, one "frame;frame;... count" per line, for flame graph tools.
+        """
+        with self._lock:
+            return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def report(self, top=30):
+        with self._lock:
+            stacks = list(self.stacks.items())
+            samples = self.samples
+        if not samples:
+            return "No samples yet.\n"
+        scopes, inclusive, own = Counter(), Counter(), Counter()
+        for stack, count in stacks:
+            frames = stack.split(";")
+            scopes[frames[0]] += count
+            own[frames[-1]] += count
+            for frame in set(frames[1:]):
+                inclusive[frame] += count
+        out = io.StringIO()
+        out.write(f"{samples} samples every {self.interval * 1000:g} ms\n\nSamples per scope:\n")
+        for name, count in scopes.most_common():
+            out.write(f"  {count:>8}  {count / samples:6.1%}  {name}\n")
+        for title, counter in (("Inclusive (function and its callees)", inclusive), ("Self (function only)", own)):
+            out.write(f"\n{title}, top {top}:\n")
+            for name, count in counter.most_common(top):
+                out.write(f"  {count:>8}  {count / samples:6.1%}  {name}\n")
+        return out.getvalue()
+
+
+class Diagnostics:
+    """
+    Opt-in diagnostics for long-running stations: a sampling profiler around scans and
+    GUI updates, tracemalloc snapshots compared with the start and with the previous dump,
+    and named counters (table rows, cache sizes, queued log records, ...).
+
+    While running, reports are written to `out_dir` every `interval` seconds (the newest
+    `keep` of each kind are kept). `scope()` costs almost nothing while diagnostics are off.
+    """
+
+    # tracemalloc, zipfile and the report helpers are only imported once diagnostics are used,
+    # so the always-present Diagnostics object adds nothing to start-up time
+
+    def __init__(self, out_dir, interval=900, memory_frames=10, top=30, keep=50):
+        self.out_dir = out_dir
+        self.interval = interval
+        self.memory_frames = memory_frames
+        self.top = top
+        self.keep = keep
+        self.counters = {}  # name -> callable returning a number
+        self.profiler = None
+        self.started_at = None
+        self._baseline = None
+        self._previous = None
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._dumper = None
+
+    @property
+    def running(self):
+        return self.profiler is not None
+
+    def register_counter(self, name, read):
+        self.counters[name] = read
+
+    @contextmanager
+    def scope(self, name):
+        profiler = self.profiler
+        if profiler is None:
+            yield
+            return
+        with profiler.scope(name):
+            yield
+
+    def start(self):
+        import tracemalloc
+
+        with self._lock:
+            if self.running:
+                return
+            os.makedirs(self.out_dir, exist_ok=True)
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(self.memory_frames)
+            self._baseline = self._previous = self.take_snapshot()
+            self.started_at = time.time()
+            self.profiler = SamplingProfiler()
+            self.profiler.start()
+            self._stop_event.clear()
+            if self.interval:
+                self._dumper = threading.Thread(target=self._dump_loop, name="diagnostics-dump", daemon=True)
+                self._dumper.start()
+        logging.info(f"Diagnostics started; reports are written to {self.out_dir}")
+
+    def stop(self):
+        import tracemalloc
+
+        with self._lock:
+            if not self.running:
+                return
+            self._stop_event.set()
+        if self._dumper is not None:
+            self._dumper.join()
+            self._dumper = None
+        self.dump()
+        with self._lock:
+            self.profiler.stop()
+            self.profiler = None
+            self._baseline = self._previous = None
+            tracemalloc.stop()
+        logging.info("Diagnostics stopped")
+
+    def _dump_loop(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                self.dump()
+            except Exception as e:
+                logging.error(f"Could not write diagnostics: {e}")
+
+    @classmethod
+    def take_snapshot(cls):
+        """
+        Traced memory per allocating line as {traceback: (size, count)}. Grouping once per
+        snapshot keeps reports fast even with hundreds of thousands of traced blocks.
+        """
+        import tracemalloc
+
+        ignored = cls.ignored_files()
+        return {
+            stat.traceback: (stat.size, stat.count)
+            for stat in tracemalloc.take_snapshot().statistics("lineno")
+            if stat.traceback[0].filename not in ignored
+            }
+
+    @staticmethod
+    def ignored_files():
+        """
+        Allocations from these files are left out of the reports: the memory tracking itself
+        (including the snapshots kept here), source lines loaded for the reports and the
+        import machinery.
+        """
+        import linecache
+        import tracemalloc
+
+        return {
+            __file__, tracemalloc.__file__, linecache.__file__,
+            "<frozen importlib._bootstrap>", "<frozen importlib._bootstrap_external>",
+            }
+
+    def memory_report(self, update_previous=False):
+        import tracemalloc
+
+        if not tracemalloc.is_tracing() or self._baseline is None:
+            return "Memory tracking is off.\n"
+        snapshot = self.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        out = io.StringIO()
+        out.write(f"Traced memory: {current / 1048576:.1f} MiB (peak {peak / 1048576:.1f} MiB)\n")
+        comparisons = (("since diagnostics started", self._baseline), ("since the previous report", self._previous))
+        for title, reference in comparisons:
+            out.write(f"\nGrowth {title}, top {self.top}:\n")
+            growth = []
+            for traceback in snapshot.keys() | reference.keys():
+                size, count = snapshot.get(traceback, (0, 0))
+                old_size, old_count = reference.get(traceback, (0, 0))
+                growth.append((size - old_size, count - old_count, traceback))
+            growth.sort(key=lambda item: abs(item[0]), reverse=True)
+            for size_diff, count_diff, traceback in growth[:self.top]:
+                out.write(f"  {size_diff / 1024:+10.1f} KiB {count_diff:+8} blocks  {traceback}\n")
+        if update_previous:
+            self._previous = snapshot
+        return out.getvalue()
+
+    def counters_report(self):
+        out = io.StringIO()
+        for name, read in self.counters.items():
+            try:
+                out.write(f"{name}: {read()}\n")
+            except Exception as e:
+                out.write(f"{name}: unavailable ({e})\n")
+        types = Counter(type(obj).__name__ for obj in gc.get_objects())
+        out.write(f"\nGarbage collector: {gc.get_count()} pending, {gc.get_stats()}\n")
+        out.write(f"\nMost common tracked objects, top {self.top}:\n")
+        for name, count in types.most_common(self.top):
+            out.write(f"  {count:>10}  {name}\n")
+        return out.getvalue()
+
+    @staticmethod
+    def threads_report():
+        import traceback
+
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        out = io.StringIO()
+        for thread_id, frame in sys._current_frames().items():
+            out.write(f"Thread {names.get(thread_id, thread_id)}:\n")
+            out.write("".join(traceback.format_stack(frame)))
+            out.write("\n")
+        return out.getvalue()
+
+    def system_report(self):
+        import platform
+
+        return json.dumps({
+            "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "python": sys.version,
+            "platform": platform.platform(),
+            "pid": os.getpid(),
+            "threads": threading.active_count(),
+            "diagnostics_running_s": round(time.time() - self.started_at, 1) if self.started_at else None,
+        }, indent=2)
+
+    def dump(self):
+        """
+        Write the profile, memory and counter reports to `out_dir`. Returns the paths written.
+        """
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        reports = {
+            f"profile-{stamp}.txt": self.profiler.report(self.top) if self.profiler else "Profiler is off.\n",
+            f"profile-{stamp}.folded": self.profiler.folded() if self.profiler else "",
+            f"memory-{stamp}.txt": self.memory_report(update_previous=True),
+            f"counters-{stamp}.txt": self.counters_report(),
+        }
+        os.makedirs(self.out_dir, exist_ok=True)
+        paths = []
+        for name, content in reports.items():
+            path = os.path.join(self.out_dir, name)
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(content)
+            paths.append(path)
+        self.prune()
+        logging.info(f"Diagnostics written to {self.out_dir} ({stamp})")
+        return paths
+
+    def prune(self):
+        for prefix in ("profile-", "memory-", "counters-", "diagnostics-"):
+            names = sorted(name for name in os.listdir(self.out_dir) if name.startswith(prefix))
+            for name in names[:-self.keep * (2 if prefix == "profile-" else 1)]:
+                try:
+                    os.remove(os.path.join(self.out_dir, name))
+                except OSError:
+                    pass
+
+    def dump_bundle(self, extra=None, log_file=None, log_lines=5000):
+        """
+        Write one zip with every report, all thread stacks, the `extra` {name: text} entries
+        and the last `log_lines` lines of `log_file`. Returns its path.
+        """
+        import zipfile
+
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        os.makedirs(self.out_dir, exist_ok=True)
+        path = os.path.join(self.out_dir, f"diagnostics-{stamp}.zip")
+        entries = {
+            "system.json": self.system_report(),
+            "threads.txt": self.threads_report(),
+            "counters.txt": self.counters_report(),
+            "memory.txt": self.memory_report(),
+            "profile.txt": self.profiler.report(self.top) if self.profiler else "Profiler is off.\n",
+            "profile.folded": self.profiler.folded() if self.profiler else "",
+        }
+        entries.update(extra or {})
+        if log_file and os.path.exists(log_file):
+            with open(log_file, "r", encoding="utf-8", errors="replace") as f:
+                entries[os.path.basename(log_file)] = "".join(f.readlines()[-log_lines:])
+        with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as bundle:
+            for name, content in entries.items():
+                bundle.writestr(name, content)
+        self.prune()
+        logging.info(f"Diagnostics bundle written to {path}")
+        return path
@@ -0,0 +1,318 @@
+import os
+import re
+import csv
+import mmap
+import time
+import struct
+import logging
+import threading
+
+MAGIC = b"CKHX"
+VERSION = 1
+# magic, version, key width, entry count, heap offset, build time
+HEADER = struct.Struct("<4sHHQQd")
+# offset and length of "oclc number<US>call number" in the heap, after each fixed-width key
+POINTER = struct.Struct("<IH")
+SEPARATOR = "\x1f"
+# Next to the index path: the name of the file with the current version of the index
+POINTER_SUFFIX = ".current"
+
+# Column names tried (case-insensitively) when an export is imported
+BARCODE_COLUMNS = ("item barcode", "barcode", "itembarcode")
+OCLC_COLUMNS = ("oclc number", "oclc #", "oclcnumber", "oclc", "ocn")
+CALL_NUMBER_COLUMNS = ("item call number", "call number", "callnumber", "call no.", "call no")
+# "(OCoLC)ocm00012345" and similar forms of an OCLC number
+OCLC_NUMBER_PATTERN = re.compile(r"^(?:\(OCoLC\))?\s*(?:ocm|ocn|on)?(\d+)$", re.IGNORECASE)
+
+
+class HoldingsIndex:
+    """
+    Read-only barcode -> (OCLC number, call number) index in a sorted binary file.
+
+    The file is memory-mapped and searched in place, so opening it costs the same for ten
+    items as for ten million and only the pages a lookup touches are read. A re-import
+    writes a new version and points `path` at it (see build_index()); the new version is
+    picked up within `check_interval` seconds.
+    """
+
+    def __init__(self, path, check_interval=60):
+        self.path = path
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self.file = None
+        self._file = None
+        self._mm = None
+        self._mtime = None
+        self._checked_at = 0.0
+        self.key_width = 0
+        self.heap_offset = 0
+        self.count = 0
+        self.built_at = None
+        self.hits = 0
+        self.misses = 0
+        self._open()
+
+    def _open(self):
+        self._close()
+        self.file = current_index_file(self.path)
+        try:
+            stat = os.stat(self.file)
+        except FileNotFoundError:
+            self._mtime = None
+            return
+        self._mtime = stat.st_mtime
+        if stat.st_size < HEADER.size:
+            logging.error(f"Holdings index {self.file} is too short; ignoring it")
+            return
+        self._file = open(self.file, "rb")
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, key_width, count, heap_offset, built_at = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or version != VERSION:
+            logging.error(f"{self.file} is not a holdings index (version {VERSION}); ignoring it")
+            self._close()
+            return
+        self.key_width, self.count, self.heap_offset, self.built_at = key_width, count, heap_offset, built_at
+        logging.info(f"Holdings index {self.file} opened with {count} items")
+
+    def _close(self):
+        if self._mm is not None:
+            self._mm.close()
+            self._file.close()
+        self._mm = self._file = None
+        self.count = 0
+
+    def _reload_if_changed(self):
+        now = time.monotonic()
+        if now - self._checked_at < self.check_interval:
+            return
+        self._checked_at = now
+        file = current_index_file(self.path)
+        try:
+            mtime = os.stat(file).st_mtime
+        except FileNotFoundError:
+            mtime = None
+        if file != self.file or mtime != self._mtime:
+            self._open()
+
+    def lookup(self, barcode):
+        """
+        Returns (oclc_number, call_number) for `barcode`, or None if it is not indexed.
+        """
+        with self._lock:
+            self._reload_if_changed()
+            if not self.count:
+                return None
+            key = barcode.encode("utf-8")
+            if len(key) > self.key_width:
+                self.misses += 1
+                return None
+            key = key.ljust(self.key_width, b"\0")
+            record_size = self.key_width + POINTER.size
+            low, high = 0, self.count
+            while low < high:
+                middle = (low + high) // 2
+                position = HEADER.size + middle * record_size
+                found = self._mm[position:position + self.key_width]
+                if found < key:
+                    low = middle + 1
+                elif found > key:
+                    high = middle
+                else:
+                    offset, length = POINTER.unpack_from(self._mm, position + self.key_width)
+                    start = self.heap_offset + offset
+                    value = self._mm[start:start + length].decode("utf-8")
+                    self.hits += 1
+                    oclc_number, call_number = value.split(SEPARATOR, 1)
+                    return oclc_number, call_number
+            self.misses += 1
+            return None
+
+    def entries(self):
+        """
+        Every (barcode, oclc_number, call_number) in barcode order.
+        """
+        with self._lock:
+            if not self.count:
+                return
+            record_size = self.key_width + POINTER.size
+            for index in range(self.count):
+                position = HEADER.size + index * record_size
+                barcode = self._mm[position:position + self.key_width].rstrip(b"\0").decode("utf-8")
+                offset, length = POINTER.unpack_from(self._mm, position + self.key_width)
+                start = self.heap_offset + offset
+                value = self._mm[start:start + length].decode("utf-8")
+                yield (barcode, *value.split(SEPARATOR, 1))
+
+    def sample(self, count):
+        """
+        Up to `count` indexed barcodes spread evenly over the index, e.g. to time lookups.
+        """
+        with self._lock:
+            if not self.count:
+                return []
+            record_size = self.key_width + POINTER.size
+            step = max(1, self.count // count)
+            return [
+                self._mm[position:position + self.key_width].rstrip(b"\0").decode("utf-8")
+                for position in range(HEADER.size, HEADER.size + self.count * record_size, step * record_size)
+                ][:count]
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "items": self.count,
+                "size_bytes": len(self._mm) if self._mm is not None else 0,
+                "built_at": self.built_at,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+    def close(self):
+        with self._lock:
+            self._close()
+
+
+def find_column(fieldnames, candidates, override=None):
+    names = {name.strip().lower(): name for name in fieldnames if name}
+    for candidate in ([override.lower()] if override else candidates):
+        if candidate in names:
+            return names[candidate]
+    raise ValueError(f"None of the columns {', '.join(fieldnames)} looks like {override or candidates[0]!r}")
+
+
+def read_export(path, barcode_column=None, oclc_column=None, call_number_column=None):
+    """
+    Yield (barcode, oclc_number, call_number) from a CSV or TSV item export with a header row.
+    OCLC numbers are normalized to plain digits without leading zeros, as Discovery returns
+    them. The call number is None if the export has no call number column.
+    """
+    with open(path, "r", newline="", encoding="utf-8-sig") as f:
+        header = f.readline()
+        f.seek(0)
+        delimiter = "\t" if header.count("\t") > header.count(",") else ","
+        reader = csv.DictReader(f, delimiter=delimiter)
+        barcode_key = find_column(reader.fieldnames or [], BARCODE_COLUMNS, barcode_column)
+        oclc_key = find_column(reader.fieldnames or [], OCLC_COLUMNS, oclc_column)
+        try:
+            call_number_key = find_column(reader.fieldnames or [], CALL_NUMBER_COLUMNS, call_number_column)
+        except ValueError:
+            if call_number_column:
+                raise
+            call_number_key = None
+        for row in reader:
+            barcode = (row.get(barcode_key) or "").strip()
+            match = OCLC_NUMBER_PATTERN.match((row.get(oclc_key) or "").strip())
+            if barcode and match:
+                oclc_number = str(int(match.group(1)))
+                if call_number_key is None:
+                    yield barcode, oclc_number, None
+                else:
+                    yield barcode, oclc_number, (row.get(call_number_key) or "").strip().replace(SEPARATOR, " ")
+
+
+def current_index_file(path):
+    """
+    The file holding the current version of the index named `path`: the one its pointer file
+    names, or `path` itself for an index built before versioned files were used.
+    """
+    try:
+        with open(f"{path}{POINTER_SUFFIX}", "r", encoding="utf-8") as f:
+            name = f.read().strip()
+    except FileNotFoundError:
+        return path
+    return os.path.join(os.path.dirname(path), name) if name else path
+
+
+def _replace_pointer(temp_path, pointer_path, attempts=5):
+    # On Windows, a reader that has the pointer open for the moment it takes to read it
+    # makes the replace fail; the pointer is never held open longer than that
+    for attempt in range(attempts):
+        try:
+            os.replace(temp_path, pointer_path)
+            return
+        except PermissionError:
+            if attempt == attempts - 1:
+                raise
+            time.sleep(0.1)
+
+
+def _remove_old_versions(path, current):
+    root, ext = os.path.splitext(os.path.basename(path))
+    pattern = re.compile(rf"{re.escape(root)}-\d+{re.escape(ext)}(\.tmp)?")
+    directory = os.path.dirname(path) or "."
+    stale = [os.path.join(directory, name) for name in os.listdir(directory) if pattern.fullmatch(name)]
+    for old in stale + [path]:
+        if os.path.basename(old) == os.path.basename(current) or not os.path.isfile(old):
+            continue
+        try:
+            os.remove(old)
+        except OSError as e:
+            # Still memory-mapped by a station or the service on Windows; removed next time
+            logging.info(f"Could not remove the old holdings index {old} yet: {e}")
+
+
+def build_index(path, rows):
+    """
+    Write the (barcode, oclc_number, call_number) `rows` as a sorted index named `path`.
+    Each build writes a new versioned file ("holdings-<time>.idx") and then switches the
+    pointer file ("holdings.idx.current") to it, so an index that a running station or
+    service has memory-mapped is never overwritten; old versions are removed once nothing
+    has them open. Later rows for a barcode win, except that a call number of None keeps
+    the one from an earlier row. Returns the count.
+    """
+    separator = SEPARATOR.encode("utf-8")
+    latest = {}
+    for barcode, oclc_number, call_number in rows:
+        key = barcode.encode("utf-8")
+        if call_number is None:
+            previous = latest.get(key)
+            call_number = previous.split(separator, 1)[1].decode("utf-8") if previous else ""
+        latest[key] = f"{oclc_number}{SEPARATOR}{call_number}".encode("utf-8")
+    keys = sorted(latest)
+    key_width = max((len(key) for key in keys), default=1)
+    if key_width > 0xFFFF:
+        raise ValueError("Barcode too long for the holdings index")
+    heap_offset = HEADER.size + len(keys) * (key_width + POINTER.size)
+
+    root, ext = os.path.splitext(path)
+    version_path = f"{root}-{time.time_ns()}{ext}"
+    temp_path = f"{version_path}.tmp"
+    with open(temp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, key_width, len(keys), heap_offset, time.time()))
+        offset = 0
+        for key in keys:
+            value = latest[key][:0xFFFF]
+            f.write(key.ljust(key_width, b"\0"))
+            f.write(POINTER.pack(offset, len(value)))
+            offset += len(value)
+        for key in keys:
+            f.write(latest[key][:0xFFFF])
+    os.replace(temp_path, version_path)
+
+    pointer_path = f"{path}{POINTER_SUFFIX}"
+    with open(f"{pointer_path}.tmp", "w", encoding="utf-8") as f:
+        f.write(os.path.basename(version_path))
+    _replace_pointer(f"{pointer_path}.tmp", pointer_path)
+    _remove_old_versions(path, version_path)
+    return len(keys)
+
+
+def import_exports(index_path, export_paths, merge=True, **columns):
+    """
+    Import item exports into the index at `index_path`. With `merge`, items already in the
+    index are kept unless an export lists them again, and an export without a call number
+    column keeps their call numbers. Returns the number of items indexed.
+    """
+    def rows():
+        if merge and os.path.exists(current_index_file(index_path)):
+            existing = HoldingsIndex(index_path)
+            try:
+                yield from existing.entries()
+            finally:
+                existing.close()
+        for export_path in export_paths:
+            yield from read_export(export_path, **columns)
+
+    return build_index(index_path, rows())
@@ -0,0 +1,224 @@
+import time
+import sqlite3
+import logging
+import threading
+
+# Entry states
+IN_FLIGHT = "in_flight"  # recorded, the API call is being made right now
+QUEUED = "queued"  # waiting for the replay worker
+DONE = "done"
+SKIPPED = "skipped"  # replay found the action was no longer needed
+FAILED = "failed"
+
+
+class CheckInJournal:
+    """
+    Write-ahead journal of check-in and non-loan return actions, stored in SQLite.
+
+    Every action is recorded before it is sent to OCLC. If the call fails because a service
+    is slow or down, the entry stays queued for the replay worker instead of being lost,
+    and entries left in flight by a crash are queued again on the next start.
+
+    `maybe_sent` is set once a failed attempt may have reached OCLC (rather than certainly
+    never leaving this computer), so replay can tell an action OCLC may already have
+    applied from one it never saw.
+
+    Finished (done, skipped and failed) entries older than `retention_days` are deleted at
+    start-up and once a day (0 keeps everything); queued entries are always kept.
+    """
+
+    def __init__(self, db_path, retention_days=90):
+        self.retention_days = retention_days
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=FULL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS actions ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, barcode TEXT NOT NULL, oclc_number TEXT, "
+            "action TEXT NOT NULL, state TEXT NOT NULL, attempts INTEGER NOT NULL DEFAULT 0, "
+            "created_at REAL NOT NULL, next_attempt_at REAL NOT NULL DEFAULT 0, "
+            "updated_at REAL NOT NULL, last_error TEXT, maybe_sent INTEGER NOT NULL DEFAULT 0)"
+            )
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(actions)")}
+        if "maybe_sent" not in columns:
+            # Journals from before maybe_sent: whether their queued actions reached OCLC is unknown
+            self._conn.execute("ALTER TABLE actions ADD COLUMN maybe_sent INTEGER NOT NULL DEFAULT 0")
+            self._conn.execute("UPDATE actions SET maybe_sent = 1 WHERE state = ?", (QUEUED,))
+        self._conn.execute("CREATE INDEX IF NOT EXISTS actions_state ON actions (state, id)")
+        # A crash mid-call leaves open whether OCLC received it
+        recovered = self._conn.execute(
+            "UPDATE actions SET state = ?, updated_at = ?, maybe_sent = 1 WHERE state = ?",
+            (QUEUED, time.time(), IN_FLIGHT)
+            ).rowcount
+        self._conn.commit()
+        if recovered:
+            logging.warning(f"Re-queued {recovered} journal action(s) left in flight by the last session.")
+        self._purged_at = 0.0
+        self.purge()
+
+    def _execute(self, sql, params=()):
+        with self._lock:
+            cursor = self._conn.execute(sql, params)
+            self._conn.commit()
+            return cursor
+
+    def record(self, barcode, oclc_number, action, state=IN_FLIGHT):
+        """
+        Durably record an intended action and return its id.
+        """
+        now = time.time()
+        return self._execute(
+            "INSERT INTO actions (barcode, oclc_number, action, state, created_at, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)", (barcode, oclc_number, action, state, now, now)
+            ).lastrowid
+
+    def complete(self, entry_id, state=DONE, detail=None):
+        self._execute(
+            "UPDATE actions SET state = ?, updated_at = ?, last_error = ? WHERE id = ?",
+            (state, time.time(), detail, entry_id)
+            )
+        self._purge_daily()
+
+    def _purge_daily(self):
+        if time.time() - self._purged_at >= 86400:
+            self.purge()
+
+    def purge(self):
+        """
+        Delete finished entries older than the retention period.
+        """
+        self._purged_at = time.time()
+        if not self.retention_days:
+            return 0
+        deleted = self._execute(
+            "DELETE FROM actions WHERE state IN (?, ?, ?) AND updated_at < ?",
+            (DONE, SKIPPED, FAILED, time.time() - self.retention_days * 86400)
+            ).rowcount
+        if deleted:
+            logging.info(
+                f"Removed {deleted} finished action(s) older than {self.retention_days} days from the journal"
+                )
+        return deleted
+
+    def defer(self, entry_id, error, delay=0, maybe_sent=False):
+        """
+        Queue an entry for (another) replay attempt after `delay` seconds. Pass `maybe_sent`
+        if the failed attempt may have reached OCLC; it is never cleared again.
+        """
+        now = time.time()
+        self._execute(
+            "UPDATE actions SET state = ?, attempts = attempts + 1, next_attempt_at = ?, updated_at = ?, "
+            "last_error = ?, maybe_sent = MAX(maybe_sent, ?) WHERE id = ?",
+            (QUEUED, now + delay, now, str(error), int(maybe_sent), entry_id)
+            )
+
+    def mark_maybe_sent(self, entry_id):
+        self._execute("UPDATE actions SET maybe_sent = 1 WHERE id = ?", (entry_id,))
+
+    def has_queued(self, barcode):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT 1 FROM actions WHERE barcode = ? AND state = ? LIMIT 1", (barcode, QUEUED)
+                ).fetchone() is not None
+
+    def queued(self):
+        """
+        Queued entries in the order they were recorded, as dicts.
+        """
+        with self._lock:
+            cursor = self._conn.execute(
+                "SELECT id, barcode, oclc_number, action, attempts, next_attempt_at, last_error, maybe_sent "
+                "FROM actions WHERE state = ? ORDER BY id", (QUEUED,)
+                )
+            columns = [column[0] for column in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    def queued_count(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM actions WHERE state = ?", (QUEUED,)).fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class ReplayWorker(threading.Thread):
+    """
+    Background thread that drains queued journal entries.
+
+    Entries are replayed oldest first, and once an entry for a barcode cannot be sent,
+    later entries for that barcode wait for the next round so per-barcode order is kept.
+    `replay(entry)` performs the action and returns (state, detail) with state DONE or
+    SKIPPED; it raises to signal that the entry should be retried later.
+    `on_progress(queued_count)` is called after every round that changed something, and
+    `on_failure(entry, error)` for every entry given up on, so it can be followed up by hand.
+    """
+
+    def __init__(self, journal, replay, is_transient, interval=30, max_attempts=20, on_progress=None,
+                 on_failure=None):
+        super().__init__(name="journal-replay", daemon=True)
+        self.journal = journal
+        self.replay = replay
+        self.is_transient = is_transient
+        self.interval = interval
+        self.max_attempts = max_attempts
+        self.on_progress = on_progress
+        self.on_failure = on_failure
+        self._stop_event = threading.Event()
+        self._wake_event = threading.Event()
+
+    def run(self):
+        self.report_progress()
+        while not self._stop_event.is_set():
+            try:
+                if self.drain():
+                    self.report_progress()
+            except Exception as e:
+                logging.error(f"Journal replay round failed: {e}")
+            self._wake_event.wait(self.interval)
+            self._wake_event.clear()
+
+    def wake(self):
+        """
+        Run a replay round now, e.g. after a new entry has been queued or OCLC recovered.
+        """
+        self._wake_event.set()
+
+    def stop(self):
+        self._stop_event.set()
+        self._wake_event.set()
+
+    def report_progress(self):
+        if self.on_progress:
+            self.on_progress(self.journal.queued_count())
+
+    def drain(self):
+        changed = False
+        blocked = set()  # barcodes with an earlier entry still waiting
+        now = time.time()
+        for entry in self.journal.queued():
+            if self._stop_event.is_set():
+                break
+            barcode = entry["barcode"]
+            if barcode in blocked or entry["next_attempt_at"] > now:
+                blocked.add(barcode)
+                continue
+            try:
+                state, detail = self.replay(entry)
+                self.journal.complete(entry["id"], state, detail)
+                logging.info(f"Replayed journal entry {entry['id']} ({entry['action']} {barcode}): {state}")
+            except Exception as e:
+                attempts = entry["attempts"] + 1
+                if not self.is_transient(e) or attempts >= self.max_attempts:
+                    self.journal.complete(entry["id"], FAILED, str(e))
+                    logging.error(f"Journal entry {entry['id']} ({entry['action']} {barcode}) failed: {e}")
+                    if self.on_failure:
+                        self.on_failure(entry, e)
+                else:
+                    # Back off exponentially, but never wait more than ten minutes
+                    self.journal.defer(entry["id"], e, delay=min(self.interval * 2 ** attempts, 600))
+                    blocked.add(barcode)
+                    logging.warning(f"Journal entry {entry['id']} ({entry['action']} {barcode}) deferred: {e}")
+            changed = True
+        return changed
@@ -0,0 +1,146 @@
+import re
+import json
+import queue
+import atexit
+import random
+import logging
+from logging.handlers import TimedRotatingFileHandler, QueueHandler, QueueListener
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# Patterns for secrets that must never reach the log files
+SECRET_PATTERNS = [
+    (re.compile(r"(Bearer\s+)[A-Za-z0-9._~+/=-]+"), r"\1[REDACTED]"),
+    (re.compile(r"""(["']?(?:access_token|refresh_token|client_secret|secret|wskey)["']?\s*[:=]\s*["']?)[^"',\s}&]+"""),
+     r"\1[REDACTED]"),
+]
+
+_listener = None
+_handlers = []
+_body_limit = 2000
+_body_sample_rate = 1.0
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """
+    Compact one-object-per-line format that is cheap to write and easy to parse later.
+    """
+
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName,
+            "msg": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class RedactingQueueListener(QueueListener):
+    """
+    QueueListener that redacts secrets and caps message length on the listener thread,
+    so the cost never lands on the thread that logged the message.
+    """
+
+    def __init__(self, log_queue, *handlers, max_length=20000):
+        super().__init__(log_queue, *handlers, respect_handler_level=True)
+        self.max_length = max_length
+        self.secrets = []
+
+    def prepare(self, record):
+        message = record.getMessage()
+        for secret in self.secrets:
+            message = message.replace(secret, "[REDACTED]")
+        for pattern, replacement in SECRET_PATTERNS:
+            message = pattern.sub(replacement, message)
+        if len(message) > self.max_length:
+            message = f"{message[:self.max_length]}... [{len(message) - self.max_length} chars truncated]"
+        record.msg = message
+        record.args = None
+        return record
+
+
+def init_logging(log_file, level=logging.DEBUG):
+    """
+    Route all log records through a queue; a background listener thread writes them to the
+    daily-rotated log file and the console.
+    """
+    global _listener, _handlers
+    file_handler = TimedRotatingFileHandler(
+        log_file,  # File path
+        when="midnight",  # Rotate at midnight
+        interval=1,  # Rotate every day
+        backupCount=14,  # Keep logs for 14 days
+        encoding="utf-8",
+        )
+    console_handler = logging.StreamHandler()  # Also log to the console
+    _handlers = [file_handler, console_handler]
+    for handler in _handlers:
+        handler.setFormatter(logging.Formatter(LOG_FORMAT))
+
+    log_queue = queue.SimpleQueue()
+    _listener = RedactingQueueListener(log_queue, *_handlers)
+    _listener.start()
+    atexit.register(stop_logging)
+
+    queue_handler = QueueHandler(log_queue)
+    # Only the message is rendered on the logging thread; the listener applies the real format
+    queue_handler.setFormatter(logging.Formatter("%(message)s"))
+    logging.basicConfig(level=level, handlers=[queue_handler], force=True)
+    logging.info("Logging initialized. Log file: %s", log_file)
+
+
+def configure_logging(config):
+    """
+    Apply the logging settings from config.json once it has been loaded.
+    """
+    global _body_limit, _body_sample_rate
+    level = str(config.get("log_level", "INFO")).upper()
+    logging.getLogger().setLevel(getattr(logging, level, logging.INFO))
+
+    if config.get("log_format", "text") == "jsonl":
+        for handler in _handlers:
+            handler.setFormatter(JsonLinesFormatter())
+    if not config.get("log_console", True) and len(_handlers) > 1:
+        _handlers[1].setLevel(logging.CRITICAL + 1)
+
+    _body_limit = int(config.get("log_body_limit", 2000))
+    _body_sample_rate = float(config.get("log_body_sample_rate", 1.0))
+    if _listener is not None:
+        _listener.secrets = [config[key] for key in ("wskey", "secret") if config.get(key)]
+
+
+def log_body(label, body):
+    """
+    Debug-log a request or response body. Nothing is formatted unless DEBUG is enabled,
+    bodies are cut to `log_body_limit` characters and only a `log_body_sample_rate`
+    fraction of them is written.
+    """
+    if not logging.getLogger().isEnabledFor(logging.DEBUG):
+        return
+    if _body_sample_rate < 1.0 and random.random() >= _body_sample_rate:
+        return
+    total = len(body)
+    body = body[:_body_limit]
+    if isinstance(body, bytes):
+        body = body.decode("utf-8", "replace")
+    if total > _body_limit:
+        body = f"{body}... [truncated, {total} chars]"
+    logging.debug("%s: %s", label, body)
+
+
+def stop_logging():
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def pending_log_records():
+    """
+    Number of log records waiting for the listener thread.
+    """
+    return _listener.queue.qsize() if _listener is not None else 0
@@ -0,0 +1,231 @@
+import os
+import json
+import time
+import socket
+import logging
+import threading
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+
+# Histogram bucket upper bounds in seconds (Prometheus style, cumulative on export)
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class LatencyHistogram:
+    """
+    Fixed-bucket latency histogram for export plus a ring of recent samples from which
+    the p50/p95/p99 shown in the UI are computed.
+    """
+
+    def __init__(self, recent=2048):
+        self.bucket_counts = [0] * (len(BUCKETS) + 1)  # last bucket is +Inf
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.recent = deque(maxlen=recent)
+
+    def observe(self, seconds, error=False):
+        self.bucket_counts[bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.errors += int(error)
+        self.recent.append(seconds)
+
+    def percentiles(self, *quantiles):
+        samples = sorted(self.recent)
+        if not samples:
+            return [0.0 for _ in quantiles]
+        return [samples[min(len(samples) - 1, int(q * len(samples)))] for q in quantiles]
+
+    def snapshot(self):
+        p50, p95, p99 = self.percentiles(0.5, 0.95, 0.99)
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "mean_ms": round(self.total / self.count * 1000, 2) if self.count else 0.0,
+            "p50_ms": round(p50 * 1000, 2),
+            "p95_ms": round(p95 * 1000, 2),
+            "p99_ms": round(p99 * 1000, 2),
+        }
+
+
+class Metrics:
+    """
+    Thread-safe per-stage latency histograms, error counts and scan throughput.
+    """
+
+    def __init__(self, station=None):
+        self.station = station or socket.gethostname()
+        self.started_at = time.time()
+        self._lock = threading.Lock()
+        self.stages = {}
+        self.scans = 0
+        self.scan_errors = 0
+        self.recent_scans = deque()  # completion times within the last minute
+        self.gauges = {}  # name -> callable returning a number, read at snapshot time
+        self.counters = {}  # name -> running total, e.g. bytes received
+
+    def observe(self, stage, seconds, error=False):
+        with self._lock:
+            histogram = self.stages.get(stage)
+            if histogram is None:
+                histogram = self.stages[stage] = LatencyHistogram()
+            histogram.observe(seconds, error)
+
+    @contextmanager
+    def time(self, stage):
+        """
+        Time the enclosed block as one `stage` call; an exception counts as an error.
+        """
+        started = time.perf_counter()
+        error = False
+        try:
+            yield
+        except BaseException:
+            error = True
+            raise
+        finally:
+            self.observe(stage, time.perf_counter() - started, error)
+
+    def add(self, counter, amount=1):
+        with self._lock:
+            self.counters[counter] = self.counters.get(counter, 0) + amount
+
+    def total(self, prefix):
+        """
+        Sum of the counters whose names start with `prefix`.
+        """
+        with self._lock:
+            return sum(value for name, value in self.counters.items() if name.startswith(prefix))
+
+    def scan_finished(self, seconds, error=False):
+        now = time.time()
+        self.observe("scan", seconds, error)
+        with self._lock:
+            self.scans += 1
+            self.scan_errors += int(error)
+            self.recent_scans.append(now)
+            self._trim(now)
+
+    def _trim(self, now):
+        while self.recent_scans and self.recent_scans[0] < now - 60:
+            self.recent_scans.popleft()
+
+    def register_gauge(self, name, read):
+        self.gauges[name] = read
+
+    def scans_per_minute(self):
+        with self._lock:
+            self._trim(time.time())
+            return len(self.recent_scans)
+
+    def snapshot(self):
+        scans_per_minute = self.scans_per_minute()
+        with self._lock:
+            stages = {name: histogram.snapshot() for name, histogram in self.stages.items()}
+            counters = dict(self.counters)
+        gauges = {}
+        for name, read in self.gauges.items():
+            try:
+                gauges[name] = read()
+            except Exception as e:
+                logging.debug(f"Could not read gauge {name}: {e}")
+        return {
+            "station": self.station,
+            "timestamp": round(time.time(), 3),
+            "uptime_s": round(time.time() - self.started_at, 1),
+            "scans": self.scans,
+            "scan_errors": self.scan_errors,
+            "scans_per_minute": scans_per_minute,
+            "stages": stages,
+            "counters": counters,
+            "gauges": gauges,
+        }
+
+    def summary(self):
+        """
+        One-line summary for the status bar: throughput, scan latency and the slowest stage.
+        """
+        snapshot = self.snapshot()
+        parts = [f"{snapshot['scans_per_minute']} scans/min"]
+        scan = snapshot["stages"].get("scan")
+        if scan:
+            parts.append(f"scan p50 {scan['p50_ms']:.0f} ms / p95 {scan['p95_ms']:.0f} ms")
+        stages = {name: stage for name, stage in snapshot["stages"].items() if name != "scan"}
+        if stages:
+            name, slowest = max(stages.items(), key=lambda item: item[1]["p95_ms"])
+            parts.append(f"slowest: {name} p95 {slowest['p95_ms']:.0f} ms")
+        return " | ".join(parts)
+
+    def to_prometheus(self):
+        """
+        Render all metrics in the Prometheus text exposition format.
+        """
+        station = self.station.replace("\\", "\\\\").replace('"', '\\"')
+        lines = [
+            "# HELP checkin_stage_seconds Latency of each check-in pipeline stage.",
+            "# TYPE checkin_stage_seconds histogram",
+        ]
+        with self._lock:
+            histograms = list(self.stages.items())
+            for name, histogram in histograms:
+                labels = f'station="{station}",stage="{name}"'
+                cumulative = 0
+                for bound, count in zip(BUCKETS + (float("inf"),), histogram.bucket_counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f'checkin_stage_seconds_bucket{{{labels},le="{le}"}} {cumulative}')
+                lines.append(f"checkin_stage_seconds_sum{{{labels}}} {histogram.total:.6f}")
+                lines.append(f"checkin_stage_seconds_count{{{labels}}} {histogram.count}")
+            lines.append("# HELP checkin_stage_errors_total Failed calls per pipeline stage.")
+            lines.append("# TYPE checkin_stage_errors_total counter")
+            for name, histogram in histograms:
+                lines.append(f'checkin_stage_errors_total{{station="{station}",stage="{name}"}} {histogram.errors}')
+            counters = dict(self.counters)
+        for name, value in counters.items():
+            lines.append(f"# TYPE checkin_{name}_total counter")
+            lines.append(f'checkin_{name}_total{{station="{station}"}} {value}')
+        lines.append("# TYPE checkin_scans_per_minute gauge")
+        lines.append(f'checkin_scans_per_minute{{station="{station}"}} {self.scans_per_minute()}')
+        for name, value in self.snapshot()["gauges"].items():
+            if isinstance(value, (int, float)):
+                lines.append(f"# TYPE checkin_{name} gauge")
+                lines.append(f'checkin_{name}{{station="{station}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+    def export(self, path, fmt="json"):
+        """
+        Write the current metrics to `path`, replacing the previous file atomically.
+        """
+        content = self.to_prometheus() if fmt == "prometheus" else json.dumps(self.snapshot(), indent=2)
+        temp_path = f"{path}.tmp"
+        try:
+            with open(temp_path, "w", encoding="utf-8") as f:
+                f.write(content)
+            os.replace(temp_path, path)
+        except OSError as e:
+            logging.error(f"Could not export metrics to {path}: {e}")
+
+
+class MetricsExporter(threading.Thread):
+    """
+    Background thread that exports the metrics every `interval` seconds, and once more on stop.
+    """
+
+    def __init__(self, metrics, path, fmt="json", interval=60):
+        super().__init__(name="metrics-export", daemon=True)
+        self.metrics = metrics
+        self.path = path
+        self.fmt = fmt
+        self.interval = interval
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            self.metrics.export(self.path, self.fmt)
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+        self.metrics.export(self.path, self.fmt)
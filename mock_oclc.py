@@ -0,0 +1,413 @@
+"""
+Local stand-in for the OCLC services used by the check-in pipeline, for benchmarks and
+trying the application without credentials. Emulates the OAuth token endpoint, Discovery
+my-holdings, the SRU availability service, NCIP CheckInItem and the usages routing, with
+optional latency, random errors and HTTP 429 throttling.
+
+    python mock_oclc.py --port 8089 --latency-ms 80 --error-rate 0.01
+
+Point config.json at it with the URLs printed on start-up.
+"""
+import re
+import sys
+import gzip
+import json
+import time
+import random
+import argparse
+import threading
+import urllib.parse
+from xml.sax.saxutils import escape, unescape
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SRU_NAMESPACE = "http://www.loc.gov/zing/srw/"
+NCIP_NAMESPACE = "http://www.niso.org/2008/ncip"
+AVAILABILITY_PATH = "/circ/availability/sru/service"
+# The mock accepts any client credentials; these complete a config for it
+CREDENTIALS = {
+    "wskey": "mock-wskey", "secret": "mock-secret", "scope": "WMS_CIRCULATION WMS_NCIP",
+    "institution_id": "12345", "registry_id": "12345",
+}
+
+
+# The rest of a full MARC bibliographic record, which the parser skips
+MARC_FIELDS = "".join([
+    '<controlfield tag="008">120315s2012    nyu      b    001 0 eng  </controlfield>',
+    '<datafield tag="020" ind1=" " ind2=" "><subfield code="a">9780000000000</subfield></datafield>',
+    '<datafield tag="260" ind1=" " ind2=" "><subfield code="a">New York :</subfield>'
+    '<subfield code="b">Example Press,</subfield><subfield code="c">2012.</subfield></datafield>',
+    '<datafield tag="300" ind1=" " ind2=" "><subfield code="a">xii, 356 pages :</subfield>'
+    '<subfield code="b">illustrations ;</subfield><subfield code="c">24 cm</subfield></datafield>',
+    '<datafield tag="504" ind1=" " ind2=" "><subfield code="a">Includes bibliographical references '
+    '(pages 331-349) and index.</subfield></datafield>',
+    *(f'<datafield tag="650" ind1=" " ind2="0"><subfield code="a">Example subject {n}</subfield>'
+      f'<subfield code="x">History</subfield><subfield code="y">20th century.</subfield></datafield>'
+      for n in range(6)),
+    '<datafield tag="520" ind1=" " ind2=" "><subfield code="a">' + "A summary of the work. " * 12
+    + "</subfield></datafield>",
+])
+
+
+def sru_record(oclc_number, items, title="Untitled", author="Unknown", full_marc=False):
+    """
+    One SRU opacxml record. `items` is a list of (barcode, call number, reason unavailable)
+    tuples; a reason of None means the item is on the shelf. With `full_marc` the record
+    carries the MARC fields a real bibliographic record has besides title and author.
+    """
+    parts = [
+        "<srw:record><srw:recordSchema>info:srw/schema/5/opacxml</srw:recordSchema><srw:recordData>",
+        "<opacRecord><bibliographicRecord><record>",
+        f'<controlfield tag="001">{oclc_number}</controlfield>',
+        f'<datafield tag="245"><subfield code="a">{escape(title)}</subfield></datafield>',
+        f'<datafield tag="100"><subfield code="a">{escape(author)}</subfield></datafield>',
+        MARC_FIELDS if full_marc else "",
+        "</record></bibliographicRecord><holdings>",
+    ]
+    for barcode, call_number, reason in items:
+        if reason is None:
+            state = '<availableNow value="1"/>'
+        else:
+            state = ('<availableNow value="0"/><availabilityDate>2026-12-01T00:00:00.000Z</availabilityDate>'
+                     f"<reasonUnavailable>{reason}</reasonUnavailable>")
+        parts.append(
+            f"<holding><localLocation>Main Stacks</localLocation><callNumber>{escape(call_number)}</callNumber>"
+            f"<circulations><circulation>{state}<itemId>{barcode}</itemId>"
+            '<onHold value="0"/></circulation></circulations></holding>'
+        )
+    parts.append("</holdings></opacRecord></srw:recordData></srw:record>")
+    return "".join(parts)
+
+
+def sru_response(records):
+    """
+    Wrap already rendered `sru_record` strings in an SRU searchRetrieveResponse.
+    """
+    return "".join([
+        '<?xml version="1.0" encoding="UTF-8"?>',
+        f'<srw:searchRetrieveResponse xmlns:srw="{SRU_NAMESPACE}">',
+        f"<srw:version>1.1</srw:version><srw:numberOfRecords>{len(records)}</srw:numberOfRecords>",
+        "<srw:records>", *records, "</srw:records></srw:searchRetrieveResponse>",
+    ])
+
+
+def build_sru_response(holdings, oclc_number="12345", barcode_prefix="3900000"):
+    """
+    Synthetic SRU availability response for one bib record with `holdings` holdings, each
+    holding one circulation item (shaped like a serial or multi-volume set).
+    """
+    items = [
+        (f"{barcode_prefix}{i:07d}", f"QA76 .S{i}", None if i % 3 else "ON_LOAN")
+        for i in range(holdings)
+    ]
+    return sru_response([sru_record(oclc_number, items, "Journal of Synthetic Holdings", "Example, Author.")])
+
+
+def ncip_response(barcode, problem=None, routing="Return to shelf"):
+    if problem:
+        body = (f"<Problem><ProblemType>{problem}</ProblemType>"
+                f"<ProblemDetail>Item {escape(barcode)} is not checked out</ProblemDetail></Problem>")
+    else:
+        body = f"<ItemId><ItemIdentifierValue>{escape(barcode)}</ItemIdentifierValue></ItemId>" \
+               f"<RoutingInstructions>{escape(routing)}</RoutingInstructions>"
+    return (f'<?xml version="1.0" encoding="UTF-8"?><NCIPMessage xmlns="{NCIP_NAMESPACE}">'
+            f"<CheckInItemResponse>{body}</CheckInItemResponse></NCIPMessage>")
+
+
+class MockCatalog:
+    """
+    In-memory holdings: `titles` bib records with `copies` items each. About
+    `checked_out_ratio` of the items start out on loan; check-ins change the state.
+    Barcodes added to `in_transit` are shown as TRANSIT, and CheckInItem accepts them with
+    transit routing instructions, as WMS does for an item scanned on its way elsewhere.
+    """
+
+    def __init__(self, titles=1000, copies=3, checked_out_ratio=0.5, seed=42):
+        self.titles = titles
+        self.copies = copies
+        self.checked_out_ratio = checked_out_ratio
+        self.seed = seed
+        self._lock = threading.Lock()
+        self.barcodes = [f"39{n:012d}" for n in range(titles * copies)]
+        self.reset()
+
+    def reset(self):
+        rng = random.Random(self.seed)
+        with self._lock:
+            self.on_loan = {barcode for barcode in self.barcodes if rng.random() < self.checked_out_ratio}
+            self.in_transit = set()
+            self.usages = {}
+
+    def oclc_number(self, barcode):
+        try:
+            index = int(barcode[2:]) if barcode.startswith("39") else -1
+        except ValueError:
+            return None
+        if not 0 <= index < len(self.barcodes):
+            return None
+        return str(100000 + index // self.copies)
+
+    def record(self, oclc_number):
+        title = int(oclc_number) - 100000
+        if not 0 <= title < self.titles:
+            return None
+        with self._lock:
+            items = [
+                (barcode, f"PS{3500 + title} .M{copy}", self.reason_unavailable(barcode))
+                for copy, barcode in enumerate(self.barcodes[title * self.copies:(title + 1) * self.copies])
+            ]
+        return sru_record(oclc_number, items, f"Mock Title {title}", f"Author, Mock {title % 97}.", full_marc=True)
+
+    def reason_unavailable(self, barcode):
+        if barcode in self.in_transit:
+            return "TRANSIT"
+        return "ON_LOAN" if barcode in self.on_loan else None
+
+    def check_in(self, barcode):
+        """
+        Returns the routing instructions, or None if the item was neither on loan nor in transit.
+        """
+        with self._lock:
+            if barcode in self.in_transit:
+                self.on_loan.discard(barcode)
+                return "In transit to Branch Library"
+            if barcode not in self.on_loan:
+                return None
+            self.on_loan.discard(barcode)
+            return "Return to shelf"
+
+    def record_usage(self, barcode):
+        with self._lock:
+            self.usages[barcode] = self.usages.get(barcode, 0) + 1
+            return self.usages[barcode]
+
+
+class MockOCLCHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, like the real services
+    server_version = "MockOCLC/1.0"
+    disable_nagle_algorithm = True  # headers and body are written separately
+
+    def log_message(self, format, *args):
+        pass  # Quiet; the benchmark reports its own numbers
+
+    def do_GET(self):
+        self.handle_request("GET")
+
+    def do_POST(self):
+        self.handle_request("POST")
+
+    def do_HEAD(self):
+        # Connection pre-warming; like the real services, no content
+        self.send_response(204)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def send(self, status, body, content_type="application/json", headers=None):
+        data = body.encode("utf-8") if isinstance(body, str) else body
+        compress = self.server.compress and len(data) >= 256 and "gzip" in self.headers.get("Accept-Encoding", "")
+        if compress:
+            data = gzip.compress(data, compresslevel=6)
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        if compress:
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def handle_request(self, method):
+        server = self.server
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length).decode("utf-8", "replace") if length else ""
+        url = urllib.parse.urlsplit(self.path)
+        query = urllib.parse.parse_qs(url.query)
+        endpoint = server.endpoint(method, url.path)
+        server.count(endpoint or "unknown")
+
+        server.delay()
+        fault = 429 if server.over_quota(endpoint) else server.fault()
+        if fault == 429:
+            return self.send(429, '{"message": "Too many requests"}', headers={"Retry-After": str(server.retry_after)})
+        if fault:
+            return self.send(fault, '{"message": "Injected failure"}')
+
+        if endpoint is None:
+            return self.send(404, '{"message": "Not found"}')
+        if endpoint == "token":
+            if not self.headers.get("Authorization", "").startswith("Basic "):
+                return self.send(401, '{"message": "Missing client credentials"}')
+            token = f"mock-{random.getrandbits(64):016x}"
+            server.tokens.add(token)
+            return self.send(200, json.dumps({"access_token": token, "token_type": "bearer",
+                                              "expires_in": server.token_lifetime}))
+        if self.headers.get("Authorization", "")[len("Bearer "):] not in server.tokens:
+            return self.send(401, '{"message": "Invalid or expired token"}')
+
+        catalog = server.catalog
+        if endpoint == "discovery":
+            oclc_number = catalog.oclc_number(query.get("barcode", [""])[0])
+            if oclc_number is None:
+                return self.send(200, json.dumps({"numberOfHoldings": 0, "detailedHoldings": []}))
+            return self.send(200, json.dumps({
+                "numberOfHoldings": 1,
+                "detailedHoldings": [{"oclcNumber": oclc_number, "location": {"holdingLocation": "MAIN"}}],
+            }))
+        if endpoint == "availability":
+            numbers = re.findall(r"no:(\d+)", query.get("query", [""])[0])
+            records = [record for record in map(catalog.record, numbers) if record]
+            records = records[:int(query.get("maximumRecords", ["10"])[0])]
+            return self.send(200, sru_response(records), "text/xml;charset=UTF-8")
+        if endpoint == "ncip":
+            match = re.search(r"<ItemIdentifierValue>([^<]+)</ItemIdentifierValue>", body)
+            barcode = unescape(match.group(1)) if match else ""
+            routing = catalog.check_in(barcode)
+            problem = None if routing else "Item Not Checked Out"
+            return self.send(200, ncip_response(barcode, problem, routing), "application/xml")
+        if endpoint == "usages":
+            barcode = urllib.parse.unquote(url.path.split("/")[-3])
+            count = catalog.record_usage(barcode)
+            return self.send(200, json.dumps({"itemBarcode": barcode, "usageCount": count}))
+
+
+class MockOCLCServer(ThreadingHTTPServer):
+    """
+    Threaded mock server. `latency_ms` (+ up to `jitter_ms`) is added to every request,
+    `error_rate` of requests fail with HTTP 500 and `throttle_rate` get HTTP 429 with
+    a `retry_after` second Retry-After header. With a `quota`, requests beyond that many per
+    second to one endpoint get HTTP 429 as well, like an API key's rate limit. With
+    `compress`, responses are gzipped for clients that accept it.
+    """
+    daemon_threads = True
+    request_queue_size = 128  # the default backlog of 5 drops connections under load
+
+    def __init__(self, catalog=None, port=0, latency_ms=0, jitter_ms=0, error_rate=0.0,
+                 throttle_rate=0.0, retry_after=1, quota=0, compress=True,
+                 token_lifetime=1199, seed=None):
+        super().__init__(("127.0.0.1", port), MockOCLCHandler)
+        self.catalog = catalog or MockCatalog()
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.quota = quota
+        self.compress = compress
+        self.quota_windows = {}  # endpoint -> (second, requests in it)
+        self.token_lifetime = token_lifetime
+        self.tokens = set()
+        self.random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.requests = {}
+        self._thread = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def config(self):
+        """
+        The config.json URL settings that route the application to this server.
+        """
+        return {
+            "oauth_server_token": f"{self.url}/oauth/token",
+            "discovery_api_url": f"{self.url}/discovery",
+            "availability_api_url": f"{self.url}{AVAILABILITY_PATH}",
+            "ncip_api_url": f"{self.url}/ncip",
+            "circulation_api_url": f"{self.url}/circ",
+        }
+
+    @staticmethod
+    def endpoint(method, path):
+        if method == "POST" and path == "/oauth/token":
+            return "token"
+        if method == "GET" and path == "/discovery/search/my-holdings":
+            return "discovery"
+        if method == "GET" and path == AVAILABILITY_PATH:
+            return "availability"
+        if method == "POST" and path == "/ncip":
+            return "ncip"
+        if method == "POST" and re.fullmatch(r"/circ/items/[^/]+/routings/usages", path):
+            return "usages"
+        return None
+
+    def count(self, endpoint):
+        with self._lock:
+            self.requests[endpoint] = self.requests.get(endpoint, 0) + 1
+
+    def over_quota(self, endpoint):
+        if not self.quota:
+            return False
+        second = int(time.monotonic())
+        with self._lock:
+            window, used = self.quota_windows.get(endpoint, (second, 0))
+            if window != second:
+                used = 0
+            self.quota_windows[endpoint] = (second, used + 1)
+        return used >= self.quota
+
+    def delay(self):
+        if self.latency_ms or self.jitter_ms:
+            with self._lock:
+                jitter = self.random.uniform(0, self.jitter_ms)
+            time.sleep((self.latency_ms + jitter) / 1000)
+
+    def fault(self):
+        """
+        HTTP status of an injected failure for this request, or None.
+        """
+        with self._lock:
+            roll = self.random.random()
+        if roll < self.throttle_rate:
+            return 429
+        if roll < self.throttle_rate + self.error_rate:
+            return 500
+        return None
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, name="mock-oclc", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Local mock of the OCLC services used for check-in")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--titles", type=int, default=1000, help="Number of bib records")
+    parser.add_argument("--copies", type=int, default=3, help="Items per bib record")
+    parser.add_argument("--checked-out", type=float, default=0.5, help="Fraction of items on loan at start")
+    parser.add_argument("--latency-ms", type=float, default=0, help="Added to every response")
+    parser.add_argument("--jitter-ms", type=float, default=0, help="Random extra latency, up to this much")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests failing with HTTP 500")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="Fraction of requests answered with HTTP 429")
+    parser.add_argument("--retry-after", type=int, default=1, help="Retry-After seconds sent with HTTP 429")
+    parser.add_argument("--quota", type=int, default=0, help="Requests per second per endpoint before HTTP 429")
+    parser.add_argument("--no-compression", action="store_true", help="Never gzip responses")
+    args = parser.parse_args(argv)
+
+    catalog = MockCatalog(args.titles, args.copies, args.checked_out)
+    server = MockOCLCServer(
+        catalog, port=args.port, latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate, throttle_rate=args.throttle_rate, retry_after=args.retry_after,
+        quota=args.quota, compress=not args.no_compression,
+    )
+    print(f"Mock OCLC services on {server.url} with {len(catalog.barcodes)} items "
+          f"(barcodes {catalog.barcodes[0]} - {catalog.barcodes[-1]}). config.json settings:")
+    print(json.dumps(server.config(), indent=4))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
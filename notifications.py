@@ -0,0 +1,147 @@
+import time
+import logging
+from PyQt5.QtCore import Qt, QAbstractTableModel, QModelIndex, QVariant
+from PyQt5.QtGui import QColor, QFont
+
+HEADERS = ["Time", "Severity", "Message", "Count"]
+INFO, WARNING, CRITICAL = "info", "warning", "critical"
+SEVERITY_LABELS = {INFO: "Info", WARNING: "Warning", CRITICAL: "Error"}
+SEVERITY_COLORS = {INFO: QColor(0, 123, 255), WARNING: QColor(184, 134, 11), CRITICAL: QColor(255, 0, 0)}
+RESOLVED_COLOR = QColor(160, 160, 160)
+
+
+class Notification:
+    """
+    One warning or error. Repeats of an open notification only raise `count`.
+    """
+    __slots__ = ("severity", "title", "message", "count", "first_at", "last_at", "resolved")
+
+    def __init__(self, severity, title, message):
+        self.severity = severity
+        self.title = title
+        self.message = message
+        self.count = 1
+        self.first_at = self.last_at = time.time()
+        # Information needs no follow-up; warnings and errors stay open until resolved
+        self.resolved = severity == INFO
+
+    @property
+    def key(self):
+        return self.severity, self.title, self.message
+
+    def text(self):
+        return f"{self.title}: {' '.join(self.message.split())}"
+
+
+class NotificationModel(QAbstractTableModel):
+    """
+    Notifications shown next to the results instead of modal dialogs, newest first.
+
+    `notify()` never blocks: a notification identical to one that is still open is folded
+    into it. Open notifications stay until `resolve()` is called, so staff can keep
+    scanning and deal with them later. Beyond `max_items`, the oldest resolved ones are
+    dropped first, then the oldest open warnings and errors (which are written to the log),
+    so the list never grows without bound.
+    """
+
+    def __init__(self, max_items=200, parent=None):
+        super().__init__(parent)
+        self.max_items = max(1, max_items)
+        self.items = []
+        self.open = {}  # key -> open Notification
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.items)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(HEADERS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return HEADERS[section]
+        return QVariant()
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return QVariant()
+        item = self.items[index.row()]
+        column = index.column()
+        if role == Qt.DisplayRole:
+            if column == 0:
+                return time.strftime("%H:%M:%S", time.localtime(item.last_at))
+            if column == 1:
+                return SEVERITY_LABELS[item.severity] + (" (resolved)" if item.resolved and item.severity != INFO else "")
+            if column == 2:
+                return item.text()
+            return str(item.count) if item.count > 1 else ""
+        if role == Qt.ToolTipRole:
+            return f"{item.title}\n\n{item.message}"
+        if role == Qt.ForegroundRole:
+            if item.resolved and item.severity != INFO:
+                return RESOLVED_COLOR
+            return SEVERITY_COLORS[item.severity]
+        if role == Qt.FontRole and column == 1 and not item.resolved:
+            font = QFont()
+            font.setBold(True)
+            return font
+        return QVariant()
+
+    def notify(self, severity, title, message):
+        """
+        Add a notification, or count a repeat of one that is still open. Returns it.
+        """
+        item = self.open.get((severity, title, message))
+        if item is not None:
+            item.count += 1
+            item.last_at = time.time()
+            row = self.items.index(item)
+            self.dataChanged.emit(self.index(row, 0), self.index(row, len(HEADERS) - 1))
+            return item
+        item = Notification(severity, title, message)
+        self.beginInsertRows(QModelIndex(), 0, 0)
+        self.items.insert(0, item)
+        self.endInsertRows()
+        if not item.resolved:
+            self.open[item.key] = item
+        self.trim()
+        return item
+
+    def resolve(self, rows):
+        """
+        Mark the notifications in the given `rows` as dealt with.
+        """
+        for row in rows:
+            item = self.items[row]
+            if not item.resolved:
+                item.resolved = True
+                self.open.pop(item.key, None)
+                self.dataChanged.emit(self.index(row, 0), self.index(row, len(HEADERS) - 1))
+
+    def clear_resolved(self):
+        self.beginResetModel()
+        self.items = [item for item in self.items if not item.resolved]
+        self.endResetModel()
+
+    def trim(self):
+        excess = len(self.items) - self.max_items
+        # Resolved first, then open warnings, then open errors; oldest first, never the newest
+        for droppable in (lambda item: item.resolved, lambda item: item.severity != CRITICAL, lambda item: True):
+            for row in range(len(self.items) - 1, 0, -1):
+                if excess <= 0:
+                    return
+                item = self.items[row]
+                if not droppable(item):
+                    continue
+                if not item.resolved:
+                    self.open.pop(item.key, None)
+                    logging.warning(f"Notification list full; dropped unresolved ({item.count}x): {item.text()}")
+                self.beginRemoveRows(QModelIndex(), row, row)
+                del self.items[row]
+                self.endRemoveRows()
+                excess -= 1
+
+    def open_count(self):
+        return len(self.open)
+
+    def open_items(self):
+        return [item for item in self.items if not item.resolved]
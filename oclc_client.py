@@ -0,0 +1,457 @@
+import json
+import logging
+import threading
+import urllib.parse
+import xml.etree.ElementTree as ET
+from xml.sax.saxutils import escape
+
+import requests
+
+from log_setup import log_body
+from metrics import Metrics
+from transport import HttpTransport, transfer_sizes
+from tokens import TokenManager
+from availability import parse_availability
+from resilience import Stage, RetryPolicy, CircuitBreaker, TokenBucket, AIMDLimiter, is_transient, request_not_sent
+
+DEFAULT_AVAILABILITY_URL = "https://worldcat.org/circ/availability/sru/service"
+REQUIRED_SETTINGS = (
+    "oauth_server_token", "wskey", "secret", "scope", "discovery_api_url", "ncip_api_url",
+    "institution_id", "registry_id",
+)
+UNKNOWN_OCLC_NUMBER = "Unknown OCLC Number"
+
+
+class CheckInProblem(Exception):
+    """
+    NCIP answered CheckInItem with a Problem element.
+    """
+
+    def __init__(self, problem_type, detail):
+        super().__init__(f"Check-in failed with problem: Problem Type: {problem_type}, Detail: {detail}")
+        self.problem_type = problem_type
+        self.detail = detail
+
+    @property
+    def not_checked_out(self):
+        return "not checked out" in (self.problem_type or "").lower()
+
+
+def load_config(path):
+    """
+    Read the settings from a config.json. Errors are raised, not reported, so callers decide.
+    """
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def build_stage(name, retry_on, config, pool_size=4):
+    """
+    Retry policy, circuit breaker, rate limit and adaptive concurrency for one OCLC endpoint.
+    The concurrency limit never exceeds `pool_size`: no more calls than that can run at once
+    (worker threads and pooled connections), so a higher limit would only be reported.
+    """
+    policy = RetryPolicy(
+        retry_on,
+        max_attempts=config.get("retry_max_attempts", 3),
+        base_delay=config.get("retry_base_delay", 0.5),
+        max_delay=config.get("retry_max_delay", 8),
+        )
+    breaker = CircuitBreaker(
+        name,
+        failure_threshold=config.get("circuit_failure_threshold", 5),
+        reset_timeout=config.get("circuit_reset_timeout", 30),
+        )
+    rate = config.get("rate_limits", {}).get(name, 0)
+    rate_limiter = TokenBucket(rate, burst=config.get("rate_limit_burst", 1))
+    concurrency = None
+    if config.get("adaptive_concurrency", True):
+        concurrency = AIMDLimiter(
+            initial=config.get("concurrency_initial", pool_size),
+            minimum=config.get("concurrency_min", 1),
+            maximum=min(config.get("concurrency_max", pool_size), pool_size),
+            latency_target=config.get("concurrency_latency_target", 2.0),
+            )
+    return Stage(name, policy, breaker, rate_limiter, concurrency)
+
+
+class OclcClient:
+    """
+    The OCLC WMS calls used for a check-in: OAuth token, Discovery my-holdings, SRU
+    availability, NCIP CheckInItem and in-library use, with no Qt and no global state.
+
+    Everything comes from the `config` dict (the settings of config.json); `metrics`,
+    `transport` and `stages` can be passed in to share them or to replace them in tests.
+    Thread-safe: one client serves any number of concurrent scans.
+    """
+
+    def __init__(self, config, pool_size=4, metrics=None, transport=None, stages=None):
+        missing = [key for key in REQUIRED_SETTINGS if key not in config]
+        if missing:
+            raise ValueError(f"Missing OCLC settings: {', '.join(missing)}")
+        self.config = config
+        self.metrics = metrics if metrics is not None else Metrics()
+        # One pooled, keep-alive transport shared by every OCLC call
+        self.transport = transport or HttpTransport(timeout=config.get("http_timeout", 10), pool_maxsize=pool_size)
+        # Reads are retried on transient errors; CheckInItem and usages POSTs only when OCLC
+        # certainly never received them.
+        self.stages = stages or {
+            "token": build_stage("token", is_transient, config, pool_size),
+            "discovery": build_stage("discovery", is_transient, config, pool_size),
+            "availability": build_stage("availability", is_transient, config, pool_size),
+            "ncip": build_stage("ncip", request_not_sent, config, pool_size),
+            "usages": build_stage("usages", request_not_sent, config, pool_size),
+            }
+        # One OAuth token shared by Discovery, availability, NCIP and usages calls
+        self.token_manager = TokenManager(
+            self.transport, config["oauth_server_token"], config["wskey"], config["secret"],
+            config["scope"], refresh_ahead=config.get("token_refresh_ahead", 300),
+            stage=self.stages["token"],
+            )
+
+    @classmethod
+    def from_file(cls, path, **kwargs):
+        return cls(load_config(path), **kwargs)
+
+    @property
+    def availability_url(self):
+        return self.config.get("availability_api_url", DEFAULT_AVAILABILITY_URL)
+
+    @property
+    def circulation_url(self):
+        return self.config.get(
+            "circulation_api_url", f"https://{self.config['institution_id']}.share.worldcat.org/circ"
+            )
+
+    def prewarm(self):
+        """
+        Fetch the OAuth token and open a keep-alive connection to each OCLC host in parallel,
+        so the first scan does not pay for DNS lookups, TLS handshakes and the token request.
+        Returns the number of hosts.
+        """
+        hosts = {}
+        for url in (self.config["discovery_api_url"], self.availability_url,
+                    self.config["ncip_api_url"], self.circulation_url):
+            parts = urllib.parse.urlsplit(url)
+            hosts.setdefault(parts.netloc, f"{parts.scheme}://{parts.netloc}/")
+
+        def warm_token():
+            try:
+                self.get_access_token()
+            except Exception as e:
+                logging.warning(f"Could not fetch the access token ahead of the first scan: {e}")
+
+        def warm_host(url):
+            try:
+                # Any answer will do; the connection stays in the pool for the first scan
+                self.transport.request("HEAD", url, allow_redirects=False)
+            except requests.RequestException as e:
+                logging.debug(f"Could not pre-connect to {url}: {e}")
+
+        threads = [threading.Thread(target=warm_token, name="prewarm-token", daemon=True)]
+        threads += [threading.Thread(target=warm_host, args=(url,), name="prewarm-host", daemon=True)
+                    for url in hosts.values()]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return len(hosts)
+
+    def get_access_token(self):
+        """
+        Fetch OAuth token required for API requests.
+        """
+        with self.metrics.time("get_access_token"):
+            return self.token_manager.get_token()
+
+    def authorized_request(self, method, url, headers=None, stage=None, **kwargs):
+        """
+        Send a request with the shared bearer token. On HTTP 401 the token is invalidated
+        and the request is sent once more with a fresh token; nothing else drops the token.
+
+        With `stage`, the request goes through that endpoint's retry policy and circuit
+        breaker, and HTTP 429 / 5xx responses are raised as requests.HTTPError.
+        """
+        def send():
+            for attempt in range(2):
+                token = self.get_access_token()
+                request_headers = dict(headers or {})
+                request_headers["Authorization"] = f"Bearer {token}"
+                response = self.transport.request(method, url, headers=request_headers, **kwargs)
+                self.record_transfer(stage or "other", response)
+                if response.status_code != 401 or attempt:
+                    break
+                logging.warning(f"Access token rejected by {url}; refreshing token.")
+                self.token_manager.invalidate(token)
+            if stage is not None and (response.status_code == 429 or response.status_code >= 500):
+                logging.warning(f"{stage} returned HTTP {response.status_code}")
+                log_body("Response content", response.text)
+                response.raise_for_status()
+            return response
+
+        if stage is None:
+            return send()
+        return self.stages[stage].call(send)
+
+    def record_transfer(self, stage, response):
+        wire, decoded = transfer_sizes(response)
+        self.metrics.add(f"bytes_received_{stage}", wire)
+        self.metrics.add(f"bytes_decoded_{stage}", decoded)
+
+    def lookup_oclc_number(self, barcode):
+        """
+        Lookup OCLC number using the barcode via the Discovery API.
+        The result carries `numberOfHoldings`, which is 0 when the barcode is not held.
+        """
+        try:
+            url = f"{self.config['discovery_api_url']}/search/my-holdings"
+            headers = {"Accept": "application/json"}
+            logging.debug("Requesting OCLC lookup: %s", url)
+            response = self.authorized_request(
+                "GET", url, params={"barcode": barcode}, headers=headers, stage="discovery"
+                )
+            logging.debug("Response status code: %s", response.status_code)
+            logging.debug("Response headers: %s", response.headers)
+            log_body("Response content", response.text)
+            response.raise_for_status()
+
+            data = response.json()
+            holdings = data.get("numberOfHoldings", 0)
+            if holdings == 0:
+                return {"error": "No holdings found for this barcode.", "numberOfHoldings": 0}
+
+            holding = data["detailedHoldings"][0]
+            return {
+                "barcode": barcode, "oclcNumber": holding.get("oclcNumber", UNKNOWN_OCLC_NUMBER),
+                "numberOfHoldings": holdings,
+                }
+        except requests.Timeout:
+            logging.error("Timeout occurred during OCLC lookup.")
+            raise Exception("The request to OCLC timed out. Please try again.")
+        except requests.RequestException as e:
+            logging.error(f"Error during OCLC lookup: {e}")
+            return {"error": str(e)}
+
+    def fetch_availability(self, oclc_numbers):
+        """
+        Send one SRU availability request for one or more OCLC numbers (CQL "or" query).
+        Returns the undecoded (but decompressed) response body, which the parser reads as is.
+        """
+        query = " or ".join(f"no:{number}" for number in oclc_numbers)
+        # No more records than numbers asked for, and only the schema the parser reads
+        params = {
+            "x-registryId": self.config["institution_id"], "query": query, "maximumRecords": len(oclc_numbers),
+            }
+        if self.config.get("availability_record_schema"):
+            params["recordSchema"] = self.config["availability_record_schema"]
+        url = f"{self.availability_url}?{urllib.parse.urlencode(params, quote_via=urllib.parse.quote)}"
+        headers = {"Accept": "application/xml, text/xml;q=0.9, */*;q=0.1"}
+
+        try:
+            logging.debug("Requesting availability: %s", url)
+            response = self.authorized_request("GET", url, headers=headers, stage="availability")
+            response_data = response.content
+
+            logging.debug("Response status: %s", response.status_code)
+            logging.debug("Response headers: %s", response.headers)
+            log_body("Response body", response_data)
+
+            if response.status_code == 200:
+                return response_data
+            else:
+                raise requests.HTTPError(
+                    f"HTTP {response.status_code}: {response_data[:2000].decode('utf-8', 'replace')}",
+                    response=response,
+                    )
+
+        except requests.RequestException as e:
+            logging.error(f"HTTP error during availability check: {e}")
+            raise
+        except Exception as e:
+            logging.error(f"Unexpected error during availability check: {str(e)}")
+            raise
+
+    def check_availability(self, oclc_number):
+        """
+        Availability response for a single OCLC number.
+        """
+        return self.fetch_availability([oclc_number])
+
+    @staticmethod
+    def parse_availability(xml_response, item_barcode, bib=None):
+        """
+        Extract the circulation state for one barcode from an SRU availability response
+        with the single-pass streaming parser in availability.py.
+        """
+        return parse_availability(xml_response, item_barcode, bib)
+
+    def check_in_item(self, barcode):
+        """
+        Attempt to check in the item via the NCIP API.
+        """
+        ncip_request = f"""<?xml version="1.0" encoding="UTF-8"?>
+        <NCIPMessage xmlns="http://www.niso.org/2008/ncip" xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"
+            xmlns:ncip="http://www.niso.org/2008/ncip"
+            xsi:schemaLocation="http://www.niso.org/2008/ncip http://www.niso.org/schemas/ncip/v2_01/ncip_v2_01.xsd"
+            ncip:version="http://www.niso.org/schemas/ncip/v2_01/ncip_v2_01.xsd">
+            <CheckInItem>
+                <InitiationHeader>
+                    <FromAgencyId>
+                        <AgencyId ncip:Scheme="http://oclc.org/ncip/schemes/agencyid.scm">{self.config['registry_id']}</AgencyId>
+                    </FromAgencyId>
+                    <ToAgencyId>
+                        <AgencyId>{self.config['registry_id']}</AgencyId>
+                    </ToAgencyId>
+                    <ApplicationProfileType ncip:Scheme="http://oclc.org/ncip/schemes/application-profile/platform.scm">Version 2011</ApplicationProfileType>
+                </InitiationHeader>
+                <ItemId>
+                    <AgencyId>{self.config['institution_id']}</AgencyId>
+                    <ItemIdentifierValue>{escape(barcode)}</ItemIdentifierValue>
+                </ItemId>
+            </CheckInItem>
+        </NCIPMessage>"""
+
+        headers = {"Content-Type": "application/xml"}
+
+        log_body("NCIP Check-In Request", ncip_request)
+        response = self.authorized_request(
+            "POST", self.config["ncip_api_url"], headers=headers, data=ncip_request, stage="ncip"
+            )
+        logging.debug("Response status code: %s", response.status_code)
+        logging.debug("Response headers: %s", response.headers)
+        log_body("Response content", response.text)
+        response.raise_for_status()
+
+        root = ET.fromstring(response.text)
+        namespaces = {"ns1": "http://www.niso.org/2008/ncip"}
+
+        problem = root.find(".//ns1:Problem", namespaces)
+        if problem is not None:
+            problem_type = problem.find(".//ns1:ProblemType", namespaces)
+            problem_detail = problem.find(".//ns1:ProblemDetail", namespaces)
+            raise CheckInProblem(
+                problem_type.text if problem_type is not None else 'Unknown',
+                problem_detail.text if problem_detail is not None else 'No detail',
+                )
+
+        routing_instructions = root.find(".//ns1:RoutingInstructions", namespaces)
+        routing_status = routing_instructions.text if routing_instructions is not None else "Unknown"
+
+        return {"status": routing_status, "action": "Checked In"}
+
+    def non_loan_return(self, barcode):
+        """
+        Mark item as non-loan return.
+        """
+        try:
+            url = f"{self.circulation_url}/items/{urllib.parse.quote(barcode, safe='')}/routings/usages"
+            payload = {
+                "location": f"https://{self.config['institution_id']}.share.worldcat.org/circ/branches/{self.config['registry_id']}"
+                }
+            headers = {"Content-Type": "application/json"}
+
+            logging.debug("Non-loan return request URL: %s", url)
+            logging.debug("Request payload: %s", payload)
+
+            response = self.authorized_request("POST", url, headers=headers, json=payload, stage="usages")
+
+            logging.debug("Response status code: %s", response.status_code)
+            logging.debug("Response headers: %s", response.headers)
+            log_body("Response content", response.text)
+
+            response.raise_for_status()
+
+            response_data = response.json()
+            logging.info(f"Non-loan return completed successfully for barcode {barcode}.")
+            log_body("Non-loan return response", response.text)
+
+            return {"success": True, "data": response_data}
+        except requests.Timeout:
+            logging.error(f"Timeout occurred while marking non-loan return for barcode {barcode}.")
+            raise
+        except requests.RequestException as e:
+            logging.error(f"Error during non-loan return for barcode {barcode}: {e}")
+            raise
+        except Exception as e:
+            logging.error(f"Unexpected error in non-loan return for barcode {barcode}: {e}")
+            raise
+
+    def stats(self):
+        return {
+            "token": self.token_manager.stats(),
+            "stages": {name: stage.stats() for name, stage in self.stages.items()},
+            }
+
+    def close(self):
+        self.transport.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class AsyncOclcClient:
+    """
+    asyncio front end to OclcClient for async workers and tests.
+
+    Each call runs the blocking client on a private pool of `pool_size` threads, so many
+    scans can be awaited together (e.g. with asyncio.gather) while the retry, rate-limit
+    and concurrency limits of the shared client still apply.
+    """
+
+    def __init__(self, config=None, pool_size=4, client=None, **kwargs):
+        # Only async callers pay for importing asyncio and concurrent.futures
+        from concurrent.futures import ThreadPoolExecutor
+
+        self.client = client or OclcClient(config, pool_size=pool_size, **kwargs)
+        self._executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix="oclc-async")
+
+    @classmethod
+    def from_file(cls, path, **kwargs):
+        return cls(load_config(path), **kwargs)
+
+    @property
+    def metrics(self):
+        return self.client.metrics
+
+    async def _run(self, func, *args):
+        import asyncio
+
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    async def prewarm(self):
+        return await self._run(self.client.prewarm)
+
+    async def get_access_token(self):
+        return await self._run(self.client.get_access_token)
+
+    async def lookup_oclc_number(self, barcode):
+        return await self._run(self.client.lookup_oclc_number, barcode)
+
+    async def fetch_availability(self, oclc_numbers):
+        return await self._run(self.client.fetch_availability, oclc_numbers)
+
+    async def check_availability(self, oclc_number):
+        return await self._run(self.client.check_availability, oclc_number)
+
+    @staticmethod
+    def parse_availability(xml_response, item_barcode, bib=None):
+        return parse_availability(xml_response, item_barcode, bib)
+
+    async def check_in_item(self, barcode):
+        return await self._run(self.client.check_in_item, barcode)
+
+    async def non_loan_return(self, barcode):
+        return await self._run(self.client.non_loan_return, barcode)
+
+    async def aclose(self):
+        self._executor.shutdown(wait=True)
+        self.client.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
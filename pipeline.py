@@ -0,0 +1,538 @@
+import os
+import json
+import time
+import logging
+
+from caches import PersistentCache
+from availability import AvailabilityCoalescer, parse_availability
+from journal import CheckInJournal, ReplayWorker, QUEUED, DONE, SKIPPED, FAILED
+from metrics import Metrics, MetricsExporter
+from scan_registry import ScanRegistry
+from strategy import CheckInStrategy
+from scan_history import ScanHistory
+from diagnostics import Diagnostics
+# The OCLC client, resilience and holdings index modules (and with them requests, ssl and
+# certifi) are imported where they are first needed
+
+# Files in the data directory
+CACHE_FILE = "cache.sqlite3"
+JOURNAL_FILE = "journal.sqlite3"
+HISTORY_FILE = "history.sqlite3"
+HOLDINGS_INDEX_FILE = "holdings.idx"
+METRICS_FILE = "metrics"  # .json or .prom is appended
+
+# Journal action names
+CHECK_IN = "checkin"
+NON_LOAN_RETURN = "non_loan_return"
+OPTIMISTIC_CHECK_IN = "optimistic_checkin"  # sent without checking availability first
+QUEUED_ACTION = "Queued for retry"  # action taken when OCLC could not be reached
+
+
+def holdings_index_path(config, data_dir):
+    return config.get("holdings_index_path", os.path.join(data_dir, HOLDINGS_INDEX_FILE))
+
+
+class UsageNotConfirmed(Exception):
+    """
+    A usages POST failed in a way that leaves open whether OCLC recorded it. Availability
+    looks the same either way, so it is never sent again automatically.
+    """
+
+    def __init__(self, barcode, error):
+        super().__init__(
+            f"In-library use for {barcode} may or may not have been recorded ({error}). It was not "
+            f"sent again; check the item in WMS and record the use by hand if it is missing."
+            )
+        self.barcode = barcode
+
+
+class CheckInNotConfirmed(Exception):
+    """
+    A queued optimistic CheckInItem may have reached OCLC before it failed, and the item is
+    now available: it was either returned then, or it was never on loan and needs an
+    in-library use instead. Availability cannot tell which, so it is left to staff.
+    """
+
+    def __init__(self, barcode):
+        super().__init__(
+            f"Check-in of {barcode} may have reached OCLC before it failed, and the item is now "
+            f"available. Check its circulation history in WMS; if it was not on loan, record an "
+            f"in-library use by hand."
+            )
+        self.barcode = barcode
+
+
+class CheckInPipeline:
+    """
+    The OCLC check-in pipeline without any Qt dependency, shared by the GUI, batch mode and
+    the check-in service. Adds the lookup caches, journal, scan history and check-in strategy
+    to an OclcClient, which makes the actual OCLC calls.
+
+    `config` holds the config.json settings; the caches, journal, scan history, holdings
+    index and metrics files live in `data_dir`.
+    """
+
+    def __init__(self, config, data_dir, pool_size=4, diagnostics=None):
+        from oclc_client import OclcClient
+        from holdings_index import HoldingsIndex
+
+        self.config = config
+        self.data_dir = data_dir
+        self.diagnostics = diagnostics or Diagnostics(os.path.join(data_dir, "diagnostics"))
+        # Per-stage latency histograms, error counts and throughput
+        self.metrics = Metrics()
+        self.metrics_exporter = None
+        # Pooled transport, shared OAuth token and per-endpoint retry policy, circuit breaker,
+        # rate limit and adaptive concurrency; all OCLC calls go through it
+        self.client = OclcClient(config, pool_size=pool_size, metrics=self.metrics)
+        self.stages = self.client.stages
+        self.token_manager = self.client.token_manager
+        # Barcodes imported from an item export (--import-holdings) never need Discovery
+        self.holdings = HoldingsIndex(holdings_index_path(config, data_dir))
+        self.metrics.register_gauge("holdings_index_items", lambda: self.holdings.count)
+        # Barcode -> OCLC number mappings rarely change, so Discovery is only asked on a miss
+        self.oclc_cache = PersistentCache(
+            os.path.join(data_dir, CACHE_FILE), "oclc_numbers",
+            ttl=config.get("oclc_cache_ttl_days", 30) * 86400,
+            negative_ttl=config.get("oclc_cache_negative_ttl", 300),
+            max_entries=config.get("oclc_cache_max_entries", 100000),
+            memory_entries=config.get("oclc_cache_memory_entries", 2000),
+            )
+        # Static bibliographic fields per OCLC number, kept apart from live circulation state
+        self.bib_cache = PersistentCache(
+            os.path.join(data_dir, CACHE_FILE), "bib_records",
+            ttl=config.get("bib_cache_ttl_days", 7) * 86400,
+            max_entries=config.get("bib_cache_max_entries", 50000),
+            memory_entries=config.get("bib_cache_memory_entries", 1000),
+            )
+        # Concurrent scans of the same title (or, within the batch window, of any titles)
+        # share a single SRU availability request
+        self.availability = AvailabilityCoalescer(
+            self.client.fetch_availability,
+            window=config.get("availability_batch_window_ms", 0) / 1000,
+            max_batch=config.get("availability_batch_size", 10),
+            )
+        # Every check-in / non-loan return is journaled before it is sent
+        self.journal = CheckInJournal(
+            os.path.join(data_dir, JOURNAL_FILE), retention_days=config.get("journal_retention_days", 90)
+            )
+        self.replay_worker = None
+        self.metrics.register_gauge("journal_queued", self.journal.queued_count)
+        # Every processed scan, written in batches by a background thread
+        self.history = ScanHistory(
+            os.path.join(data_dir, HISTORY_FILE), retention_days=config.get("history_retention_days", 365)
+            )
+        self.metrics.register_gauge("history_pending", lambda: self.history.stats()["pending"])
+        self.metrics.register_gauge("bytes_per_scan", self.bytes_per_scan)
+        # Repeated scans of one barcode share the first scan instead of repeating its API calls
+        self.scan_registry = ScanRegistry(
+            window=config.get("duplicate_scan_window", 10), is_reusable=self.is_reusable_outcome
+            )
+        self.metrics.register_gauge("duplicate_scans", self.scan_registry.duplicates)
+        self.diagnostics.register_counter("holdings_index", self.holdings.stats)
+        self.diagnostics.register_counter("oclc_cache", self.oclc_cache.stats)
+        self.diagnostics.register_counter("bib_cache", self.bib_cache.stats)
+        self.diagnostics.register_counter("scan_history", self.history.stats)
+        self.diagnostics.register_counter("duplicate_scans", self.scan_registry.stats)
+        # Standard (availability first), optimistic (CheckInItem first) or adaptive
+        self.strategy = CheckInStrategy(
+            config.get("checkin_strategy", "standard"),
+            threshold=config.get("optimistic_min_on_loan_rate", 0.6),
+            )
+        self.metrics.register_gauge("optimistic_active", lambda: int(self.strategy.use_optimistic()))
+        self.metrics.register_gauge("on_loan_rate", self.strategy.hit_rate)
+        for name, stage in self.stages.items():
+            self.metrics.register_gauge(
+                f"circuit_open_{name}", lambda breaker=stage.breaker: int(breaker.state != breaker.CLOSED)
+                )
+            if stage.concurrency is not None:
+                self.metrics.register_gauge(f"concurrency_limit_{name}", stage.concurrency.current)
+                self.metrics.register_gauge(f"in_flight_{name}", lambda limiter=stage.concurrency: limiter.in_flight)
+            # Queued actions are sent as soon as OCLC is back rather than at the next poll
+            stage.breaker.on_close = self.wake_replay
+
+    def start_replay(self, on_progress=None, on_failure=None):
+        """
+        Start the background worker that re-sends actions queued during an OCLC outage.
+        """
+        self.replay_worker = ReplayWorker(
+            self.journal, self.replay_action, self.is_transient_error,
+            interval=self.config.get("journal_replay_interval", 30),
+            max_attempts=self.config.get("journal_max_attempts", 20),
+            on_progress=on_progress, on_failure=on_failure,
+            )
+        self.replay_worker.start()
+
+    def wake_replay(self):
+        if self.replay_worker is not None:
+            self.replay_worker.wake()
+
+    def start_metrics_export(self):
+        """
+        Periodically write the metrics to `data_dir` as JSON or Prometheus text.
+        """
+        interval = self.config.get("metrics_export_interval", 60)
+        if not interval:
+            return
+        fmt = self.config.get("metrics_export_format", "json")
+        path = os.path.join(self.data_dir, f"{METRICS_FILE}.{'prom' if fmt == 'prometheus' else 'json'}")
+        self.metrics_exporter = MetricsExporter(self.metrics, path, fmt, interval)
+        self.metrics_exporter.start()
+
+    def prewarm(self):
+        """
+        OclcClient.prewarm(), logging how long it took.
+        """
+        started = time.perf_counter()
+        hosts = self.client.prewarm()
+        logging.info(f"Pre-warmed the token and {hosts} OCLC host(s) in "
+                     f"{(time.perf_counter() - started) * 1000:.0f} ms")
+
+    def close(self):
+        if self.replay_worker is not None:
+            self.replay_worker.stop()
+            self.replay_worker.join()
+        if self.metrics_exporter is not None:
+            self.metrics_exporter.stop()
+        logging.info(f"Scan metrics: {json.dumps(self.metrics.snapshot())}")
+        logging.info(f"Token cache stats: {self.token_manager.stats()}")
+        logging.info(f"Holdings index stats: {self.holdings.stats()}")
+        logging.info(f"OCLC number cache stats: {self.oclc_cache.stats()}")
+        logging.info(f"Bibliographic cache stats: {self.bib_cache.stats()}")
+        logging.info(f"Availability request stats: {self.availability.stats()}")
+        logging.info(f"Duplicate scan stats: {self.scan_registry.stats()}")
+        logging.info(f"Check-in strategy stats: {self.strategy.stats()}")
+        for name, stage in self.stages.items():
+            logging.info(f"Retry stats for {name}: {stage.stats()}")
+        self.history.close()
+        logging.info(f"Scan history stats: {self.history.stats()}")
+        self.holdings.close()
+        self.oclc_cache.close()
+        self.bib_cache.close()
+        self.journal.close()
+        self.client.close()
+
+    def process(self, barcode, on_preview=None, station=None):
+        """
+        Runs lookup -> availability -> check-in/non-loan return for one barcode.
+
+        Returns a dict with the table row data (`status`, `action`, `is_error`, or `status`
+        None when no row should be added) and an optional `alert` (level, title, message).
+        `on_preview` is called with cached bibliographic fields before the availability check.
+        A repeated scan of a barcode that is in flight or was just processed gets the first
+        scan's outcome, marked with `duplicate`, and sends nothing to OCLC.
+        Every scan is recorded in the scan history under `station` (default this computer).
+        """
+        started = time.perf_counter()
+        outcome, duplicate = self.scan_registry.run(barcode, lambda: self.process_once(barcode, on_preview))
+        if duplicate is not None:
+            logging.info(f"Duplicate scan of barcode {barcode} ({duplicate}); reusing the first scan's result")
+            outcome = dict(outcome, alert=None, duplicate=duplicate)  # The first scan already alerted
+            if outcome["status"] is not None:
+                outcome["status"] = dict(outcome["status"], duplicate=duplicate)
+                outcome["action"] = f"{outcome['action']} (duplicate scan)"
+        self.history.record(
+            barcode, outcome, (time.perf_counter() - started) * 1000, station or self.metrics.station
+            )
+        return outcome
+
+    @staticmethod
+    def is_reusable_outcome(outcome):
+        """
+        Only completed actions are reused for re-scans; errors and warnings are tried again.
+        """
+        return outcome["status"] is not None and not outcome["is_error"] and outcome["action"] != "None"
+
+    def process_once(self, barcode, on_preview=None):
+        outcome = {
+            "barcode": barcode, "oclc_number": None, "status": None, "action": "None", "is_error": False,
+            "alert": None, "error": None, "duplicate": None,
+            }
+        logging.info(f"Processing barcode: {barcode}")
+        started = time.perf_counter()
+        try:
+            with self.diagnostics.scope("scan"):
+                self.run_stages(barcode, outcome, on_preview)
+        finally:
+            self.metrics.scan_finished(time.perf_counter() - started, outcome["is_error"])
+        return outcome
+
+    def run_stages(self, barcode, outcome, on_preview):
+        """
+        The body of process(); fills in `outcome`.
+        """
+        try:
+            # 1. Lookup OCLC number
+            with self.metrics.time("lookup_oclc_number"):
+                oclc_data = self.lookup_oclc_number(barcode)
+                if 'error' in oclc_data:
+                    raise Exception(oclc_data['error'])
+
+            oclc_number = oclc_data.get('oclcNumber')
+            if not oclc_number:
+                outcome["alert"] = ("warning", "Error", f"No OCLC number found for barcode {barcode}.")
+                return
+            outcome["oclc_number"] = oclc_number
+            # The holdings index knows this copy's own call number; the bib cache only knows one per title
+            call_number = oclc_data.get('callNumber')
+
+            # 2. Show cached bibliographic fields while the live availability check runs
+            bib_found, bib = self.bib_cache.lookup(oclc_number)
+            if bib_found and bib and on_preview:
+                on_preview(bib)
+
+            optimistic = self.strategy.use_optimistic()
+            if optimistic and self.optimistic_check_in(barcode, oclc_number, bib_found, bib, call_number, outcome):
+                return
+            # Not on loan after all: decide from the live availability as usual (TRANSIT included)
+
+            # 3. Check availability
+            with self.metrics.time("check_availability"):
+                response_xml = self.check_availability(oclc_number)
+            with self.metrics.time("parse_availability"):
+                status = parse_availability(response_xml, barcode, bib)
+                if 'error' in status:
+                    raise Exception(status['error'])
+            if not bib_found:
+                self.cache_bib(oclc_number, status)
+            if call_number and status.get('callNumber') in (None, "N/A"):
+                status['callNumber'] = call_number
+            if not optimistic:
+                self.strategy.observe(status.get('checkedOut'))
+
+            # 4. Handle special cases like TRANSIT
+            if status.get('reasonUnavailable') == "TRANSIT":
+                outcome.update(status=status, is_error=True)
+                return
+
+            # 5. Take action
+            if status.get('checkedOut'):
+                status["status"], action_taken = self.perform_action(barcode, oclc_number, CHECK_IN)
+            elif status.get('status') == "Available":
+                status["status"], action_taken = self.perform_action(barcode, oclc_number, NON_LOAN_RETURN)
+            else:
+                outcome["alert"] = (
+                    "warning", "Warning",
+                    f"Item {barcode} status: {status['status']}. {status.get('reasonUnavailable', '')}"
+                    )
+                return
+
+            # 6. Report the row for the results table
+            outcome.update(status=status, action=action_taken)
+
+        except Exception as e:
+            # Each stage has already retried whatever was safe to retry
+            logging.error(f"Error processing barcode {barcode}: {str(e)}")
+            outcome["alert"] = (
+                "critical", "Error",
+                f"An error occurred while processing {barcode}.\n\nDetails:\n{str(e)}"
+                )
+            outcome["error"] = str(e)
+            outcome.update(status={
+                "status": "Error", "title": "Unknown", "author": "Unknown",
+                "callNumber": "Unknown"
+                }, is_error=True)
+
+    def optimistic_check_in(self, barcode, oclc_number, bib_found, bib, call_number, outcome):
+        """
+        Send CheckInItem without checking availability first and fill in `outcome`, showing
+        `call_number` (from the holdings index) rather than the cached one when it is known.
+        Returns False if NCIP reports that the item is not checked out. An item that NCIP
+        routes in transit is flagged like the standard path flags TRANSIT.
+        """
+        from oclc_client import CheckInProblem
+
+        try:
+            status_text, action_taken = self.perform_action(barcode, oclc_number, OPTIMISTIC_CHECK_IN)
+        except CheckInProblem as e:
+            if not e.not_checked_out:
+                raise
+            self.strategy.observe(False, optimistic=True)
+            logging.info(f"Barcode {barcode} is not checked out; checking availability instead.")
+            return False
+        in_transit = "transit" in (status_text or "").lower()
+        if action_taken != QUEUED_ACTION:
+            # Queued actions say nothing about whether the item was on loan
+            self.strategy.observe(not in_transit, optimistic=True)
+
+        if not bib_found:
+            # Title, author and call number for the table, cached for the next copy of this title
+            try:
+                with self.metrics.time("check_availability"):
+                    response_xml = self.check_availability(oclc_number)
+                with self.metrics.time("parse_availability"):
+                    status = parse_availability(response_xml, barcode)
+                if 'error' not in status:
+                    bib = {"title": status["title"], "author": status["author"], "callNumber": status["callNumber"]}
+                    self.cache_bib(oclc_number, status)
+            except Exception as e:
+                logging.warning(f"Checked in {barcode}, but could not fetch its title: {e}")
+        status = dict(bib or {}, status=status_text)
+        if call_number:
+            status["callNumber"] = call_number
+        if in_transit:
+            logging.warning(f"Checked in {barcode}, which is in transit: {status_text}")
+            status["reasonUnavailable"] = "TRANSIT"
+        outcome.update(status=status, action=action_taken, is_error=in_transit)
+        return True
+
+    def cache_bib(self, oclc_number, status):
+        """
+        Cache the title, author and call number of a parsed availability `status`, but only if
+        the response contained the bibliographic record; placeholders are never cached.
+        """
+        if status.get("hasBibRecord"):
+            self.bib_cache.put(oclc_number, {
+                "title": status["title"], "author": status["author"], "callNumber": status["callNumber"],
+                })
+
+    def perform_action(self, barcode, oclc_number, action):
+        """
+        Journal the action, then send it. Returns (status text, action taken).
+        If OCLC cannot be reached the action stays queued in the journal for the replay worker.
+        """
+        from oclc_client import CheckInProblem
+        from resilience import retry_after_seconds, request_not_sent
+
+        if self.journal.has_queued(barcode):
+            # Keep this barcode's actions in order behind the ones already waiting
+            self.journal.record(barcode, oclc_number, action, state=QUEUED)
+            logging.info(f"Queued {action} for barcode {barcode} behind earlier queued actions.")
+            self.wake_replay()
+            return "Queued", QUEUED_ACTION
+
+        entry_id = self.journal.record(barcode, oclc_number, action)
+        try:
+            if action in (CHECK_IN, OPTIMISTIC_CHECK_IN):
+                with self.metrics.time("check_in_item"):
+                    action_response = self.client.check_in_item(barcode)
+                result = (action_response["status"], action_response["action"])
+            else:
+                with self.metrics.time("non_loan_return"):
+                    self.send_non_loan_return(barcode)
+                result = ("In-Library Use", "In-Library Use")
+        except Exception as e:
+            if self.is_transient_error(e):
+                # Not retried in place: OCLC may already have applied it. The replay worker
+                # checks availability first and honours any Retry-After.
+                self.journal.defer(
+                    entry_id, e, delay=retry_after_seconds(e) or 0, maybe_sent=not request_not_sent(e)
+                    )
+                self.wake_replay()
+                logging.warning(f"OCLC unavailable; queued {action} for barcode {barcode}: {e}")
+                return "Queued - OCLC unavailable", QUEUED_ACTION
+            if isinstance(e, CheckInProblem) and e.not_checked_out and action == OPTIMISTIC_CHECK_IN:
+                self.journal.complete(entry_id, SKIPPED, str(e))  # Expected; the caller falls back
+            else:
+                self.journal.complete(entry_id, FAILED, str(e))
+            raise
+        self.journal.complete(entry_id)
+        return result
+
+    def replay_action(self, entry):
+        """
+        Re-send a queued journal entry. The item's current availability is checked first so
+        a check-in that already reached OCLC before the failure is not applied twice.
+        In-library uses are only queued when they certainly never reached OCLC.
+        """
+        barcode = entry["barcode"]
+        status = parse_availability(self.check_availability(entry["oclc_number"]), barcode)
+        if 'error' in status:
+            raise Exception(status['error'])
+
+        if entry["action"] == OPTIMISTIC_CHECK_IN and not status.get("checkedOut"):
+            if status.get("status") != "Available":
+                return SKIPPED, f"Item status: {status.get('reasonUnavailable') or status.get('status')}"
+            if entry["maybe_sent"]:
+                # Returned by the earlier CheckInItem, or never on loan: only WMS can tell
+                raise CheckInNotConfirmed(barcode)
+            # OCLC never saw the CheckInItem: decide as the standard path would have
+            self.send_non_loan_return(barcode)
+            return DONE, "Not on loan; recorded an in-library use"
+        if entry["action"] in (CHECK_IN, OPTIMISTIC_CHECK_IN):
+            if not status.get("checkedOut"):
+                return SKIPPED, "Item is no longer checked out"
+            self.send_check_in(entry["id"], barcode)
+        else:
+            if status.get("checkedOut"):
+                return SKIPPED, "Item is checked out"
+            self.send_non_loan_return(barcode)
+        return DONE, None
+
+    def send_check_in(self, entry_id, barcode):
+        """
+        OclcClient.check_in_item() for a journal entry, which is marked as possibly sent if
+        the request may have reached OCLC before it failed.
+        """
+        from resilience import request_not_sent
+
+        try:
+            return self.client.check_in_item(barcode)
+        except Exception as e:
+            if not request_not_sent(e):
+                self.journal.mark_maybe_sent(entry_id)
+            raise
+
+    def send_non_loan_return(self, barcode):
+        """
+        OclcClient.non_loan_return(), but a failure after which the use may already be recorded is
+        raised as UsageNotConfirmed, which is not transient and so is never queued or replayed.
+        """
+        from resilience import request_not_sent
+
+        try:
+            return self.client.non_loan_return(barcode)
+        except Exception as e:
+            if self.is_transient_error(e) and not request_not_sent(e):
+                raise UsageNotConfirmed(barcode, e) from e
+            raise
+
+    @staticmethod
+    def is_transient_error(error):
+        """
+        True for failures that mean OCLC is slow or unavailable (including an open circuit)
+        rather than a rejected request.
+        """
+        from resilience import is_transient
+        return is_transient(error)
+
+    def bytes_per_scan(self):
+        """
+        Average bytes received on the wire from OCLC per scan.
+        """
+        scans = self.metrics.scans
+        return round(self.metrics.total("bytes_received_") / scans) if scans else 0
+
+    def lookup_oclc_number(self, barcode):
+        """
+        The OCLC number for `barcode`. Barcodes in the holdings index and cached mappings (and
+        recent "no holdings" answers) skip the Discovery call of OclcClient.lookup_oclc_number().
+        """
+        with self.metrics.time("holdings_index"):
+            indexed = self.holdings.lookup(barcode)
+        if indexed is not None:
+            logging.debug(f"Holdings index hit for barcode {barcode}: {indexed[0]}")
+            return {"barcode": barcode, "oclcNumber": indexed[0], "callNumber": indexed[1]}
+
+        found, cached_number = self.oclc_cache.lookup(barcode)
+        if found:
+            logging.debug(f"OCLC number cache hit for barcode {barcode}: {cached_number}")
+            if cached_number is None:
+                return {"error": "No holdings found for this barcode."}
+            return {"barcode": barcode, "oclcNumber": cached_number}
+
+        from oclc_client import UNKNOWN_OCLC_NUMBER
+
+        result = self.client.lookup_oclc_number(barcode)
+        if result.get("numberOfHoldings") == 0:
+            self.oclc_cache.put(barcode, None)
+        elif "error" not in result and result["oclcNumber"] != UNKNOWN_OCLC_NUMBER:
+            self.oclc_cache.put(barcode, result["oclcNumber"])
+        return result
+
+    def check_availability(self, oclc_number):
+        """
+        The SRU availability response for `oclc_number`. Lookups for the same OCLC number
+        that are already in flight share one request.
+        """
+        return self.availability.get(oclc_number)
@@ -0,0 +1,322 @@
+import time
+import random
+import logging
+import threading
+from email.utils import parsedate_to_datetime
+
+import requests
+from urllib3.exceptions import NewConnectionError
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised instead of calling an OCLC service whose circuit breaker is open.
+    """
+
+
+def is_transient(error):
+    """
+    True for failures that mean a service is slow or unavailable rather than a rejected request.
+    """
+    if isinstance(error, (CircuitOpenError, requests.ConnectionError, requests.Timeout)):
+        return True
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        return error.response.status_code == 429 or error.response.status_code >= 500
+    return False
+
+
+def is_throttled(error):
+    """
+    True for an HTTP 429 Too Many Requests.
+    """
+    return (isinstance(error, requests.HTTPError) and error.response is not None
+            and error.response.status_code == 429)
+
+
+def request_not_sent(error):
+    """
+    True only if the request certainly never reached the server (or the server refused it
+    before processing), so even a non-idempotent request can safely be sent again.
+    """
+    if isinstance(error, (CircuitOpenError, requests.ConnectTimeout)):
+        return True
+    if isinstance(error, requests.ConnectionError):
+        reason = getattr(error.args[0], "reason", None) if error.args else None
+        return isinstance(reason, NewConnectionError)
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        return error.response.status_code in (429, 503)
+    return False
+
+
+def retry_after_seconds(error):
+    """
+    The delay requested by a Retry-After header (seconds or HTTP date), or None.
+    """
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class RetryPolicy:
+    """
+    Exponential backoff with full jitter. `retry_on(error)` decides which errors are retried.
+    A Retry-After longer than `max_delay` is not waited for; the error is raised instead.
+    """
+
+    def __init__(self, retry_on=is_transient, max_attempts=3, base_delay=0.5, max_delay=8.0):
+        self.retry_on = retry_on
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def next_delay(self, error, attempt):
+        """
+        Seconds to wait before attempt number `attempt + 1`, or None to give up.
+        """
+        if attempt + 1 >= self.max_attempts or not self.retry_on(error):
+            return None
+        retry_after = retry_after_seconds(error)
+        if retry_after is not None:
+            return retry_after if retry_after <= self.max_delay else None
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive transient failures so callers fail fast
+    instead of waiting for timeouts. After `reset_timeout` seconds one trial call is let
+    through (half-open); its success closes the circuit again, and `on_close()` is called.
+    """
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30.0):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.times_opened = 0
+        self.rejected = 0
+        self.on_close = None
+
+    def before_call(self):
+        with self._lock:
+            if self.state == self.CLOSED:
+                return
+            if self.state == self.OPEN and time.time() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                return
+            self.rejected += 1
+            raise CircuitOpenError(f"OCLC {self.name} service is temporarily unavailable (circuit open)")
+
+    def record_success(self):
+        with self._lock:
+            closed = self.state != self.CLOSED
+            if closed:
+                logging.info(f"Circuit for {self.name} closed")
+            self.state = self.CLOSED
+            self.failures = 0
+        if closed and self.on_close is not None:
+            self.on_close()
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    self.times_opened += 1
+                    logging.warning(f"Circuit for {self.name} opened after {self.failures} failure(s)")
+                self.state = self.OPEN
+                self.opened_at = time.time()
+
+
+class TokenBucket:
+    """
+    Token-bucket rate limiter: on average `rate` requests per second with bursts of up to
+    `burst`. A rate of 0 means unlimited. `pause(seconds)` holds every caller back, e.g.
+    for the Retry-After of an HTTP 429.
+    """
+
+    def __init__(self, rate=0.0, burst=None):
+        self.rate = rate
+        self.burst = max(1.0, burst if burst is not None else rate)
+        self._lock = threading.Lock()
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self.waits = 0
+        self.waited = 0.0
+
+    def acquire(self):
+        """
+        Block until the caller may send a request.
+        """
+        waited = False
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                delay = self._paused_until - now
+                if delay <= 0 and self.rate > 0:
+                    self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                    self._updated = now
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                    else:
+                        delay = (1 - self._tokens) / self.rate
+                if delay <= 0:
+                    return
+                if not waited:
+                    self.waits += 1
+                    waited = True
+                self.waited += delay
+            time.sleep(delay)
+
+    def pause(self, seconds):
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+class AIMDLimiter:
+    """
+    Adaptive concurrency limit (additive increase, multiplicative decrease).
+
+    While calls succeed within `latency_target` seconds and the limit is actually in use,
+    it grows by about one per `limit` successful calls. An overload signal (HTTP 429 / 5xx,
+    timeouts) multiplies it by `backoff`, at most once per `cooldown` seconds.
+    """
+
+    def __init__(self, initial=4, minimum=1, maximum=32, latency_target=2.0, backoff=0.5, cooldown=1.0):
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.limit = float(min(max(initial, self.minimum), self.maximum))
+        self.latency_target = latency_target
+        self.backoff = backoff
+        self.cooldown = cooldown
+        self._cond = threading.Condition()
+        self.in_flight = 0
+        self._last_decrease = 0.0
+        self.decreases = 0
+
+    def acquire(self):
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                self._cond.wait()
+            self.in_flight += 1
+
+    def release(self, latency, overloaded=False):
+        with self._cond:
+            saturated = self.in_flight >= int(self.limit)
+            self.in_flight -= 1
+            now = time.monotonic()
+            if overloaded:
+                if now - self._last_decrease >= self.cooldown:
+                    self.limit = max(self.minimum, self.limit * self.backoff)
+                    self._last_decrease = now
+                    self.decreases += 1
+            elif saturated and latency <= self.latency_target:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self._cond.notify_all()
+
+    def current(self):
+        return int(self.limit)
+
+
+class Stage:
+    """
+    One pipeline stage (an OCLC endpoint) with its own retry policy and circuit breaker,
+    and optionally a rate limiter and an adaptive concurrency limit.
+    """
+
+    def __init__(self, name, policy, breaker, rate_limiter=None, concurrency=None):
+        self.name = name
+        self.policy = policy
+        self.breaker = breaker
+        self.rate_limiter = rate_limiter or TokenBucket()
+        self.concurrency = concurrency
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.retries = 0
+        self.errors = 0
+        self.throttled = 0
+
+    def attempt(self, func, *args, **kwargs):
+        """
+        One call, within the rate and concurrency limits.
+        """
+        self.rate_limiter.acquire()
+        if self.concurrency is None:
+            return func(*args, **kwargs)
+        self.concurrency.acquire()
+        started = time.perf_counter()
+        overloaded = False
+        try:
+            return func(*args, **kwargs)
+        except (requests.Timeout, requests.HTTPError) as e:
+            # Slow or refused under load; a connection that never opened says nothing about load
+            overloaded = is_transient(e)
+            raise
+        finally:
+            self.concurrency.release(time.perf_counter() - started, overloaded)
+
+    def call(self, func, *args, **kwargs):
+        attempt = 0
+        with self._lock:
+            self.calls += 1
+        while True:
+            self.breaker.before_call()
+            try:
+                result = self.attempt(func, *args, **kwargs)
+            except Exception as e:
+                throttled = is_throttled(e)
+                if throttled:
+                    # The service is up but over quota: every caller of this endpoint slows
+                    # down and waits out the Retry-After, rather than the circuit opening
+                    self.breaker.record_success()
+                    self.rate_limiter.pause(retry_after_seconds(e) or 0)
+                elif is_transient(e):
+                    self.breaker.record_failure()
+                else:
+                    self.breaker.record_success()  # The service answered; the request was at fault
+                delay = self.policy.next_delay(e, attempt)
+                with self._lock:
+                    self.throttled += int(throttled)
+                    if delay is None:
+                        self.errors += 1
+                    else:
+                        self.retries += 1
+                if delay is None:
+                    raise
+                attempt += 1
+                logging.warning(f"{self.name} failed ({e}); retry {attempt} in {delay:.2f}s")
+                time.sleep(delay)
+                continue
+            self.breaker.record_success()
+            return result
+
+    def stats(self):
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "retries": self.retries,
+                "errors": self.errors,
+                "throttled": self.throttled,
+                "rate_limit_waits": self.rate_limiter.waits,
+                "rate_limit_wait_s": round(self.rate_limiter.waited, 3),
+                "concurrency_limit": self.concurrency.current() if self.concurrency else None,
+                "circuit": self.breaker.state,
+                "circuit_opened": self.breaker.times_opened,
+                "circuit_rejected": self.breaker.rejected,
+            }
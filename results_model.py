@@ -0,0 +1,170 @@
+import os
+import csv
+import time
+import logging
+from PyQt5.QtCore import Qt, QAbstractTableModel, QModelIndex, QSortFilterProxyModel, QVariant
+from PyQt5.QtGui import QColor
+
+HEADERS = ["Barcode", "Title", "Author", "Call Number", "Status", "Action Taken"]
+FIELDS = ("barcode", "title", "author", "call_number", "status", "action")
+ERROR_COLOR = QColor(255, 0, 0)
+DUPLICATE_COLOR = QColor(128, 128, 128)
+# Action of a preview row whose scan is still running
+PENDING_ACTION = "Pending"
+
+
+class ResultRow:
+    """
+    One scan result. Plain strings in __slots__ keep memory per row small over a long shift.
+    """
+    __slots__ = (
+        "seq", "barcode", "title", "author", "call_number", "status", "action", "is_error", "is_duplicate",
+        "is_pending",
+    )
+
+    def __init__(self, barcode, status, action_taken, is_error=False):
+        self.seq = -1
+        self.barcode = barcode
+        self.set_status(status, action_taken, is_error)
+
+    def set_status(self, status, action_taken, is_error=False):
+        self.title = status.get("title", "Unknown")
+        self.author = status.get("author", "Unknown")
+        self.call_number = status.get("callNumber", "N/A")
+        # Determine the displayable status
+        self.status = status.get("reasonUnavailable", status.get("status", "Unknown")) or ""
+        self.action = action_taken
+        self.is_error = is_error
+        # Repeated scans answered from the first scan's result are shown grayed out
+        self.is_duplicate = bool(status.get("duplicate"))
+        self.is_pending = action_taken == PENDING_ACTION
+
+
+class ResultsTableModel(QAbstractTableModel):
+    """
+    Table model over a list of ResultRow objects.
+
+    Rows are appended in batches. If `max_rows` is set, the oldest rows are removed from
+    the model once the limit is exceeded and appended to `spill_path` as CSV. A row whose
+    scan is still pending is never spilled, nor anything after it, until its result is in.
+    """
+
+    def __init__(self, max_rows=0, spill_path=None, parent=None):
+        super().__init__(parent)
+        self.max_rows = max_rows
+        self.spill_path = spill_path
+        self.rows = []
+        self.base_seq = 0  # sequence number of self.rows[0]
+        self.next_seq = 0
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(HEADERS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return HEADERS[section]
+        return QVariant()
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return QVariant()
+        row = self.rows[index.row()]
+        if role == Qt.DisplayRole:
+            return getattr(row, FIELDS[index.column()])
+        if role == Qt.ForegroundRole and row.is_error:
+            # Highlight error rows in red
+            return ERROR_COLOR
+        if role == Qt.ForegroundRole and row.is_duplicate:
+            return DUPLICATE_COLOR
+        return QVariant()
+
+    def total_rows(self):
+        """
+        Number of rows ever added, including rows spilled to disk.
+        """
+        return self.next_seq
+
+    def add_rows(self, rows):
+        if not rows:
+            return
+        first = len(self.rows)
+        self.beginInsertRows(QModelIndex(), first, first + len(rows) - 1)
+        for row in rows:
+            row.seq = self.next_seq
+            self.next_seq += 1
+        self.rows.extend(rows)
+        self.endInsertRows()
+        self.trim()
+
+    def row_changed(self, row):
+        position = row.seq - self.base_seq
+        if row.seq < 0 or not 0 <= position < len(self.rows):
+            return  # Not inserted yet, or already spilled
+        self.dataChanged.emit(self.index(position, 0), self.index(position, len(HEADERS) - 1))
+        self.trim()  # A finished preview row may have held back older rows
+
+    def trim(self):
+        if not self.max_rows or len(self.rows) <= self.max_rows:
+            return
+        count = 0
+        for row in self.rows[:len(self.rows) - self.max_rows]:
+            if row.is_pending:
+                break
+            count += 1
+        if count:
+            self.spill(count)
+
+    def spill(self, count):
+        """
+        Move the `count` oldest rows out of memory into the spill file.
+        """
+        spilled = self.rows[:count]
+        self.beginRemoveRows(QModelIndex(), 0, count - 1)
+        del self.rows[:count]
+        self.base_seq += count
+        self.endRemoveRows()
+
+        if not self.spill_path:
+            return
+        try:
+            write_header = not os.path.exists(self.spill_path)
+            with open(self.spill_path, "a", newline="", encoding="utf-8") as f:
+                writer = csv.writer(f)
+                if write_header:
+                    writer.writerow(["spilled_at"] + HEADERS + ["Error"])
+                spilled_at = time.strftime("%Y-%m-%d %H:%M:%S")
+                writer.writerows(
+                    [spilled_at] + [getattr(row, field) for field in FIELDS] + [int(row.is_error)]
+                    for row in spilled
+                    )
+        except OSError as e:
+            logging.error(f"Could not write spilled result rows to {self.spill_path}: {e}")
+
+
+class StatusFilterProxyModel(QSortFilterProxyModel):
+    """
+    Sorts and filters the results by status without copying any rows.
+    """
+    FILTERS = {
+        "All results": None,
+        "Errors only": lambda row: row.is_error,
+        "Checked in": lambda row: row.action == "Checked In",
+        "In-library use": lambda row: row.action == "In-Library Use",
+        "Duplicate scans": lambda row: row.is_duplicate,
+    }
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.predicate = None
+
+    def set_status_filter(self, name):
+        self.predicate = self.FILTERS.get(name)
+        self.invalidateFilter()
+
+    def filterAcceptsRow(self, source_row, source_parent):
+        if self.predicate is None:
+            return True
+        return bool(self.predicate(self.sourceModel().rows[source_row]))
@@ -0,0 +1,205 @@
+import csv
+import time
+import queue
+import sqlite3
+import logging
+import threading
+from datetime import datetime
+
+COLUMNS = (
+    "scanned_at", "station", "barcode", "oclc_number", "title", "action", "status",
+    "is_error", "error", "duplicate", "duration_ms",
+)
+
+
+def start_of_day(when=None):
+    """
+    Local midnight of the day of `when` (default today) as a Unix timestamp.
+    """
+    day = datetime.fromtimestamp(when if when is not None else time.time())
+    return day.replace(hour=0, minute=0, second=0, microsecond=0).timestamp()
+
+
+class ScanHistory:
+    """
+    Every processed scan, stored in an indexed SQLite table.
+
+    `record()` only puts the scan on a queue; a background thread writes queued scans in
+    batches of up to `batch_size` per transaction, so the scan path never waits for the
+    disk. Scans older than `retention_days` are deleted at start-up and once a day
+    (0 keeps everything). Queries see every scan recorded before they were called.
+    """
+
+    def __init__(self, db_path, retention_days=365, batch_size=200, flush_interval=1.0):
+        self.db_path = db_path
+        self.retention_days = retention_days
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS scans ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, scanned_at REAL NOT NULL, station TEXT, "
+            "barcode TEXT NOT NULL, oclc_number TEXT, title TEXT, action TEXT, status TEXT, "
+            "is_error INTEGER NOT NULL DEFAULT 0, error TEXT, duplicate TEXT, duration_ms REAL)"
+            )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS scans_barcode ON scans (barcode, scanned_at)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS scans_scanned_at ON scans (scanned_at)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS scans_errors ON scans (scanned_at) WHERE is_error = 1")
+        self._conn.commit()
+        self._purged_at = 0.0
+        self.purge()
+
+        self.recorded = 0
+        self.written = 0
+        self.batches = 0
+        self._queue = queue.Queue()
+        self._writer = threading.Thread(target=self._write_loop, name="scan-history", daemon=True)
+        self._writer.start()
+
+    def record(self, barcode, outcome, duration_ms=None, station=None):
+        """
+        Queue one processed scan (a CheckInPipeline outcome) for writing.
+        """
+        status = outcome.get("status") or {}
+        error = outcome.get("error")
+        if error is None and outcome.get("alert") and not status:
+            error = outcome["alert"][2]  # a warning without a table row, e.g. no OCLC number
+        self.recorded += 1
+        self._queue.put((
+            time.time(), station, barcode, outcome.get("oclc_number"), status.get("title"),
+            outcome.get("action"), status.get("status"), int(bool(outcome.get("is_error"))), error,
+            outcome.get("duplicate"), round(duration_ms, 1) if duration_ms is not None else None,
+            ))
+
+    def _write_loop(self):
+        while True:
+            try:
+                rows = [self._queue.get(timeout=self.flush_interval)]
+            except queue.Empty:
+                self._purge_daily()
+                continue
+            while len(rows) < self.batch_size:
+                try:
+                    rows.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = None in rows
+            rows = [row for row in rows if row is not None]
+            try:
+                if rows:
+                    self._write(rows)
+            except sqlite3.Error as e:
+                logging.error(f"Could not write {len(rows)} scan(s) to the history: {e}")
+            finally:
+                for _ in range(len(rows) + int(stop)):
+                    self._queue.task_done()
+            if stop:
+                return
+
+    def _write(self, rows):
+        with self._lock:
+            self._conn.executemany(
+                f"INSERT INTO scans ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})", rows
+                )
+            self._conn.commit()
+            self.written += len(rows)
+            self.batches += 1
+
+    def _purge_daily(self):
+        if time.time() - self._purged_at >= 86400:
+            self.purge()
+
+    def purge(self):
+        """
+        Delete scans older than the retention period.
+        """
+        self._purged_at = time.time()
+        if not self.retention_days:
+            return 0
+        with self._lock:
+            deleted = self._conn.execute(
+                "DELETE FROM scans WHERE scanned_at < ?", (time.time() - self.retention_days * 86400,)
+                ).rowcount
+            self._conn.commit()
+        if deleted:
+            logging.info(f"Removed {deleted} scan(s) older than {self.retention_days} days from the history")
+        return deleted
+
+    def flush(self):
+        """
+        Wait until every recorded scan has been written.
+        """
+        self._queue.join()
+
+    def search(self, barcode=None, since=None, until=None, errors_only=False, action=None, limit=1000):
+        """
+        Scans matching all given filters as dicts, newest first.
+        """
+        clauses, params = [], []
+        if barcode is not None:
+            clauses.append("barcode = ?")
+            params.append(barcode)
+        if since is not None:
+            clauses.append("scanned_at >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("scanned_at < ?")
+            params.append(until)
+        if errors_only:
+            clauses.append("is_error = 1")
+        if action is not None:
+            clauses.append("action = ?")
+            params.append(action)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        limit_sql = "LIMIT ?" if limit else ""
+        if limit:
+            params.append(limit)
+        self.flush()
+        with self._lock:
+            cursor = self._conn.execute(
+                f"SELECT {', '.join(COLUMNS)} FROM scans {where} ORDER BY scanned_at DESC, id DESC {limit_sql}",
+                params,
+                )
+            return [dict(zip(COLUMNS, row)) for row in cursor.fetchall()]
+
+    def last_scan(self, barcode, action=None):
+        """
+        The most recent scan of `barcode` (optionally with this `action`), or None.
+        """
+        scans = self.search(barcode=barcode, action=action, limit=1)
+        return scans[0] if scans else None
+
+    def errors_today(self):
+        return self.search(since=start_of_day(), errors_only=True, limit=0)
+
+    def export_csv(self, path, **filters):
+        """
+        Write the scans matching `filters` (see search()) to a CSV file, oldest first.
+        Returns the number of scans written.
+        """
+        scans = self.search(limit=0, **filters)
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(("scanned_at_local",) + COLUMNS)
+            for scan in reversed(scans):
+                local = datetime.fromtimestamp(scan["scanned_at"]).strftime("%Y-%m-%d %H:%M:%S")
+                writer.writerow((local,) + tuple(scan[column] for column in COLUMNS))
+        return len(scans)
+
+    def stats(self):
+        return {
+            "recorded": self.recorded,
+            "written": self.written,
+            "batches": self.batches,
+            "pending": self._queue.qsize(),
+        }
+
+    def close(self):
+        self._queue.put(None)
+        self._writer.join()
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,91 @@
+import time
+import threading
+from collections import OrderedDict
+
+# How a duplicate scan was served
+DUPLICATE_IN_FLIGHT = "in flight"  # attached to the first scan while it was still running
+DUPLICATE_RECENT = "recent"  # answered from the first scan's result
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class ScanRegistry:
+    """
+    Per-barcode single flight for whole scans, so a double-triggered scanner or an impatient
+    re-scan never sends a second CheckInItem or usages request.
+
+    - A scan of a barcode that is already being processed waits for that scan's result.
+    - For `window` seconds after a scan finished, scans of the same barcode get its result
+      without any API calls, if `is_reusable(result)` allows it (e.g. not for errors).
+    """
+
+    def __init__(self, window=10.0, is_reusable=None):
+        self.window = window
+        self.is_reusable = is_reusable or (lambda result: True)
+
+        self._lock = threading.Lock()
+        self._in_flight = {}  # barcode -> _Flight
+        self._recent = OrderedDict()  # barcode -> (expires_at, result), oldest first
+
+        self.scans = 0
+        self.attached = 0
+        self.recent_hits = 0
+
+    def run(self, barcode, func):
+        """
+        Returns (result, duplicate): `func()`'s result for the first scan with duplicate None,
+        or the shared result with DUPLICATE_IN_FLIGHT / DUPLICATE_RECENT.
+        """
+        with self._lock:
+            self.scans += 1
+            now = time.time()
+            while self._recent and next(iter(self._recent.values()))[0] <= now:
+                self._recent.popitem(last=False)
+            recent = self._recent.get(barcode)
+            if recent is not None:
+                self.recent_hits += 1
+                return recent[1], DUPLICATE_RECENT
+
+            flight = self._in_flight.get(barcode)
+            leader = flight is None
+            if leader:
+                flight = self._in_flight[barcode] = _Flight()
+            else:
+                self.attached += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result, DUPLICATE_IN_FLIGHT
+
+        try:
+            flight.result = func()
+            return flight.result, None
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[barcode]
+                if flight.error is None and self.window > 0 and self.is_reusable(flight.result):
+                    self._recent[barcode] = (time.time() + self.window, flight.result)
+                    self._recent.move_to_end(barcode)
+            flight.done.set()
+
+    def duplicates(self):
+        with self._lock:
+            return self.attached + self.recent_hits
+
+    def stats(self):
+        with self._lock:
+            return {
+                "scans": self.scans,
+                "attached_in_flight": self.attached,
+                "served_from_recent": self.recent_hits,
+            }
@@ -0,0 +1,195 @@
+import hmac
+import json
+import time
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from metrics import Metrics
+from transport import HttpTransport
+
+MAX_BARCODE_LENGTH = 64
+BARCODE_FORBIDDEN = set("/\\<>&")
+
+
+def is_valid_barcode(barcode):
+    """
+    Barcodes go into NCIP XML and REST paths: only short, printable ones without path or
+    markup characters are accepted from the network.
+    """
+    return (0 < len(barcode) <= MAX_BARCODE_LENGTH and barcode.isprintable()
+            and not BARCODE_FORBIDDEN.intersection(barcode) and ".." not in barcode)
+
+
+class CheckInServiceHandler(BaseHTTPRequestHandler):
+    """
+    POST /scan {"barcode": "..."} runs one scan and returns its outcome as JSON.
+    GET /health returns the number of journal actions waiting to be sent.
+    GET /metrics returns the metrics as JSON, or Prometheus text with ?format=prometheus.
+    """
+    protocol_version = "HTTP/1.1"  # keep-alive between stations and the service
+    server_version = "CheckInService/1.0"
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        logging.debug(f"Service request from {self.client_address[0]}: {format % args}")
+
+    def send_json(self, status, data):
+        self.send_body(status, json.dumps(data).encode("utf-8"), "application/json")
+
+    def send_body(self, status, body, content_type):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def authorized(self):
+        api_key = self.server.api_key
+        if not api_key or hmac.compare_digest(self.headers.get("X-Api-Key", ""), api_key):
+            return True
+        self.send_json(401, {"error": "Invalid or missing X-Api-Key header"})
+        return False
+
+    def do_GET(self):
+        if not self.authorized():
+            return
+        pipeline = self.server.pipeline
+        if self.path == "/health":
+            return self.send_json(200, {"status": "ok", "journal_queued": pipeline.journal.queued_count()})
+        if self.path.startswith("/metrics"):
+            if "format=prometheus" in self.path:
+                return self.send_body(200, pipeline.metrics.to_prometheus().encode("utf-8"), "text/plain; version=0.0.4")
+            return self.send_json(200, pipeline.metrics.snapshot())
+        self.send_json(404, {"error": "Not found"})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        if not self.authorized():
+            return
+        if self.path != "/scan":
+            return self.send_json(404, {"error": "Not found"})
+        try:
+            payload = json.loads(body)
+        except ValueError:
+            payload = None
+        barcode = payload.get("barcode") if isinstance(payload, dict) else None
+        barcode = barcode.strip() if isinstance(barcode, str) else ""
+        if not barcode:
+            return self.send_json(400, {"error": 'Expected a JSON body like {"barcode": "..."}'})
+        if not is_valid_barcode(barcode):
+            return self.send_json(400, {"error": f"Invalid barcode (at most {MAX_BARCODE_LENGTH} printable "
+                                                 f"characters, without / \\ < > & or ..)"})
+
+        station = self.headers.get("X-Station", self.client_address[0])
+        logging.info(f"Scan of {barcode} from station {station}")
+        with self.server.scan_slots:
+            outcome = self.server.pipeline.process(barcode, station=station)
+        self.send_json(200, outcome)
+
+
+class CheckInService(ThreadingHTTPServer):
+    """
+    Local HTTP service that runs every station's scans through one CheckInPipeline, so the
+    whole desk shares one token, one set of connections, one cache and one journal.
+    At most `max_concurrent_scans` scans run at once; further requests wait.
+    """
+    daemon_threads = True
+    request_queue_size = 64
+
+    def __init__(self, pipeline, host="127.0.0.1", port=8765, api_key=None, max_concurrent_scans=16):
+        super().__init__((host, port), CheckInServiceHandler)
+        self.pipeline = pipeline
+        self.api_key = api_key
+        self.scan_slots = threading.BoundedSemaphore(max(1, max_concurrent_scans))
+
+
+class ServiceClient:
+    """
+    Stand-in for CheckInPipeline in a station that sends its scans to a CheckInService.
+
+    `process()` returns the same outcome dict as CheckInPipeline.process(). The local
+    `metrics` time the round trips; `start_replay()` polls the service's journal so the
+    station still shows how many actions are waiting to be sent.
+    """
+
+    def __init__(self, url, api_key=None, station=None, timeout=60, pool_size=4, poll_interval=15):
+        self.url = url.rstrip("/")
+        self.metrics = Metrics(station)
+        self.headers = {"X-Station": self.metrics.station}
+        if api_key:
+            self.headers["X-Api-Key"] = api_key
+        self.transport = HttpTransport(timeout=timeout, pool_maxsize=pool_size + 1)  # + the journal poller
+        self.poll_interval = poll_interval
+        self._stop_event = threading.Event()
+        self._poller = None
+
+    def process(self, barcode, on_preview=None, station=None):
+        started = time.perf_counter()
+        outcome = {
+            "barcode": barcode, "oclc_number": None, "status": None, "action": "None", "is_error": False,
+            "alert": None, "error": None, "duplicate": None,
+            }
+        try:
+            with self.metrics.time("service_scan"):
+                response = self.transport.post(f"{self.url}/scan", json={"barcode": barcode}, headers=self.headers)
+                response.raise_for_status()
+            outcome.update(response.json())
+            if outcome["alert"]:
+                outcome["alert"] = tuple(outcome["alert"])
+        except (requests.RequestException, ValueError) as e:
+            # A re-scan is safe: the service answers repeats from the first scan's result
+            logging.error(f"Check-in service request for {barcode} failed: {e}")
+            outcome["error"] = str(e)
+            outcome["alert"] = (
+                "critical", "Error",
+                f"Could not reach the check-in service at {self.url} for {barcode}.\n\nDetails:\n{e}"
+                )
+            outcome.update(status={
+                "status": "Error", "title": "Unknown", "author": "Unknown", "callNumber": "Unknown"
+                }, is_error=True)
+        self.metrics.scan_finished(time.perf_counter() - started, outcome["is_error"])
+        return outcome
+
+    def health(self):
+        response = self.transport.get(f"{self.url}/health", headers=self.headers, timeout=5)
+        response.raise_for_status()
+        return response.json()
+
+    def prewarm(self):
+        try:
+            self.health()
+        except requests.RequestException as e:
+            logging.warning(f"Check-in service at {self.url} is not reachable: {e}")
+
+    def start_replay(self, on_progress=None, on_failure=None):
+        """
+        The service replays the journal (and logs what it gives up on); the station only
+        shows how much is waiting.
+        """
+        if on_progress is None:
+            return
+
+        def poll():
+            while not self._stop_event.is_set():
+                try:
+                    on_progress(self.health()["journal_queued"])
+                except (requests.RequestException, ValueError, KeyError) as e:
+                    logging.debug(f"Could not poll the check-in service: {e}")
+                self._stop_event.wait(self.poll_interval)
+
+        self._poller = threading.Thread(target=poll, name="service-poll", daemon=True)
+        self._poller.start()
+
+    def start_metrics_export(self):
+        pass  # The service exports the shared metrics
+
+    def close(self):
+        self._stop_event.set()
+        if self._poller is not None:
+            self._poller.join()
+        logging.info(f"Station scan metrics: {json.dumps(self.metrics.snapshot())}")
+        self.transport.close()
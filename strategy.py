@@ -0,0 +1,61 @@
+import threading
+from collections import deque
+
+# Check-in strategies
+STANDARD = "standard"  # check availability, then check in or record in-library use
+OPTIMISTIC = "optimistic"  # send CheckInItem first; check availability only if it was not on loan
+ADAPTIVE = "adaptive"  # optimistic while most recent scans were on loan, standard otherwise
+
+
+class CheckInStrategy:
+    """
+    Chooses between the standard and the optimistic check-in path.
+
+    Every scan reports whether the item turned out to be on loan. In ADAPTIVE mode the
+    optimistic path is used once at least `min_samples` of the last `window` scans are known
+    and at least `threshold` of them were on loan: the optimistic path saves the availability
+    request for items on loan but costs an extra CheckInItem for items that are not.
+    """
+
+    def __init__(self, mode=STANDARD, window=50, min_samples=10, threshold=0.6):
+        if mode not in (STANDARD, OPTIMISTIC, ADAPTIVE):
+            raise ValueError(f"Unknown check-in strategy: {mode}")
+        self.mode = mode
+        self.min_samples = min_samples
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._recent = deque(maxlen=max(1, window))
+        self.optimistic_scans = 0
+        self.fallbacks = 0
+
+    def use_optimistic(self):
+        if self.mode != ADAPTIVE:
+            return self.mode == OPTIMISTIC
+        with self._lock:
+            if len(self._recent) < self.min_samples:
+                return False
+            return sum(self._recent) / len(self._recent) >= self.threshold
+
+    def observe(self, checked_out, optimistic=False):
+        """
+        Record whether a scanned item was on loan, and whether the optimistic path was taken.
+        """
+        with self._lock:
+            self._recent.append(bool(checked_out))
+            if optimistic:
+                self.optimistic_scans += 1
+                self.fallbacks += int(not checked_out)
+
+    def hit_rate(self):
+        with self._lock:
+            return round(sum(self._recent) / len(self._recent), 3) if self._recent else 0.0
+
+    def stats(self):
+        hit_rate = self.hit_rate()
+        with self._lock:
+            return {
+                "mode": self.mode,
+                "on_loan_rate": hit_rate,
+                "optimistic_scans": self.optimistic_scans,
+                "fallbacks": self.fallbacks,
+            }
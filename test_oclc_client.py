@@ -0,0 +1,318 @@
+"""
+Tests for the OCLC client, the holdings index and the check-in journal against
+mock_oclc.py, so no OCLC credentials are needed.
+
+    python -m pytest test_oclc_client.py
+    python -m unittest test_oclc_client
+"""
+import os
+import time
+import sqlite3
+import tempfile
+import threading
+import unittest
+from contextlib import closing
+
+from holdings_index import HoldingsIndex, build_index
+from journal import ReplayWorker, QUEUED, DONE, SKIPPED, FAILED
+from mock_oclc import MockCatalog, MockOCLCServer, CREDENTIALS
+from oclc_client import OclcClient
+from pipeline import (
+    CheckInPipeline, JOURNAL_FILE, CHECK_IN, NON_LOAN_RETURN, OPTIMISTIC_CHECK_IN, QUEUED_ACTION,
+)
+from resilience import CircuitBreaker, CircuitOpenError
+
+
+class MockServerTestCase(unittest.TestCase):
+    latency_ms = 0
+
+    def setUp(self):
+        self.catalog = MockCatalog(titles=10, copies=2, checked_out_ratio=0.5)
+        self.server = MockOCLCServer(self.catalog, latency_ms=self.latency_ms, seed=1).start()
+        self.addCleanup(self.server.stop)
+        # One attempt per call, so every request the tests make is visible on the server
+        self.config = dict(CREDENTIALS, **self.server.config(), retry_max_attempts=1)
+
+    def client(self, **settings):
+        client = OclcClient(dict(self.config, **settings))
+        self.addCleanup(client.close)
+        return client
+
+    def barcode(self, on_loan):
+        return next(barcode for barcode in self.catalog.barcodes if (barcode in self.catalog.on_loan) == on_loan)
+
+
+class TokenRefreshTest(MockServerTestCase):
+    latency_ms = 100  # keeps the first token request in flight while the others arrive
+
+    def test_concurrent_callers_share_one_token_request(self):
+        client = self.client()
+        barrier = threading.Barrier(8)
+        tokens = []
+
+        def get_token():
+            barrier.wait()
+            tokens.append(client.get_access_token())
+
+        threads = [threading.Thread(target=get_token) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(self.server.requests.get("token"), 1)
+        self.assertEqual(len(set(tokens)), 1)
+        stats = client.token_manager.stats()
+        self.assertEqual(stats["refreshes"], 1)
+        self.assertEqual(stats["misses"], 8)
+
+    def test_rejected_token_is_refreshed_once(self):
+        client = self.client()
+        stale = client.get_access_token()
+        self.server.tokens.discard(stale)
+
+        self.assertEqual(client.lookup_oclc_number(self.catalog.barcodes[0])["numberOfHoldings"], 1)
+        self.assertEqual(self.server.requests.get("token"), 2)
+        self.assertNotEqual(client.get_access_token(), stale)
+
+
+class BarcodeEscapingTest(MockServerTestCase):
+
+    def test_markup_and_path_characters_reach_oclc_as_one_barcode(self):
+        client = self.client()
+        barcode = "a/../<b>&c"
+        self.catalog.on_loan.add(barcode)
+
+        self.assertEqual(client.check_in_item(barcode)["action"], "Checked In")
+        self.assertNotIn(barcode, self.catalog.on_loan)
+        client.non_loan_return(barcode)
+        self.assertEqual(self.catalog.usages, {barcode: 1})
+
+
+class CircuitBreakerTest(MockServerTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.client = self.client(circuit_failure_threshold=2, circuit_reset_timeout=0.2)
+        self.client.get_access_token()
+        self.breaker = self.client.stages["discovery"].breaker
+        self.closed = []
+        self.breaker.on_close = lambda: self.closed.append(True)
+
+    def lookup(self):
+        return self.client.lookup_oclc_number(self.catalog.barcodes[0])
+
+    def open_circuit(self):
+        self.server.error_rate = 1.0
+        for _ in range(2):
+            self.assertIn("error", self.lookup())
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        sent = self.server.requests.get("discovery")
+        # While open, calls fail fast without reaching the server
+        with self.assertRaises(CircuitOpenError):
+            self.lookup()
+        self.assertEqual(self.server.requests.get("discovery"), sent)
+        self.assertEqual(self.breaker.rejected, 1)
+        return sent
+
+    def test_successful_trial_closes_the_circuit(self):
+        sent = self.open_circuit()
+        self.server.error_rate = 0.0
+        time.sleep(0.25)
+
+        self.assertEqual(self.lookup()["numberOfHoldings"], 1)
+        self.assertEqual(self.server.requests.get("discovery"), sent + 1)
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+        self.assertEqual(self.closed, [True])
+
+    def test_failed_trial_opens_the_circuit_again(self):
+        sent = self.open_circuit()
+        time.sleep(0.25)
+
+        # Exactly one trial request is let through; its failure reopens the circuit at once
+        self.assertIn("error", self.lookup())
+        self.assertEqual(self.server.requests.get("discovery"), sent + 1)
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        self.assertEqual(self.breaker.times_opened, 2)
+        with self.assertRaises(CircuitOpenError):
+            self.lookup()
+        self.assertEqual(self.closed, [])
+
+    def test_open_circuit_error_is_raised_before_any_request(self):
+        self.open_circuit()
+        with self.assertRaises(CircuitOpenError):
+            self.client.stages["discovery"].call(lambda: self.fail("called while the circuit is open"))
+
+
+class HoldingsIndexTest(unittest.TestCase):
+
+    def test_reimport_writes_a_new_version_for_open_indexes_to_switch_to(self):
+        work_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(work_dir.cleanup)
+        path = f"{work_dir.name}/holdings.idx"
+        build_index(path, [("39001", "100", "QA 1")])
+        index = HoldingsIndex(path, check_interval=0)
+        self.addCleanup(index.close)
+        first = index.file
+
+        # The open (memory-mapped) file is never written to, which Windows would refuse
+        build_index(path, [("39002", "200", "QA 2")])
+        self.assertEqual(index.lookup("39002"), ("200", "QA 2"))
+        self.assertIsNone(index.lookup("39001"))
+        self.assertNotEqual(index.file, first)
+        # The old version is removed once nothing has it open
+        self.assertEqual(sorted(os.listdir(work_dir.name)), [os.path.basename(index.file), "holdings.idx.current"])
+
+
+class PipelineTestCase(MockServerTestCase):
+    strategy = "standard"
+
+    def setUp(self):
+        super().setUp()
+        work_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(work_dir.cleanup)
+        self.journal_db = f"{work_dir.name}/{JOURNAL_FILE}"
+        self.pipeline = CheckInPipeline(dict(self.config, checkin_strategy=self.strategy), work_dir.name, pool_size=2)
+        self.addCleanup(self.pipeline.close)
+        self.journal = self.pipeline.journal
+
+    def open_circuit(self, name):
+        breaker = self.pipeline.stages[name].breaker
+        for _ in range(breaker.failure_threshold):
+            breaker.record_failure()
+        return breaker
+
+
+class OptimisticCheckInTest(PipelineTestCase):
+    strategy = "optimistic"
+
+    def test_item_in_transit_is_flagged(self):
+        barcode = self.barcode(True)
+        self.catalog.in_transit.add(barcode)
+
+        outcome = self.pipeline.process(barcode)
+        self.assertEqual(outcome["action"], "Checked In")
+        self.assertTrue(outcome["is_error"])
+        self.assertEqual(outcome["status"]["reasonUnavailable"], "TRANSIT")
+        # Checked in, but the item was not on loan
+        self.assertEqual(self.pipeline.strategy.hit_rate(), 0.0)
+
+    def test_row_shows_the_indexed_call_number_of_the_copy(self):
+        barcode = self.barcode(True)
+        oclc_number = self.catalog.oclc_number(barcode)
+        build_index(self.pipeline.holdings.path, [(barcode, oclc_number, "REF 123 .B2")])
+        self.pipeline.bib_cache.put(oclc_number, {"title": "T", "author": "A", "callNumber": "QA 1 .A1"})
+
+        outcome = self.pipeline.process(barcode)
+        self.assertEqual(outcome["action"], "Checked In")
+        self.assertEqual(outcome["status"]["callNumber"], "REF 123 .B2")
+        self.assertEqual(self.server.requests.get("discovery"), None)
+
+    def test_queued_check_in_is_not_counted_as_on_loan(self):
+        self.open_circuit("ncip")
+
+        outcome = self.pipeline.process(self.barcode(True))
+        self.assertEqual(outcome["action"], QUEUED_ACTION)
+        self.assertEqual(self.pipeline.strategy.stats()["optimistic_scans"], 0)
+
+
+class JournalReplayTest(PipelineTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.failures = []
+        self.worker = self.journal_worker()
+
+    def journal_worker(self):
+        return ReplayWorker(
+            self.journal, self.pipeline.replay_action, self.pipeline.is_transient_error,
+            interval=0.05, on_failure=lambda entry, error: self.failures.append(entry["barcode"]),
+            )
+
+    def queue(self, barcode, action):
+        return self.journal.record(barcode, self.catalog.oclc_number(barcode), action, state=QUEUED)
+
+    def states(self):
+        with closing(sqlite3.connect(self.journal_db)) as conn:
+            return dict(conn.execute("SELECT id, state FROM actions"))
+
+    def test_replay_applies_each_action_once(self):
+        on_loan, available = self.barcode(True), self.barcode(False)
+        check_in = self.queue(on_loan, CHECK_IN)
+        use = self.queue(available, NON_LOAN_RETURN)
+
+        self.assertTrue(self.worker.drain())
+        self.assertEqual(self.states(), {check_in: DONE, use: DONE})
+        self.assertNotIn(on_loan, self.catalog.on_loan)
+        self.assertEqual(self.catalog.usages, {available: 1})
+        self.assertEqual(self.journal.queued_count(), 0)
+
+        # A check-in that already reached OCLC is skipped instead of sent twice
+        again = self.queue(on_loan, CHECK_IN)
+        self.worker.drain()
+        self.assertEqual(self.states()[again], SKIPPED)
+        self.assertEqual(self.server.requests.get("ncip"), 1)
+
+    def test_entries_stay_queued_while_oclc_fails(self):
+        on_loan = self.barcode(True)
+        self.pipeline.client.get_access_token()
+        entry = self.queue(on_loan, CHECK_IN)
+
+        self.server.error_rate = 1.0
+        self.worker.drain()
+        self.assertEqual(self.states()[entry], QUEUED)
+        self.assertEqual(self.journal.queued()[0]["attempts"], 1)
+        self.assertIn(on_loan, self.catalog.on_loan)
+
+        self.server.error_rate = 0.0
+        time.sleep(0.15)  # past the back-off of the first failed attempt
+        self.worker.drain()
+        self.assertEqual(self.states()[entry], DONE)
+        self.assertNotIn(on_loan, self.catalog.on_loan)
+        self.assertEqual(self.failures, [])
+
+    def test_purge_removes_old_finished_entries_only(self):
+        old_done = self.queue(self.barcode(True), CHECK_IN)
+        self.journal.complete(old_done)
+        old_queued = self.queue(self.barcode(False), NON_LOAN_RETURN)
+        with closing(sqlite3.connect(self.journal_db)) as conn, conn:
+            conn.execute("UPDATE actions SET updated_at = updated_at - 91 * 86400")
+        recent = self.queue(self.barcode(True), CHECK_IN)
+        self.journal.complete(recent, FAILED)
+
+        self.assertEqual(self.journal.purge(), 1)
+        self.assertEqual(self.states(), {old_queued: QUEUED, recent: FAILED})
+
+    def test_optimistic_check_in_that_never_left_is_replayed_as_a_use(self):
+        available = self.barcode(False)
+        breaker = self.open_circuit("ncip")
+
+        _, action = self.pipeline.perform_action(
+            available, self.catalog.oclc_number(available), OPTIMISTIC_CHECK_IN
+            )
+        self.assertEqual(action, "Queued for retry")
+        self.assertEqual(self.journal.queued()[0]["maybe_sent"], 0)
+
+        breaker.record_success()
+        self.worker.drain()
+        self.assertEqual(list(self.states().values()), [DONE])
+        self.assertEqual(self.catalog.usages, {available: 1})
+        self.assertEqual(self.failures, [])
+
+    def test_optimistic_check_in_that_may_have_arrived_is_reported(self):
+        available = self.barcode(False)
+        self.pipeline.client.get_access_token()
+
+        self.server.error_rate = 1.0  # HTTP 500: OCLC may have applied the CheckInItem
+        self.pipeline.perform_action(available, self.catalog.oclc_number(available), OPTIMISTIC_CHECK_IN)
+        self.assertEqual(self.journal.queued()[0]["maybe_sent"], 1)
+
+        self.server.error_rate = 0.0
+        self.worker.drain()
+        self.assertEqual(list(self.states().values()), [FAILED])
+        self.assertEqual(self.catalog.usages, {})
+        self.assertEqual(self.failures, [available])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,145 @@
+import time
+import logging
+import threading
+from requests.auth import HTTPBasicAuth
+
+
+class TokenManager:
+    """
+    Thread-safe OAuth client-credentials token cache shared by every OCLC call.
+
+    - Concurrent callers that find no usable token share a single in-flight refresh.
+    - The token is refreshed in the background once it is within `refresh_ahead` seconds
+      of `expires_at`, so scans keep using the current token meanwhile.
+    - The token is only dropped through `invalidate()`, which callers use on HTTP 401.
+    - If a resilience `Stage` is given, token requests go through its retry policy and
+      circuit breaker.
+    """
+
+    def __init__(self, transport, token_url, wskey, secret, scope, refresh_ahead=300, stage=None):
+        self.transport = transport
+        self.stage = stage
+        self.token_url = token_url
+        self.auth = HTTPBasicAuth(wskey, secret)
+        self.scope = scope
+        self.refresh_ahead = refresh_ahead
+
+        self._cond = threading.Condition()
+        self._token = None
+        self._expires_at = 0
+        self._refreshing = False
+        self._last_error = None
+
+        self.hits = 0
+        self.misses = 0
+        self.shared_waits = 0
+        self.refreshes = 0
+        self.background_refreshes = 0
+        self.failures = 0
+        self.invalidations = 0
+
+    def _is_fresh(self):
+        return self._token is not None and self._expires_at > time.time()
+
+    def get_token(self):
+        """
+        Return a valid access token, fetching one only if no usable token is cached.
+        """
+        with self._cond:
+            if self._is_fresh():
+                self.hits += 1
+                if not self._refreshing and self._expires_at - time.time() < self.refresh_ahead:
+                    self._refreshing = True
+                    self.background_refreshes += 1
+                    threading.Thread(
+                        target=self._background_refresh, name="token-refresh", daemon=True
+                        ).start()
+                return self._token
+
+            self.misses += 1
+            if self._refreshing:
+                # Another thread is already fetching a token: wait for its result
+                self.shared_waits += 1
+                while self._refreshing:
+                    self._cond.wait()
+                if self._is_fresh():
+                    return self._token
+                if self._last_error is not None:
+                    raise self._last_error
+            self._refreshing = True
+
+        return self._refresh()
+
+    def _background_refresh(self):
+        try:
+            self._refresh()
+        except Exception as e:
+            # The current token is still valid; the next caller past expiry retries in the foreground
+            logging.warning(f"Background token refresh failed: {e}")
+
+    def _request_token(self):
+        data = {"grant_type": "client_credentials", "scope": self.scope}
+        logging.debug(f"Requesting access token: {self.token_url}")
+        response = self.transport.post(
+            self.token_url, auth=self.auth, data=data,
+            headers={"Content-Type": "application/x-www-form-urlencoded"}
+            )
+        logging.debug(f"Token response status code: {response.status_code}")
+        response.raise_for_status()
+        return response.json()
+
+    def _refresh(self):
+        """
+        Fetch a new token. Must only be called by the thread that set `_refreshing`.
+        """
+        try:
+            if self.stage is not None:
+                token_data = self.stage.call(self._request_token)
+            else:
+                token_data = self._request_token()
+        except Exception as e:
+            with self._cond:
+                self.failures += 1
+                self._last_error = e
+                self._refreshing = False
+                self._cond.notify_all()
+            logging.error(f"Error during OAuth token request: {e}")
+            raise
+
+        with self._cond:
+            self.refreshes += 1
+            self._token = token_data["access_token"]
+            # Keep a 60 second safety margin before the server-side expiry
+            self._expires_at = time.time() + token_data.get("expires_in", 3600) - 60
+            self._last_error = None
+            self._refreshing = False
+            self._cond.notify_all()
+            logging.debug(f"Fetched access token, expires in {token_data.get('expires_in', 3600)}s")
+            return self._token
+
+    def invalidate(self, token=None):
+        """
+        Drop the cached token after the server rejected it with HTTP 401.
+
+        If `token` is given, the cache is only cleared if it still holds that token, so a
+        late 401 does not throw away a token that has already been refreshed.
+        """
+        with self._cond:
+            if token is None or token == self._token:
+                self.invalidations += 1
+                self._token = None
+                self._expires_at = 0
+
+    def stats(self):
+        with self._cond:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "shared_waits": self.shared_waits,
+                "refreshes": self.refreshes,
+                "background_refreshes": self.background_refreshes,
+                "failures": self.failures,
+                "invalidations": self.invalidations,
+            }
@@ -0,0 +1,78 @@
+import ssl
+import logging
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class TLSAdapter(HTTPAdapter):
+    """
+    HTTPAdapter that reuses one pre-built TLS context for every pooled connection.
+    """
+
+    def __init__(self, ssl_context, **kwargs):
+        self.ssl_context = ssl_context
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs["ssl_context"] = self.ssl_context
+        return super().init_poolmanager(*args, **kwargs)
+
+
+class HttpTransport:
+    """
+    Shared HTTP transport for every OCLC endpoint.
+
+    A single requests.Session keeps a keep-alive connection pool per host (OAuth, Discovery,
+    availability, NCIP and usages), so repeated scans reuse open TCP/TLS connections instead
+    of paying a new handshake on every call.
+    """
+
+    def __init__(self, timeout=10, pool_connections=8, pool_maxsize=4):
+        self.timeout = timeout
+
+        # Build the TLS context once; it trusts both the system store and the certifi bundle
+        self.ssl_context = ssl.create_default_context()
+        self.ssl_context.check_hostname = True
+        self.ssl_context.verify_mode = ssl.CERT_REQUIRED
+        self.ssl_context.load_verify_locations(requests.certs.where())
+
+        self.session = requests.Session()
+        # Responses are decompressed chunk by chunk by urllib3 as they are read
+        self.session.headers.update({"Connection": "keep-alive", "Accept-Encoding": "gzip, deflate"})
+        self.session.mount("https://", TLSAdapter(
+            self.ssl_context, pool_connections=pool_connections, pool_maxsize=pool_maxsize
+            ))
+        self.session.mount("http://", HTTPAdapter(
+            pool_connections=pool_connections, pool_maxsize=pool_maxsize
+            ))
+        logging.debug(
+            f"HTTP transport initialized (timeout={timeout}s, pool_maxsize={pool_maxsize})"
+            )
+
+    def request(self, method, url, **kwargs):
+        """
+        Send a request over the shared session, applying the default timeout.
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        return self.session.request(method, url, **kwargs)
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def close(self):
+        self.session.close()
+
+
+def transfer_sizes(response):
+    """
+    (bytes received on the wire, bytes after decompression) for a fully read response.
+    """
+    decoded = len(response.content)
+    try:
+        wire = response.raw.tell()
+    except (AttributeError, OSError):
+        wire = decoded
+    return wire or decoded, decoded